@@ -1,9 +1,13 @@
+import os
 import subprocess
 
+# the playbook, ansible.cfg and hosts live next to this file
+HERE = os.path.dirname(os.path.abspath(__file__))
+
 def showrun():
     # read https://www.datacamp.com/tutorial/python-subprocess to learn more about subprocess
-    command = ['ansible-playbook', 'interface_playbook.yaml']
-    result = subprocess.run(command, capture_output=True, text=True)
+    command = ['ansible-playbook', os.path.join(HERE, 'interface_playbook.yaml')]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=HERE)
     result = result.stdout
     if 'ok=2' in result:
         return 'ok'
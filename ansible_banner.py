@@ -1,27 +1,133 @@
+import contextvars
+import json
+import os
+import re
 import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-def set_motd(host_ip, message):
+import netmiko_final
+import tracing
+from state_cache import cache
+
+# "ssh" applies the banner in-process over the pooled netmiko session,
+# "ansible" runs banner_playbook.yaml with ansible-playbook (the old path)
+MOTD_BACKEND = os.environ.get("MOTD_BACKEND", "ssh")
+
+# IOS banner delimiters; the first one that does not appear in the message is used
+BANNER_DELIMITERS = "^#%&@~|"
+
+# "10.0.15.61   : ok=1  changed=1  unreachable=0  failed=0 ..." lines of the PLAY RECAP
+RECAP_LINE = re.compile(r"^(\S+)\s+:\s+((?:\w+=\d+\s*)+)$")
+
+OK = "Ok: success"
+FAILED = "Error: Failed to set MOTD"
+
+def set_motd(host_ip, message, backend=None):
+    backend = backend or MOTD_BACKEND
+    if backend == "ansible":
+        result = set_motd_ansible(host_ip, message)
+    else:
+        result = set_motd_ssh(host_ip, message)
+    remember_motd(host_ip, message, result)
+    return result
+
+def remember_motd(host_ip, message, result):
+    # write-through so the next "motd" read is answered from the state cache
+    if result == OK:
+        cache.put((host_ip, "motd"), message)
+    else:
+        cache.invalidate(host_ip, "motd")
+
+def set_motd_ssh(host_ip, message):
+    delimiter = next((c for c in BANNER_DELIMITERS if c not in message), None)
+    if delimiter is None:
+        return FAILED
+
+    try:
+        with netmiko_final.session(host_ip) as connection:
+            output = netmiko_final.send_config_set(connection, [f"banner motd {delimiter}{message}{delimiter}"])
+        if "% Invalid" in output or "% Incomplete" in output:
+            return FAILED
+        return OK
+    except:
+        return FAILED
+
+def set_motd_ansible(host_ip, message):
+    return run_playbook({host_ip: message})[host_ip]
+
+def set_motd_batch(messages, backend=None):
+    """Set a MOTD on many routers at once; messages maps host -> text.
+
+    Returns host -> "Ok: success" or an error string.
+    """
+    backend = backend or MOTD_BACKEND
+    if backend == "ansible":
+        results = run_playbook(messages)
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, len(messages))) as pool:
+            # run each push in a copy of our context so it uses the same room credentials
+            futures = {host: pool.submit(contextvars.copy_context().run, set_motd_ssh, host, messages[host])
+                       for host in messages}
+            results = {host: future.result() for host, future in futures.items()}
+    for host, result in results.items():
+        remember_motd(host, messages[host], result)
+    return results
+
+def run_playbook(messages):
     playbook_path = 'banner_playbook.yaml'
     inventory_path = 'hosts'
     ansible_executable = shutil.which('ansible-playbook')
     
     if not ansible_executable:
-        return "Error: playbook not found."
+        return {host: "Error: playbook not found." for host in messages}
+
+    # per-host messages go in a vars file, so quotes in a message cannot break the command line
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as vars_file:
+        json.dump({"motd_messages": messages}, vars_file)
 
     command_args = [
         ansible_executable,
         "-i", inventory_path,
         playbook_path,
-        "--limit", host_ip,
-        "-e", f"motd_message='{message}'"
+        "--limit", ",".join(messages),
+        "--forks", str(len(messages)),
+        "-e", "@" + vars_file.name,
     ]
 
     try:
-        process = subprocess.run(command_args, capture_output=True, text=True, check=True, timeout=30)
-        if 'failed=0' in process.stdout:
-            return "Ok: success"
-        else:
-            return "Error: Failed to set MOTD"
+        # a failed host makes ansible-playbook exit non-zero, the recap still tells which one
+        with tracing.span("ansible.playbook", playbook=playbook_path, hosts=len(messages)) as run:
+            process = subprocess.run(command_args, capture_output=True, text=True, timeout=30 + 10 * len(messages))
+            run.set(returncode=process.returncode)
+        recap = parse_recap(process.stdout)
     except:
-        return "Error: Failed to set MOTD"
\ No newline at end of file
+        recap = {}
+    finally:
+        os.remove(vars_file.name)
+
+    results = {}
+    for host in messages:
+        counts = recap.get(host)
+        if counts and counts.get("failed", 1) == 0 and counts.get("unreachable", 1) == 0:
+            results[host] = OK
+        else:
+            results[host] = FAILED
+    return results
+
+def parse_recap(stdout):
+    """Return host -> {"ok": 1, "failed": 0, ...} from the PLAY RECAP of ansible-playbook."""
+    recap = {}
+    in_recap = False
+    for line in stdout.splitlines():
+        if line.startswith("PLAY RECAP"):
+            in_recap = True
+            continue
+        if not in_recap:
+            continue
+        match = RECAP_LINE.match(line.strip())
+        if match:
+            counts = dict(item.split("=") for item in match.group(2).split())
+            recap[match.group(1)] = {k: int(v) for k, v in counts.items()}
+    return recap
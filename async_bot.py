@@ -0,0 +1,231 @@
+# --------------------------------------------------------------
+# asyncio runtime for ipa2025_final (BOT_MODE=async)
+# --------------------------------------------------------------
+#
+# Webex calls and RESTCONF commands run on httpx async clients; NETCONF,
+# SSH and Ansible jobs (ncclient/netmiko are blocking) run on a bounded
+# thread pool. Commands for one router still run one at a time, and every
+# message is handled in its own task so a slow router never blocks polling.
+# Every room of ipa2025_final.ROOMS is polled by its own task, so rooms do
+# not wait on each other. The command parsing and replies are the ones of
+# ipa2025_final.
+
+import asyncio
+import contextlib
+import contextvars
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+
+import restconf_async
+import rooms
+import tracing
+import webex_client
+from job_journal import journal
+from message_cursor import MessageCursor
+
+# threads for blocking device libraries, and how many device jobs may be in flight
+DEVICE_WORKERS = int(os.environ.get("DEVICE_WORKERS", "16"))
+
+
+class AsyncWebex:
+    def __init__(self, access_token, room_id, messages_url, page_size=50, max_pages=10):
+        self.room_id = room_id
+        self.messages_url = messages_url
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.client = httpx.AsyncClient(
+            headers={"Authorization": "Bearer " + access_token},
+            timeout=httpx.Timeout(10, connect=5),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+        # same rate limit and counters as the threaded client of this token
+        self.sync = webex_client.client(access_token)
+
+    async def request(self, method, url, **kwargs):
+        """webex_client.WebexClient.request() on httpx: rate limited, 429 and 5xx retried."""
+        for attempt in range(self.sync.max_retries + 1):
+            wait = self.sync.bucket.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            self.sync.count("rate_wait", wait)
+            self.sync.count("calls")
+            try:
+                r = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                status, headers, error = None, {}, e
+            else:
+                if r.status_code < 400:
+                    return r
+                status, headers, error = r.status_code, r.headers, None
+            delay = self.sync.retry_wait(method, status, headers, error, attempt)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        raise self.sync.give_up(status, error)
+
+    async def new_messages(self, cursor):
+        """Same paging as ipa2025_final.get_new_messages(), oldest first."""
+        url = self.messages_url
+        params = {"roomId": self.room_id, "max": self.page_size}
+        new_messages = []
+        for _ in range(self.max_pages):
+            r = await self.request("GET", url, params=params)
+            messages = r.json()["items"]
+            for item in messages:
+                if not cursor.is_new(item):
+                    return list(reversed(new_messages))
+                new_messages.append(item)
+            next_page = r.links.get("next")
+            if not messages or not next_page:
+                break
+            url, params = next_page["url"], None
+        return list(reversed(new_messages))
+
+    async def newest_message(self):
+        r = await self.request("GET", self.messages_url, params={"roomId": self.room_id, "max": 1})
+        items = r.json()["items"]
+        return items[0] if items else None
+
+    async def post(self, text):
+        await self.request("POST", self.messages_url, json={"roomId": self.room_id, "text": text})
+        self.sync.count("posted")
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class AsyncRuntime:
+    def __init__(self, bot):
+        self.bot = bot
+        self.webex = {
+            room: AsyncWebex(room.access_token or bot.ACCESS_TOKEN, room.room_id, bot.MESSAGES_URL,
+                             bot.MESSAGES_PAGE_SIZE, bot.MESSAGES_MAX_PAGES)
+            for room in bot.ROOMS
+        }
+        self.threads = ThreadPoolExecutor(max_workers=DEVICE_WORKERS, thread_name_prefix="device")
+        self.in_flight = asyncio.Semaphore(DEVICE_WORKERS)
+        self.router_locks = defaultdict(asyncio.Lock)
+        self.tasks = set()
+
+    async def run_job(self, ip, job, job_id=None):
+        async with contextlib.AsyncExitStack() as held:
+            # a batch (tuple of routers) holds each of them, always in the same order
+            for router in sorted(ip) if isinstance(ip, tuple) else [ip]:
+                await held.enter_async_context(self.router_locks[router])
+            await held.enter_async_context(self.in_flight)
+            # journaled like the threaded executor's jobs (run_journaled)
+            if job_id is not None:
+                journal.started(job_id)
+            result = await self.execute(ip, job)
+            if job_id is not None:
+                journal.done(job_id, result[0] if isinstance(result, tuple) else result)
+            return result
+
+    async def execute(self, ip, job):
+        # RESTCONF loopback commands have a native async path
+        if getattr(job, "func", None) is self.bot.run_device_command:
+            router, command, method, fresh = job.args
+            if method == self.bot.Method.RESTCONF:
+                with tracing.span(tracing.COMMAND_SPAN, router=router, command=command, backend="restconf"):
+                    return await restconf_async.execute(command, router, fresh)
+        # run_in_executor does not carry contextvars over, copy them for the thread
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.threads, context.run, job)
+
+    async def run_fanout(self, ips, job_for, command, job_ids):
+        started = time.monotonic()
+
+        async def one(ip):
+            router_started = time.monotonic()
+            result = await self.run_job(ip, job_for(ip), job_ids[ip])
+            return ip, result, time.monotonic() - router_started
+
+        results = await asyncio.gather(*(one(ip) for ip in ips))
+        return self.bot.format_fanout(command, results, time.monotonic() - started)
+
+    async def handle(self, room, message, ip, job, job_ids):
+        try:
+            if ip is None:
+                text = job()
+            elif isinstance(ip, list):
+                text = await self.run_fanout(ip, job, self.bot.command_label(message), job_ids)
+            else:
+                text = await self.run_job(ip, job, job_ids[ip])
+            if isinstance(text, tuple):
+                # showrun: the upload streams a file, done by the threaded client
+                text, (path, filename) = text
+                await asyncio.get_running_loop().run_in_executor(
+                    self.threads, partial(self.webex[room].sync.post_file, room.room_id, text, path, filename))
+            else:
+                await self.webex[room].post(text)
+            for job_id in job_ids.values():
+                journal.replied(job_id)
+        except Exception as e:
+            print(f"Error handling '{message}': {e}")
+
+    def spawn(self, room, item):
+        # parse in arrival order (method selection is stateful), run the device work in a task
+        message = item["text"]
+        print(f"Received message in {room.name}: " + message)
+        if journal.replayed(item.get("id")):
+            print(f"Skipping {item.get('id')}, already journaled")
+            return
+        with rooms.use(room), tracing.span("bot.message", room=room.name, message_id=item.get("id")):
+            parsed = self.bot.parse_message(message)
+            if parsed is None:
+                return
+            ip, job = parsed
+            # journaled now, with the method selected when the message came in
+            if isinstance(ip, list):
+                job_ids = {router: self.bot.journal_received(item, router) for router in ip}
+            elif isinstance(ip, tuple):
+                job_ids = {ip: self.bot.journal_received(item, list(ip))}
+            else:
+                job_ids = {ip: self.bot.journal_received(item, ip)} if ip is not None else {}
+            # the task copies the current context, so it runs as this room
+            task = asyncio.create_task(self.handle(room, message, ip, job, job_ids))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def poll_room(self, room):
+        webex = self.webex[room]
+        cursor = MessageCursor(room.state_file)
+        if not cursor.started:
+            cursor.start(await webex.newest_message())
+        interval = self.bot.POLL_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                items = await webex.new_messages(cursor)
+            except Exception as e:
+                print(f"Error polling {room.name}: {e}")
+                items = []
+            for item in items:
+                self.spawn(room, item)
+                cursor.advance(item)
+            # idle rooms back off like in the threaded polling loop
+            interval = self.bot.POLL_INTERVAL if items else min(interval * 2, self.bot.POLL_MAX_INTERVAL)
+
+    async def poll(self):
+        await asyncio.gather(*(self.poll_room(room) for room in self.webex))
+
+    async def close(self):
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for webex in self.webex.values():
+            await webex.close()
+        await restconf_async.close_clients()
+        self.threads.shutdown(wait=False)
+
+
+async def main(bot):
+    """bot is the ipa2025_final module (its parsing, Method enum and settings)."""
+    runtime = AsyncRuntime(bot)
+    try:
+        await runtime.poll()
+    finally:
+        await runtime.close()
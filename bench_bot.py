@@ -0,0 +1,299 @@
+# --------------------------------------------------------------
+# Benchmark the bot against local stand-in routers and Webex
+# --------------------------------------------------------------
+#
+#   python bench_bot.py [--routers 3] [--rounds 5] [--latency-ms 5] [--webex-latency-ms 20]
+#                       [--concurrency 40] [--cache-ttl 0] [--backends restconf,netconf,ssh]
+#                       [--output bench_results.json] [--compare previous.json]
+#
+# Router n is 127.0.0.n with a fake RESTCONF (HTTPS), NETCONF and SSH server
+# sharing one FakeRouter; Webex is fake_webex_server. Every server waits the
+# injected latency before answering. Three measurements per backend:
+#   commands   restconf_final/netconf_final/netmiko_final through drivers,
+#              latency percentiles and device round trips per command
+#   dispatch   one message at a time: user message -> poll -> ipa2025_final
+#              dispatch -> reply received by the fake Webex
+#   throughput --concurrency status messages over all routers at once
+# The results are written as JSON; --compare prints the change against an
+# earlier results file.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import time
+
+from fake_netconf_server import FakeNetconfServer, FakeRouter
+from fake_restconf_server import FakeRestconfServer
+from fake_ssh_server import FakeSshServer
+from fake_webex_server import FakeWebex
+
+ROOM_ID = "bench-room"
+SEQUENCE = ["create", "status", "disable", "status", "enable", "status", "delete", "status"]
+BACKENDS = ["restconf", "netconf", "ssh"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def summarize(samples, round_trips=None):
+    # imported late like the other bot modules, tracing reads TRACE_FILE from the lab environment
+    from tracing import percentile
+    if not samples:
+        return {"n": 0}
+    summary = {
+        "n": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+    if round_trips is not None:
+        summary["round_trips"] = round(sum(round_trips) / len(round_trips), 2)
+    return summary
+
+
+@contextlib.contextmanager
+def quiet():
+    # the bot prints every message and command; printing is not what we measure
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+class Lab:
+    """The stand-in routers and Webex."""
+
+    def __init__(self, routers, latency, webex_latency):
+        self.ips = [f"127.0.0.{n}" for n in range(1, routers + 1)]
+        self.ports = {"restconf": free_port(), "netconf": free_port(), "ssh": free_port()}
+        self.routers = {}
+        self.servers = {"restconf": [], "netconf": [], "ssh": []}
+        for ip in self.ips:
+            router = self.routers[ip] = FakeRouter()
+            self.servers["restconf"].append(
+                FakeRestconfServer(router, ip, self.ports["restconf"], latency).start())
+            self.servers["netconf"].append(
+                FakeNetconfServer(router, ip, self.ports["netconf"], latency, yang_push=False).start())
+            self.servers["ssh"].append(
+                FakeSshServer(router, ip, self.ports["ssh"], latency).start())
+        self.webex = FakeWebex(latency=webex_latency).start()
+
+    def device_calls(self, backend):
+        counters = {"restconf": "request_count", "netconf": "rpc_count", "ssh": "command_count"}
+        return sum(getattr(server, counters[backend]) for server in self.servers[backend])
+
+    def environment(self, cache_ttl, concurrency):
+        workdir = tempfile.mkdtemp(prefix="bench-bot-")
+        return {
+            "RESTCONF_PORT": str(self.ports["restconf"]),
+            "NETCONF_PORT": str(self.ports["netconf"]),
+            "SSH_PORT": str(self.ports["ssh"]),
+            "WEBEX_API_URL": self.webex.url,
+            "WEBX_ACCESS_TOKEN": "bench-token",
+            "ROOM_ID": ROOM_ID,
+            "ROUTER_USER": "admin",
+            "ROUTER_PASS": "cisco",
+            "STATE_CACHE_TTL": str(cache_ttl),
+            "BOT_STATE_FILE": os.path.join(workdir, "bot_state.json"),
+            "ROOMS_FILE": os.path.join(workdir, "rooms.yaml"),
+            "CONFIG_STORE": os.path.join(workdir, "config_store"),
+            "JOURNAL_FILE": os.path.join(workdir, "jobs.jsonl"),
+            "TRACE_FILE": os.path.join(workdir, "traces.jsonl"),
+            # no "busy" rejections, the load test queues everything
+            "EXECUTOR_MAX_QUEUE": str(max(5, concurrency)),
+            # the bench measures the device path, not the Webex rate limit
+            "WEBEX_RATE": "1000",
+            "WEBEX_BURST": "1000",
+        }
+
+
+def bench_commands(lab, backend, rounds):
+    import drivers
+    driver = drivers.get(backend)
+    samples = {command: [] for command in SEQUENCE}
+    round_trips = {command: [] for command in SEQUENCE}
+    connect = []
+    with quiet():
+        for ip in lab.ips:
+            # first call opens the pooled session
+            started = time.perf_counter()
+            driver.execute("status", ip)
+            connect.append(time.perf_counter() - started)
+        for _ in range(rounds):
+            for ip in lab.ips:
+                for command in SEQUENCE:
+                    calls = lab.device_calls(backend)
+                    started = time.perf_counter()
+                    driver.execute(command, ip)
+                    samples[command].append(time.perf_counter() - started)
+                    round_trips[command].append(lab.device_calls(backend) - calls)
+    result = {command: summarize(samples[command], round_trips[command]) for command in SEQUENCE}
+    result["first_call"] = summarize(connect)
+    return result
+
+
+def bench_dispatch(lab, bot, cursor, backend, rounds):
+    """One message at a time, from the user's message to the bot's reply."""
+    prefix = bot.rooms.current().prefix
+    send(lab, bot, cursor, f"{prefix} {backend}")
+    samples = {command: [] for command in SEQUENCE}
+    round_trips = {command: [] for command in SEQUENCE}
+    webex_calls = []
+    with quiet():
+        for _ in range(rounds):
+            for ip in lab.ips:
+                for command in SEQUENCE:
+                    calls = lab.device_calls(backend)
+                    webex_before = lab.webex.request_count
+                    started = time.monotonic()
+                    posted_at = send(lab, bot, cursor, f"{prefix} {ip} {command}")
+                    samples[command].append(posted_at - started)
+                    round_trips[command].append(lab.device_calls(backend) - calls)
+                    webex_calls.append(lab.webex.request_count - webex_before)
+    result = {command: summarize(samples[command], round_trips[command]) for command in SEQUENCE}
+    result["webex_calls_per_message"] = round(sum(webex_calls) / len(webex_calls), 2)
+    return result
+
+
+def send(lab, bot, cursor, text):
+    """User types text, the bot polls once and handles it; returns when the reply was posted."""
+    posts = len(lab.webex.posts)
+    lab.webex.add_message(ROOM_ID, text)
+    with quiet():
+        for item in bot.get_new_messages(cursor):
+            bot.process(item)
+            cursor.advance(item)
+    replies = lab.webex.wait_posts(posts + 1)
+    if len(replies) <= posts:
+        raise RuntimeError(f"no reply to {text!r}")
+    return replies[posts][0]
+
+
+def bench_throughput(lab, bot, cursor, backend, concurrency):
+    """concurrency status messages over every router, all waiting in the room at once."""
+    prefix = bot.rooms.current().prefix
+    send(lab, bot, cursor, f"{prefix} {backend}")
+    posts = len(lab.webex.posts)
+    for i in range(concurrency):
+        lab.webex.add_message(ROOM_ID, f"{prefix} {lab.ips[i % len(lab.ips)]} status")
+    calls = lab.device_calls(backend)
+    webex_before = lab.webex.request_count
+    started = time.monotonic()
+    with quiet():
+        for item in bot.get_new_messages(cursor):
+            bot.process(item)
+            cursor.advance(item)
+        # replies are coalesced when they pile up, count the answers inside them
+        deadline = started + 120
+        while time.monotonic() < deadline:
+            answered = sum(post["text"].count("(checked by") for _, post in lab.webex.posts[posts:])
+            if answered >= concurrency:
+                break
+            time.sleep(0.005)
+    elapsed = time.monotonic() - started
+    return {
+        "messages": concurrency,
+        "answered": answered,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(answered / elapsed, 1),
+        "posts": len(lab.webex.posts) - posts,
+        "device_calls": lab.device_calls(backend) - calls,
+        "webex_calls": lab.webex.request_count - webex_before,
+    }
+
+
+def compare(previous, current):
+    """Print the change of every latency percentile and throughput against previous."""
+    print(f"\nCompared with {previous.get('started', 'previous run')}:")
+
+    def walk(old, new, path):
+        for key, value in new.items():
+            if key not in old:
+                continue
+            if isinstance(value, dict):
+                walk(old[key], value, path + [key])
+            elif key in ("p50_ms", "p95_ms", "p99_ms", "messages_per_second") and old[key]:
+                change = (value - old[key]) / old[key] * 100
+                # lower latency is better, higher throughput is better
+                worse = change > 0 if key.endswith("_ms") else change < 0
+                flag = "  <-- worse" if worse and abs(change) >= 10 else ""
+                print(f"  {'/'.join(path + [key]):48} {old[key]:>10} -> {value:>10} ({change:+.1f}%){flag}")
+
+    walk(previous.get("results", {}), current["results"], [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routers", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=5, help="injected latency of every device call")
+    parser.add_argument("--webex-latency-ms", type=float, default=20, help="injected latency of every Webex call")
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--cache-ttl", type=float, default=0, help="STATE_CACHE_TTL of the bot (0 = no cache)")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+    backends = args.backends.split(",")
+
+    lab = Lab(args.routers, args.latency_ms / 1000, args.webex_latency_ms / 1000)
+    # the bot modules read their settings at import
+    os.environ.update(lab.environment(args.cache_ttl, args.concurrency))
+    import ipa2025_final as bot
+    from message_cursor import MessageCursor
+
+    bot.rooms.DEFAULT.routers = list(lab.ips)
+    cursor = MessageCursor(bot.rooms.DEFAULT.state_file)
+
+    results = {}
+    for backend in backends:
+        print(f"{backend}: commands ...")
+        results.setdefault("commands", {})[backend] = bench_commands(lab, backend, args.rounds)
+        print(f"{backend}: dispatch ...")
+        results.setdefault("dispatch", {})[backend] = bench_dispatch(lab, bot, cursor, backend, args.rounds)
+        print(f"{backend}: throughput ...")
+        results.setdefault("throughput", {})[backend] = bench_throughput(lab, bot, cursor, backend, args.concurrency)
+    bot.executor.shutdown()
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "routers": args.routers, "rounds": args.rounds, "latency_ms": args.latency_ms,
+            "webex_latency_ms": args.webex_latency_ms, "concurrency": args.concurrency,
+            "cache_ttl": args.cache_ttl, "backends": backends,
+        },
+        "results": results,
+    }
+
+    for section in ("commands", "dispatch"):
+        for backend, commands in results.get(section, {}).items():
+            print(f"\n{section} {backend}")
+            for command, summary in commands.items():
+                if isinstance(summary, dict) and summary.get("n"):
+                    print(f"  {command:10} p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms  "
+                          f"p99 {summary['p99_ms']:8.2f} ms  round trips {summary.get('round_trips', '-')}")
+    for backend, summary in results.get("throughput", {}).items():
+        print(f"\nthroughput {backend}: {summary['messages_per_second']} messages/s "
+              f"({summary['answered']}/{summary['messages']} in {summary['seconds']} s, {summary['posts']} posts)")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
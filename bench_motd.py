@@ -0,0 +1,43 @@
+# --------------------------------------------------------------
+# Compare the MOTD backends of ansible_banner.set_motd
+# --------------------------------------------------------------
+#
+#   python bench_motd.py 10.0.15.61 [rounds]
+
+import statistics
+import sys
+import time
+
+import ansible_banner
+import netmiko_final
+
+
+def bench(backend, ip, rounds):
+    timings = []
+    for i in range(rounds):
+        started = time.perf_counter()
+        result = ansible_banner.set_motd(ip, f"bench {backend} {i} 'quoted'", backend=backend)
+        timings.append(time.perf_counter() - started)
+        if result != "Ok: success":
+            print(f"{backend} round {i}: {result}")
+    return timings
+
+
+def report(backend, timings):
+    print(
+        f"{backend:8} rounds={len(timings)} "
+        f"first={timings[0]:.2f}s median={statistics.median(timings):.2f}s "
+        f"min={min(timings):.2f}s max={max(timings):.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python bench_motd.py <router ip> [rounds]")
+        sys.exit(1)
+    ip = sys.argv[1]
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    for backend in ("ansible", "ssh"):
+        report(backend, bench(backend, ip, rounds))
+    print("ssh pool:", netmiko_final.pool_stats())
@@ -0,0 +1,136 @@
+# --------------------------------------------------------------
+# Micro-benchmark: reading interface tables out of NETCONF replies
+# --------------------------------------------------------------
+#
+# Builds a <get> reply with interfaces and interfaces-state for N
+# interfaces, then times reading every (name, enabled, admin, oper) with
+#   xmltodict   xmltodict.parse(reply.xml), then walking the nested dicts
+#                (what netconf_final did)
+#   lxml tree    netconf_xml.interface_table(reply.data_ele) on the tree
+#                ncclient has already parsed
+#   lxml parse   parsing the XML with lxml as well, then the same
+#   iterparse    netconf_xml.iter_interfaces() on the raw bytes
+# and the Python heap peak of each (tracemalloc, libxml2 memory not counted).
+#
+#   python bench_netconf_xml.py [interfaces ...]   default 10 100 1000 5000
+
+import statistics
+import sys
+import time
+import tracemalloc
+
+import xmltodict
+from lxml import etree
+
+import netconf_xml
+
+IF_NS = netconf_xml.IF_NS
+
+
+def make_reply(count):
+    config, state = [], []
+    for i in range(count):
+        name = f"GigabitEthernet1/0/{i}"
+        config.append(
+            f"<interface><name>{name}</name><description>port {i}</description>"
+            f'<type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:ethernetCsmacd</type>'
+            f"<enabled>{'true' if i % 7 else 'false'}</enabled>"
+            f'<ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip"><address><ip>10.{i // 250}.{i % 250}.1</ip>'
+            f"<netmask>255.255.255.0</netmask></address></ipv4></interface>"
+        )
+        state.append(
+            f"<interface><name>{name}</name><admin-status>{'up' if i % 7 else 'down'}</admin-status>"
+            f"<oper-status>{'up' if i % 5 else 'down'}</oper-status>"
+            f"<statistics><in-octets>{i * 1000}</in-octets><out-octets>{i * 2000}</out-octets></statistics></interface>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101"><data>'
+        f'<interfaces xmlns="{IF_NS}">{"".join(config)}</interfaces>'
+        f'<interfaces-state xmlns="{IF_NS}">{"".join(state)}</interfaces-state>'
+        "</data></rpc-reply>"
+    )
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value] if value else []
+
+
+def with_xmltodict(reply_xml):
+    data = xmltodict.parse(reply_xml)["rpc-reply"]["data"] or {}
+    table = {}
+    for intf in as_list((data.get("interfaces") or {}).get("interface")):
+        table[intf["name"]] = [intf["name"], intf.get("enabled", "true") == "true", None, None]
+    for intf in as_list((data.get("interfaces-state") or {}).get("interface")):
+        entry = table.setdefault(intf["name"], [intf["name"], None, None, None])
+        entry[2], entry[3] = intf.get("admin-status"), intf.get("oper-status")
+    return table
+
+
+def data_ele(reply_xml):
+    # what ncclient hands out as reply.data_ele
+    return etree.fromstring(reply_xml.encode()).find("{urn:ietf:params:xml:ns:netconf:base:1.0}data")
+
+
+def with_lxml_parse(reply_xml):
+    return netconf_xml.interface_table(data_ele(reply_xml))
+
+
+def with_iterparse(reply_bytes):
+    table = {}
+    for record in netconf_xml.iter_interfaces(reply_bytes):
+        entry = table.get(record.name)
+        if entry is None:
+            table[record.name] = record
+        elif record.enabled is None:
+            entry.admin, entry.oper = record.admin, record.oper
+    return table
+
+
+def timed(function, argument, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def heap_peak(function, argument):
+    tracemalloc.start()
+    result = function(argument)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def bench(count):
+    reply_xml = make_reply(count)
+    reply_bytes = reply_xml.encode()
+    tree = data_ele(reply_xml)
+    rounds = max(3, min(200, 20000 // count))
+    cases = [
+        ("xmltodict", with_xmltodict, reply_xml),
+        ("lxml tree", netconf_xml.interface_table, tree),
+        ("lxml parse", with_lxml_parse, reply_xml),
+        ("iterparse", with_iterparse, reply_bytes),
+    ]
+    # every way must read the same table
+    expected = {name: tuple(entry) for name, entry in with_xmltodict(reply_xml).items()}
+    for label, function, argument in cases[1:]:
+        table = {name: (r.name, r.enabled, r.admin, r.oper) for name, r in function(argument).items()}
+        assert table == expected, f"{label} reads a different table"
+
+    print(f"{count} interfaces, reply {len(reply_bytes) / 1024:.0f} KiB, median of {rounds} rounds:")
+    baseline = None
+    for label, function, argument in cases:
+        seconds = timed(function, argument, rounds)
+        baseline = baseline or seconds
+        peak = heap_peak(function, argument)
+        print(f"  {label:11} {seconds * 1000:9.3f} ms  {baseline / seconds:6.1f}x  heap peak {peak / 1024:8.0f} KiB")
+
+
+if __name__ == "__main__":
+    for count in [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000]:
+        bench(count)
@@ -0,0 +1,176 @@
+# --------------------------------------------------------------
+# Run bot commands in parallel across routers, one at a time per router
+# --------------------------------------------------------------
+#
+# Each router IP has its own FIFO queue. A router is "drained" by a single
+# worker at a time, so two writes to the same router never interleave,
+# while commands for different routers run on different worker threads.
+#
+# A batch job (submit_batch) needs several routers at once: it waits in the
+# queue of each of them, a router that reaches it is held (its worker goes
+# back to the pool), and the worker of the last one runs the job and then
+# lets the others drain again.
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Batch:
+    def __init__(self, keys, job, on_done, label, queued_at):
+        self.keys = keys
+        self.waiting = set(keys)  # routers that have not reached the batch yet
+        self.job = job
+        self.on_done = on_done
+        self.label = label
+        self.queued_at = queued_at
+
+
+class CommandExecutor:
+    def __init__(self, workers=5, max_queue=5):
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="command")
+        self._lock = threading.Lock()
+        self._queues = {}    # key -> deque of pending jobs
+        self._running = set()  # keys that a worker is draining
+        self._active = set()   # keys with a job executing right now
+        self._metrics = deque(maxlen=500)
+
+    def submit(self, key, job, on_done, label=""):
+        """Queue job() for key; on_done(result) is called from the worker.
+
+        Returns the number of commands ahead of this one (0 = runs now).
+        Raises QueueFull when the router already has max_queue commands waiting.
+        """
+        with self._lock:
+            pending = self._queues.setdefault(key, deque())
+            ahead = len(pending) + (1 if key in self._active else 0)
+            if len(pending) >= self.max_queue:
+                raise QueueFull(key)
+            # the job runs in a copy of the caller's context (e.g. the room being served)
+            context = contextvars.copy_context()
+            pending.append((partial(context.run, job), on_done, label, time.monotonic()))
+            if key not in self._running:
+                self._running.add(key)
+                self._pool.submit(self._drain, key)
+        return ahead
+
+    def submit_batch(self, keys, job, on_done, label=""):
+        """Queue one job() that runs while it holds every key; on_done(result) is called from the worker.
+
+        Returns the most commands ahead of it on any of the keys.
+        Raises QueueFull, queuing nothing, when one of them has max_queue commands waiting.
+        """
+        with self._lock:
+            for key in keys:
+                if len(self._queues.get(key, ())) >= self.max_queue:
+                    raise QueueFull(key)
+            context = contextvars.copy_context()
+            batch = _Batch(list(keys), partial(context.run, job), on_done, label, time.monotonic())
+            ahead = 0
+            for key in keys:
+                pending = self._queues.setdefault(key, deque())
+                ahead = max(ahead, len(pending) + (1 if key in self._active else 0))
+                pending.append(batch)
+                if key not in self._running:
+                    self._running.add(key)
+                    self._pool.submit(self._drain, key)
+        return ahead
+
+    def submit_many(self, jobs, on_done, label=""):
+        """Fan jobs out over their routers and call on_done(results) once, when all finished.
+
+        jobs is a list of (key, job); results is a list of (key, result, seconds)
+        in the same order. Routers whose queue is full report a busy error.
+        """
+        results = [None] * len(jobs)
+        remaining = [len(jobs)]
+        lock = threading.Lock()
+
+        def finish(index, key, result, seconds):
+            with lock:
+                results[index] = (key, result, seconds)
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done:
+                on_done(results)
+
+        for index, (key, job) in enumerate(jobs):
+            def timed(job=job):
+                started = time.monotonic()
+                result = job()
+                return result, time.monotonic() - started
+
+            def collect(outcome, index=index, key=key):
+                # _drain turns exceptions into an error string instead of a tuple
+                if isinstance(outcome, tuple):
+                    finish(index, key, *outcome)
+                else:
+                    finish(index, key, outcome, 0.0)
+
+            try:
+                self.submit(key, timed, collect, label)
+            except QueueFull:
+                finish(index, key, f"Error: {key} is busy, too many queued commands", 0.0)
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                pending = self._queues[key]
+                self._active.discard(key)
+                if not pending:
+                    self._running.discard(key)
+                    return
+                entry = pending.popleft()
+                self._active.add(key)
+                if isinstance(entry, _Batch):
+                    entry.waiting.discard(key)
+                    if entry.waiting:
+                        # hold the router for the batch, the last router to get there runs it
+                        return
+
+            if isinstance(entry, _Batch):
+                self._run(",".join(entry.keys), entry.job, entry.on_done, entry.label, entry.queued_at)
+                for other in entry.keys:
+                    if other != key:
+                        self._pool.submit(self._drain, other)
+            else:
+                self._run(key, *entry)
+
+    def _run(self, key, job, on_done, label, queued_at):
+        started = time.monotonic()
+        try:
+            result = job()
+        except Exception as e:
+            result = f"Error: {e}"
+        finished = time.monotonic()
+
+        metric = {
+            "key": key,
+            "command": label,
+            "queue_ms": round((started - queued_at) * 1000, 1),
+            "exec_ms": round((finished - started) * 1000, 1),
+        }
+        self._metrics.append(metric)
+        print("Command {command} on {key}: queued {queue_ms} ms, ran {exec_ms} ms".format(**metric))
+        try:
+            on_done(result)
+        except Exception as e:
+            print(f"Error delivering result for {label} on {key}: {e}")
+
+    def queued(self, key):
+        with self._lock:
+            return len(self._queues.get(key, ()))
+
+    def metrics(self):
+        return list(self._metrics)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,106 @@
+# --------------------------------------------------------------
+# Running-config backups in a content-addressed store
+# --------------------------------------------------------------
+#
+# CONFIG_STORE/objects/<sha256>.txt holds each distinct config once,
+# CONFIG_STORE/refs/<router>.json the hash of the latest backup of a router
+# and the hashes before it. Lines that change on every "show running-config"
+# (byte count, last change time) are dropped first, so an unchanged config
+# always gets the same hash and is neither stored nor uploaded again.
+
+import difflib
+import hashlib
+import json
+import os
+import re
+import time
+
+CONFIG_STORE = os.environ.get("CONFIG_STORE", "config_store")
+HISTORY_SIZE = 20
+
+VOLATILE_LINES = re.compile(
+    r"^(Building configuration\.\.\.|Current configuration : \d+ bytes"
+    r"|! Last configuration change at .*|! NVRAM config last updated at .*|! No configuration change since last restart)\s*$"
+)
+
+
+def normalize(config):
+    lines = [line.rstrip() for line in config.splitlines() if not VOLATILE_LINES.match(line.strip())]
+    while lines and not lines[0]:
+        lines.pop(0)
+    return "\n".join(lines).strip("\n") + "\n"
+
+
+def digest(config):
+    return hashlib.sha256(config.encode()).hexdigest()
+
+
+def object_path(config_hash, store=CONFIG_STORE):
+    return os.path.join(store, "objects", f"{config_hash}.txt")
+
+
+def ref_path(router, store=CONFIG_STORE):
+    return os.path.join(store, "refs", f"{router}.json")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_ref(router, store=CONFIG_STORE):
+    try:
+        with open(ref_path(router, store)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"latest": None, "history": []}
+
+
+def read_object(config_hash, store=CONFIG_STORE):
+    with open(object_path(config_hash, store)) as f:
+        return f.read()
+
+
+def unified_diff(old, new, router):
+    return "".join(difflib.unified_diff(
+        old.splitlines(keepends=True), new.splitlines(keepends=True),
+        fromfile=f"{router} (previous)", tofile=f"{router} (running)",
+    ))
+
+
+class Backup:
+    def __init__(self, router, hash, previous, path, changed, diff):
+        self.router = router
+        self.hash = hash
+        self.previous = previous
+        self.path = path
+        self.changed = changed
+        self.diff = diff
+
+
+def save(router, config, store=CONFIG_STORE):
+    """Store a running-config of router; returns a Backup telling if it changed."""
+    config = normalize(config)
+    config_hash = digest(config)
+    path = object_path(config_hash, store)
+    if not os.path.exists(path):
+        _write_atomic(path, config)
+
+    ref = load_ref(router, store)
+    previous = ref["latest"]
+    if previous == config_hash:
+        return Backup(router, config_hash, previous, path, False, "")
+
+    diff = ""
+    if previous and os.path.exists(object_path(previous, store)):
+        diff = unified_diff(read_object(previous, store), config, router)
+    ref["history"] = ([{"hash": previous, "saved": ref.get("saved")}] + ref["history"])[:HISTORY_SIZE] if previous else []
+    ref["latest"] = config_hash
+    ref["saved"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    _write_atomic(ref_path(router, store), json.dumps(ref, indent=2))
+    return Backup(router, config_hash, previous, path, True, diff)
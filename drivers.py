@@ -0,0 +1,183 @@
+# --------------------------------------------------------------
+# One interface for every backend: restconf, netconf, ssh and auto
+# --------------------------------------------------------------
+#
+# A driver runs the loopback commands (create/delete/enable/disable/status)
+# and the MOTD commands for a router. run() raises when the router cannot
+# be reached over that transport; execute() turns that into the usual
+# "Cannot ..." reply. The auto driver measures latency and success rate per
+# router and backend, sends each command to the fastest healthy backend and
+# fails over to the next one when a transport is down; "/66070220 stats"
+# shows what it measured. The banner lives in the CLI config, so every
+# driver reads and writes the MOTD over SSH (netmiko_final / ansible_banner).
+
+import threading
+import time
+
+import requests
+
+import ansible_banner
+import loopback
+import netconf_final
+import netmiko_final
+import restconf_final
+import rooms
+import tracing
+from state_cache import cache
+
+COMMANDS = ["create", "delete", "enable", "disable", "status"]
+
+
+class Driver:
+    name = None
+    method = None  # name used in replies
+
+    def run(self, command, ip, fresh=False):
+        raise NotImplementedError
+
+    def execute(self, command, ip, fresh=False):
+        if command not in COMMANDS:
+            return "Error: Unknown command"
+        try:
+            return self.run(command, ip, fresh)
+        except Exception as e:
+            print(f"Error: {self.name} {command} on {ip}: {e}")
+            tracing.set_attribute(ok=False, error=f"{type(e).__name__}: {e}")
+            # a write may have been cut off halfway, do not trust the state read before it
+            loopback.forget(cache, ip, rooms.interface_name())
+            return loopback.error_message(command, self.method, rooms.student_id())
+
+    def get_motd(self, ip, fresh=False):
+        return netmiko_final.get_motd(ip, fresh)
+
+    def set_motd(self, ip, message):
+        return ansible_banner.set_motd(ip, message)
+
+
+class RestconfDriver(Driver):
+    name = "restconf"
+    method = restconf_final.METHOD
+
+    def run(self, command, ip, fresh=False):
+        return restconf_final.run(command, ip, fresh)
+
+
+class NetconfDriver(Driver):
+    name = "netconf"
+    method = netconf_final.METHOD
+
+    def run(self, command, ip, fresh=False):
+        return netconf_final.run(command, ip, fresh)
+
+
+class SshDriver(Driver):
+    name = "ssh"
+    method = netmiko_final.METHOD
+
+    def run(self, command, ip, fresh=False):
+        return netmiko_final.run(command, ip, fresh)
+
+
+class BackendHealth:
+    """Latency (EWMA) and recent success rate of one backend on one router.
+
+    A failure takes the backend out for the cooldown; once it is over the
+    backend is tried again (half-open), and a success forgets the failures.
+    """
+
+    ALPHA = 0.3
+    WINDOW = 20
+
+    def __init__(self):
+        self.latency = None
+        self.results = []
+        self.down_until = 0.0
+
+    def record(self, ok, seconds):
+        if ok and self.down_until:
+            # the probe after a cooldown worked, the backend is back
+            self.results = []
+            self.down_until = 0.0
+        self.results = (self.results + [ok])[-self.WINDOW:]
+        if ok:
+            self.latency = seconds if self.latency is None else (
+                self.ALPHA * seconds + (1 - self.ALPHA) * self.latency)
+
+    @property
+    def success_rate(self):
+        return sum(self.results) / len(self.results) if self.results else 1.0
+
+    def healthy(self, now):
+        return now >= self.down_until
+
+
+class AutoDriver(Driver):
+    name = "auto"
+    method = "Auto"
+
+    # how long a backend is skipped after it failed
+    COOLDOWN = 30
+
+    def __init__(self, backends):
+        self.backends = backends
+        self._lock = threading.Lock()
+        self._health = {}  # (ip, backend name) -> BackendHealth
+
+    def health(self, ip, backend):
+        with self._lock:
+            key = (ip, backend.name)
+            if key not in self._health:
+                self._health[key] = BackendHealth()
+            return self._health[key]
+
+    def ranked(self, ip):
+        """Healthy backends first, fastest first; unmeasured ones count as fastest so each gets tried."""
+        now = time.monotonic()
+
+        def score(backend):
+            health = self.health(ip, backend)
+            return (not health.healthy(now), health.latency or 0.0)
+
+        return sorted(self.backends, key=score)
+
+    def run(self, command, ip, fresh=False):
+        last_error = None
+        for backend in self.ranked(ip):
+            health = self.health(ip, backend)
+            started = time.monotonic()
+            try:
+                result = backend.run(command, ip, fresh)
+            except Exception as e:
+                with self._lock:
+                    health.record(False, 0.0)
+                    health.down_until = time.monotonic() + self.COOLDOWN
+                print(f"Auto: {backend.name} failed on {ip} ({e}), trying next backend")
+                last_error = e
+                continue
+            with self._lock:
+                health.record(True, time.monotonic() - started)
+            tracing.set_attribute(backend_used=backend.name)
+            return result
+        raise last_error or requests.ConnectionError(f"no backend for {ip}")
+
+    def report(self):
+        with self._lock:
+            return {
+                f"{ip} {name}": {
+                    "latency_ms": round(h.latency * 1000, 1) if h.latency is not None else None,
+                    "success_rate": round(h.success_rate, 2),
+                }
+                for (ip, name), h in self._health.items()
+            }
+
+
+restconf = RestconfDriver()
+netconf = NetconfDriver()
+ssh = SshDriver()
+auto = AutoDriver([restconf, netconf, ssh])
+
+DRIVERS = {driver.name: driver for driver in (restconf, netconf, ssh, auto)}
+
+
+def get(name):
+    return DRIVERS[name]
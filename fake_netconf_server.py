@@ -0,0 +1,591 @@
+# --------------------------------------------------------------
+# Local stand-in for an IOS-XE NETCONF server (offline testing)
+# --------------------------------------------------------------
+#
+# Speaks NETCONF 1.0 over SSH (paramiko) well enough for ncclient and
+# netconf_final: hello exchange, <get>, <get-config>, <edit-config> on the
+# ietf-interfaces model, <close-session> and IOS-XE style yang-push
+# <establish-subscription> with on-change notifications. With candidate=True
+# (the default) there is a candidate datastore as well, for netconf_bulk:
+# <lock>/<unlock>, <discard-changes>, <commit> (confirmed or not) and
+# <cancel-commit>; edits of running honour rollback-on-error.
+#
+#   python fake_netconf_server.py [port]
+#   NETCONF_PORT=<port> python -c "import netconf_final; print(netconf_final.status('127.0.0.1'))"
+
+import copy
+import ipaddress
+import socket
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+import paramiko
+
+import netconf_xml
+from netconf_xml import child_text, local
+
+BASE_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+NOTIFICATION_NS = "urn:ietf:params:xml:ns:netconf:notification:1.0"
+IF_NS = netconf_xml.IF_NS
+IP_NS = netconf_xml.IP_NS
+EVENT_NS = "urn:ietf:params:xml:ns:yang:ietf-event-notifications"
+YANG_PUSH_NS = "urn:ietf:params:xml:ns:yang:ietf-yang-push"
+EOM = "]]>]]>"
+
+CAPABILITIES = [
+    "urn:ietf:params:netconf:base:1.0",
+    "urn:ietf:params:netconf:capability:notification:1.0",
+    "urn:ietf:params:xml:ns:yang:ietf-interfaces?module=ietf-interfaces",
+]
+YANG_PUSH_CAPABILITY = "urn:ietf:params:xml:ns:yang:ietf-yang-push?module=ietf-yang-push"
+ROLLBACK_ON_ERROR_CAPABILITY = "urn:ietf:params:netconf:capability:rollback-on-error:1.0"
+CANDIDATE_CAPABILITIES = [
+    "urn:ietf:params:netconf:capability:candidate:1.0",
+    "urn:ietf:params:netconf:capability:confirmed-commit:1.1",
+]
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def host_key():
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+class FakeRouter:
+    """In-memory ietf-interfaces config and state of one router."""
+
+    def __init__(self, interfaces=None):
+        self.lock = threading.RLock()
+        # name -> {"enabled", "admin", "oper", "type", "description", "ipv4": [(ip, mask)]}
+        self.interfaces = {}
+        self.listeners = []
+        for name in interfaces or ["GigabitEthernet1", "GigabitEthernet2", "GigabitEthernet3"]:
+            self.add_interface(name)
+
+    def add_interface(self, name, enabled=True, type="iana-if-type:ethernetCsmacd"):
+        with self.lock:
+            self.interfaces[name] = {
+                "enabled": enabled,
+                "admin": "up" if enabled else "down",
+                "oper": "up" if enabled else "down",
+                "type": type,
+                "description": None,
+                "ipv4": [],
+            }
+        self.notify(name)
+
+    def set_oper(self, name, oper):
+        """Simulate a link going up/down without a config change."""
+        with self.lock:
+            self.interfaces[name]["oper"] = oper
+        self.notify(name)
+
+    def notify(self, name):
+        with self.lock:
+            if name in self.interfaces:
+                self.interfaces[name]["last_change"] = datetime.now(timezone.utc).isoformat()
+        for listener in list(self.listeners):
+            listener(name)
+
+    # ---------------- XML rendering ----------------
+
+    def config_xml(self, names=None, interfaces=None, names_only=False):
+        out = [f'<interfaces xmlns="{IF_NS}">']
+        with self.lock:
+            for name, intf in (self.interfaces if interfaces is None else interfaces).items():
+                if names and name not in names:
+                    continue
+                if names_only:
+                    out.append(f"<interface><name>{name}</name></interface>")
+                    continue
+                out.append(self.interface_config_xml(name, intf))
+        out.append("</interfaces>")
+        return "".join(out)
+
+    def interface_config_xml(self, name, intf):
+        out = [f"<interface><name>{name}</name>"]
+        if intf["description"]:
+            out.append(f"<description>{intf['description']}</description>")
+        out.append(f'<type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">{intf["type"].replace("iana-if-type:", "ianaift:")}</type>')
+        out.append(f"<enabled>{'true' if intf['enabled'] else 'false'}</enabled>")
+        if intf["ipv4"]:
+            out.append(f'<ipv4 xmlns="{IP_NS}">')
+            for ip, mask in intf["ipv4"]:
+                out.append(f"<address><ip>{ip}</ip><netmask>{mask}</netmask></address>")
+            out.append("</ipv4>")
+        out.append("</interface>")
+        return "".join(out)
+
+    def state_xml(self, names=None, last_change_only=False):
+        out = [f'<interfaces-state xmlns="{IF_NS}">']
+        with self.lock:
+            for name, intf in self.interfaces.items():
+                if names and name not in names:
+                    continue
+                if last_change_only:
+                    out.append(f"<interface><name>{name}</name><last-change>{intf.get('last_change', '')}</last-change></interface>")
+                    continue
+                out.append(self.interface_state_xml(name, intf))
+        out.append("</interfaces-state>")
+        return "".join(out)
+
+    def interface_state_xml(self, name, intf):
+        return (
+            f"<interface><name>{name}</name>"
+            f"<admin-status>{intf['admin']}</admin-status>"
+            f"<oper-status>{intf['oper']}</oper-status>"
+            + (f"<last-change>{intf['last_change']}</last-change>" if intf.get("last_change") else "")
+            + "</interface>"
+        )
+
+    # ---------------- edit-config ----------------
+
+    def edit(self, config, interfaces=None):
+        """Apply an <config> element to running (or to the interfaces dict given); returns an error tag or None.
+
+        Like stop-on-error, the interfaces before a failing one stay changed.
+        """
+        target = self.interfaces if interfaces is None else interfaces
+        changed = []
+        error = None
+        with self.lock:
+            for element in config.iter(f"{{{IF_NS}}}interfaces"):
+                for intf in element:
+                    if local(intf.tag) != "interface":
+                        continue
+                    name = child_text(intf, "name")
+                    operation = intf.get("operation") or intf.get(f"{{{BASE_NS}}}operation") or "merge"
+                    if operation in ("delete", "remove"):
+                        if name not in target:
+                            if operation == "delete":
+                                error = "data-missing"
+                                break
+                            continue
+                        del target[name]
+                        changed.append(name)
+                        continue
+                    error = self.merge_interface(name, intf, target)
+                    if error:
+                        break
+                    changed.append(name)
+                if error:
+                    break
+        if interfaces is None:
+            for name in changed:
+                self.notify(name)
+        return error
+
+    def replace_interfaces(self, interfaces):
+        """Make interfaces the running config (a commit or a rollback)."""
+        with self.lock:
+            old, self.interfaces = self.interfaces, interfaces
+            changed = [name for name in set(old) | set(interfaces) if old.get(name) != interfaces.get(name)]
+        for name in changed:
+            self.notify(name)
+
+    def merge_interface(self, name, element, interfaces=None):
+        """Merge one <interface> element; returns an error tag or None."""
+        interfaces = self.interfaces if interfaces is None else interfaces
+        for address in element.iter(f"{{{IP_NS}}}address"):
+            try:
+                ipaddress.IPv4Interface(f"{child_text(address, 'ip')}/{child_text(address, 'netmask')}")
+            except ValueError:
+                return "invalid-value"
+        intf = interfaces.get(name)
+        if intf is None:
+            intf = interfaces[name] = {
+                "enabled": True, "admin": "up", "oper": "up",
+                "type": "iana-if-type:softwareLoopback", "description": None, "ipv4": [],
+            }
+        for child in element:
+            tag = local(child.tag)
+            if tag == "enabled":
+                intf["enabled"] = child.text.strip() == "true"
+                intf["admin"] = intf["oper"] = "up" if intf["enabled"] else "down"
+            elif tag == "description":
+                intf["description"] = child.text
+            elif tag == "type":
+                intf["type"] = "iana-if-type:" + child.text.split(":")[-1]
+            elif tag == "ipv4":
+                for address in child:
+                    ip, mask = child_text(address, "ip"), child_text(address, "netmask")
+                    if (ip, mask) not in intf["ipv4"]:
+                        intf["ipv4"].append((ip, mask))
+        return None
+
+
+class _SSHServer(paramiko.ServerInterface):
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_subsystem_request(self, channel, name):
+        return name == "netconf"
+
+
+class _Session:
+    def __init__(self, server, channel, session_id):
+        self.server = server
+        self.router = server.router
+        self.channel = channel
+        self.session_id = session_id
+        self.send_lock = threading.Lock()
+        self.subscription_id = None
+        self.subscription_names = None  # None = every interface
+
+    def send(self, xml):
+        with self.send_lock:
+            self.channel.sendall((xml + EOM).encode())
+
+    def read_messages(self):
+        buffer = ""
+        while True:
+            data = self.channel.recv(65536)
+            if not data:
+                return
+            buffer += data.decode()
+            while EOM in buffer:
+                message, buffer = buffer.split(EOM, 1)
+                if message.strip():
+                    yield message
+
+    def run(self):
+        caps = list(CAPABILITIES) + [ROLLBACK_ON_ERROR_CAPABILITY]
+        if self.server.candidate:
+            caps += CANDIDATE_CAPABILITIES
+        if self.server.yang_push:
+            caps.append(YANG_PUSH_CAPABILITY)
+        self.send(
+            f'<?xml version="1.0" encoding="UTF-8"?><hello xmlns="{BASE_NS}"><capabilities>'
+            + "".join(f"<capability>{c}</capability>" for c in caps)
+            + f"</capabilities><session-id>{self.session_id}</session-id></hello>"
+        )
+        messages = self.read_messages()
+        next(messages, None)  # client hello
+        try:
+            for message in messages:
+                if not self.handle(ET.fromstring(message)):
+                    break
+        finally:
+            if self.on_change in self.router.listeners:
+                self.router.listeners.remove(self.on_change)
+            self.server.session_closed(self.session_id)
+            self.channel.close()
+
+    def reply(self, rpc, body):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.server.count_rpc()
+        message_id = rpc.get("message-id", "")
+        self.send(f'<rpc-reply xmlns="{BASE_NS}" message-id="{message_id}">{body}</rpc-reply>')
+
+    def error(self, rpc, tag, message=""):
+        self.reply(rpc, (
+            f"<rpc-error><error-type>application</error-type><error-tag>{tag}</error-tag>"
+            f"<error-severity>error</error-severity><error-message>{message or tag}</error-message></rpc-error>"
+        ))
+
+    def handle(self, rpc):
+        if len(rpc) == 0:
+            return True
+        operation = rpc[0]
+        name = local(operation.tag)
+
+        if name in ("get", "get-config"):
+            config_names, state_names, wanted_config, wanted_state, selected = self.filter_names(operation)
+            source = self.datastore(operation, "source") if name == "get-config" else "running"
+            body = ""
+            if wanted_config:
+                body += self.router.config_xml(config_names, self.server.datastore_interfaces(source),
+                                               names_only="interfaces" in selected)
+            if wanted_state and name == "get":
+                body += self.router.state_xml(state_names, last_change_only="interfaces-state" in selected)
+            self.reply(rpc, f"<data>{body}</data>")
+        elif name == "edit-config":
+            config = next((c for c in operation if local(c.tag) == "config"), None)
+            target = self.datastore(operation, "target")
+            if config is None:
+                error = "missing-element"
+            elif not self.server.may_write(target, self.session_id):
+                error = "in-use"
+            else:
+                error = self.server.edit(target, config, child_text(operation, "error-option"))
+            if error:
+                self.error(rpc, error)
+            else:
+                self.reply(rpc, "<ok/>")
+        elif name in ("lock", "unlock", "discard-changes", "commit", "cancel-commit"):
+            if name in ("lock", "unlock"):
+                error = getattr(self.server, name)(self.datastore(operation, "target"), self.session_id)
+            elif not self.server.candidate:
+                error = "operation-not-supported"
+            elif name == "discard-changes":
+                error = self.server.discard_changes(self.session_id)
+            elif name == "commit":
+                confirmed = any(local(c.tag) == "confirmed" for c in operation)
+                timeout = int(child_text(operation, "confirm-timeout") or 600)
+                error = self.server.commit(self.session_id, confirmed, timeout)
+            else:
+                error = self.server.cancel_commit()
+            if error:
+                self.error(rpc, error)
+            else:
+                self.reply(rpc, "<ok/>")
+        elif name == "establish-subscription":
+            if not self.server.yang_push:
+                self.error(rpc, "operation-not-supported")
+                return True
+            self.subscription_id = self.server.next_subscription_id()
+            self.router.listeners.append(self.on_change)
+            self.reply(rpc, (
+                f'<subscription-result xmlns="{EVENT_NS}" xmlns:notif-bis="{EVENT_NS}">notif-bis:ok</subscription-result>'
+                f'<subscription-id xmlns="{EVENT_NS}">{self.subscription_id}</subscription-id>'
+            ))
+        elif name == "close-session":
+            self.reply(rpc, "<ok/>")
+            return False
+        else:
+            self.error(rpc, "operation-not-supported", f"{name} is not supported")
+        return True
+
+    def datastore(self, operation, name):
+        # <target><candidate/></target> -> "candidate"
+        for child in operation:
+            if local(child.tag) == name and len(child):
+                return local(child[0].tag)
+        return "running"
+
+    def filter_names(self, operation):
+        """Return (config names, state names, want config, want state, selected) from a subtree filter.
+
+        selected holds "interfaces" / "interfaces-state" when their entries are
+        selection nodes only (<interface><name/>...</interface>): just the names
+        (and last-change) are returned then.
+        """
+        flt = next((c for c in operation if local(c.tag) == "filter"), None)
+        if flt is None:
+            return None, None, True, True, set()
+        config_names = state_names = None
+        wanted_config = wanted_state = False
+        selected = set()
+        for top in flt:
+            entries = [i for i in top if local(i.tag) == "interface"]
+            names = [child_text(i, "name") for i in entries]
+            if entries and all(n is None and any(local(c.tag) == "name" for c in i) for n, i in zip(names, entries)):
+                selected.add(local(top.tag))
+            names = [n for n in names if n] or None
+            if local(top.tag) == "interfaces":
+                wanted_config, config_names = True, names
+            elif local(top.tag) == "interfaces-state":
+                wanted_state, state_names = True, names
+        return config_names, state_names, wanted_config, wanted_state, selected
+
+    def on_change(self, name):
+        with self.router.lock:
+            intf = self.router.interfaces.get(name)
+            if intf is None:
+                operation = "delete"
+                value = ""
+            else:
+                operation = "replace"
+                value = (
+                    f'<value><interface xmlns="{IF_NS}"><name>{name}</name>'
+                    f"<admin-status>{intf['admin']}</admin-status>"
+                    f"<oper-status>{intf['oper']}</oper-status></interface></value>"
+                )
+        event_time = datetime.now(timezone.utc).isoformat()
+        try:
+            self.send(
+                f'<notification xmlns="{NOTIFICATION_NS}"><eventTime>{event_time}</eventTime>'
+                f'<push-change-update xmlns="{YANG_PUSH_NS}"><subscription-id>{self.subscription_id}</subscription-id>'
+                f"<datastore-changes><yang-patch><patch-id>{self.subscription_id}</patch-id><edit><edit-id>1</edit-id>"
+                f"<operation>{operation}</operation>"
+                f"<target>/ietf-interfaces:interfaces-state/interface[name='{name}']</target>"
+                f"{value}</edit></yang-patch></datastore-changes></push-change-update></notification>"
+            )
+        except OSError:
+            pass
+
+
+class FakeNetconfServer:
+    """Serve one FakeRouter on host:port; port 0 picks a free port."""
+
+    def __init__(self, router=None, host="127.0.0.1", port=0, latency=0.0, yang_push=True, candidate=True):
+        self.router = router or FakeRouter()
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.yang_push = yang_push
+        self.candidate = candidate
+        self.rpc_count = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self._candidate = None     # interfaces of the candidate, None = same as running
+        self._locks = {}           # datastore -> session id holding the lock
+        self._confirming = None    # (session id, running before the commit, timer) of a pending confirmed commit
+        self._lock = threading.Lock()
+        self._session_id = 0
+        self._subscription_id = 0
+        self._socket = None
+
+    def count_rpc(self):
+        with self._lock:
+            self.rpc_count += 1
+
+    def next_subscription_id(self):
+        with self._lock:
+            self._subscription_id += 1
+            return self._subscription_id
+
+    # ---------------- datastores ----------------
+
+    def datastore_interfaces(self, datastore):
+        with self._lock:
+            if datastore == "candidate" and self._candidate is not None:
+                return self._candidate
+        return None  # running
+
+    def may_write(self, datastore, session_id):
+        with self._lock:
+            return self._locks.get(datastore, session_id) == session_id
+
+    def lock(self, datastore, session_id):
+        with self._lock:
+            if self._locks.get(datastore, session_id) != session_id:
+                return "lock-denied"
+            self._locks[datastore] = session_id
+        return None
+
+    def unlock(self, datastore, session_id):
+        with self._lock:
+            if self._locks.get(datastore) != session_id:
+                return "operation-failed"
+            del self._locks[datastore]
+        return None
+
+    def edit(self, datastore, config, error_option):
+        router = self.router
+        if datastore == "candidate":
+            if not self.candidate:
+                return "operation-not-supported"
+            with self._lock, router.lock:
+                if self._candidate is None:
+                    self._candidate = copy.deepcopy(router.interfaces)
+                return router.edit(config, self._candidate)
+        if error_option == "rollback-on-error":
+            # edit a copy, running only changes when every interface went in
+            with router.lock:
+                edited = copy.deepcopy(router.interfaces)
+                error = router.edit(config, edited)
+                if not error:
+                    router.replace_interfaces(edited)
+            return error
+        return router.edit(config)
+
+    def discard_changes(self, session_id):
+        with self._lock:
+            self._candidate = None
+        return None
+
+    def commit(self, session_id, confirmed, timeout):
+        with self._lock:
+            pending = self._confirming
+            if pending:
+                pending[2].cancel()
+                self._confirming = None
+            candidate, self._candidate = self._candidate, None
+            if confirmed:
+                # a follow-up confirmed commit keeps the running config of the first one to roll back to
+                before = pending[1] if pending else copy.deepcopy(self.router.interfaces)
+                timer = threading.Timer(timeout, self._rollback)
+                timer.daemon = True
+                self._confirming = (session_id, before, timer)
+                timer.start()
+            self.commits += 1
+        if candidate is not None:
+            self.router.replace_interfaces(candidate)
+        return None
+
+    def cancel_commit(self):
+        if not self._rollback():
+            return "operation-failed"
+        return None
+
+    def _rollback(self):
+        """Undo the pending confirmed commit; False when there is none."""
+        with self._lock:
+            pending, self._confirming = self._confirming, None
+            if not pending:
+                return False
+            pending[2].cancel()
+            self._candidate = None
+            self.rollbacks += 1
+        self.router.replace_interfaces(pending[1])
+        return True
+
+    def session_closed(self, session_id):
+        with self._lock:
+            self._locks = {d: s for d, s in self._locks.items() if s != session_id}
+            pending = self._confirming
+        # a confirmed commit without <persist> is rolled back when its session ends
+        if pending and pending[0] == session_id:
+            self._rollback()
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(50)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept, name="fake-netconf", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._socket:
+            self._socket.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        transport = paramiko.Transport(client)
+        transport.add_server_key(host_key())
+        try:
+            transport.start_server(server=_SSHServer())
+            channel = transport.accept(20)
+            if channel is None:
+                return
+            with self._lock:
+                self._session_id += 1
+                session_id = self._session_id
+            _Session(self, channel, session_id).run()
+        except (paramiko.SSHException, EOFError, OSError):
+            pass
+        finally:
+            transport.close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8830
+    server = FakeNetconfServer(port=port).start()
+    print(f"Fake NETCONF server on 127.0.0.1:{server.port}")
+    while True:
+        time.sleep(3600)
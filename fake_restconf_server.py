@@ -0,0 +1,360 @@
+# --------------------------------------------------------------
+# Local stand-in for an IOS-XE RESTCONF server (offline testing)
+# --------------------------------------------------------------
+#
+# HTTPS with a throwaway self-signed certificate and the ietf-interfaces
+# resources restconf_final uses:
+#   GET    /restconf/data/ietf-interfaces:interfaces-state[/interface=<name>][?fields=interface(name;last-change)]
+#   GET    /restconf/data/ietf-interfaces:interfaces[/interface=<name>][?fields=interface(name)]
+#   PUT    /restconf/data/ietf-interfaces:interfaces/interface=<name>  (201 created, 204 replaced)
+#   DELETE /restconf/data/ietf-interfaces:interfaces/interface=<name>
+#   PATCH  /restconf/data/ietf-interfaces:interfaces  merge, or a YANG Patch
+#          (application/yang-patch+json, all edits or none) with yang_patch=True
+# Interfaces are those of a fake_netconf_server.FakeRouter.
+#
+#   python fake_restconf_server.py [port]
+#   RESTCONF_PORT=<port> python -c "import restconf_final; print(restconf_final.status('127.0.0.1'))"
+
+import copy
+import datetime
+import ipaddress
+import json
+import os
+import ssl
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from fake_netconf_server import FakeRouter
+
+DATA = "/restconf/data/"
+CONFIG_PATH = DATA + "ietf-interfaces:interfaces"
+STATE_PATH = DATA + "ietf-interfaces:interfaces-state"
+YANG_JSON = "application/yang-data+json"
+YANG_PATCH = "application/yang-patch+json"
+
+_cert_files = None
+_cert_lock = threading.Lock()
+
+
+def cert_files():
+    """(cert path, key path) of a self-signed localhost certificate, made once per process."""
+    global _cert_files
+    with _cert_lock:
+        if _cert_files is None:
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-restconf")])
+            now = datetime.datetime.now(datetime.timezone.utc)
+            cert = (
+                x509.CertificateBuilder()
+                .subject_name(name).issuer_name(name)
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - datetime.timedelta(days=1))
+                .not_valid_after(now + datetime.timedelta(days=30))
+                .sign(key, hashes.SHA256())
+            )
+            directory = tempfile.mkdtemp(prefix="fake-restconf-")
+            cert_path = os.path.join(directory, "cert.pem")
+            key_path = os.path.join(directory, "key.pem")
+            with open(cert_path, "wb") as f:
+                f.write(cert.public_bytes(serialization.Encoding.PEM))
+            with open(key_path, "wb") as f:
+                f.write(key.private_bytes(
+                    serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                    serialization.NoEncryption()))
+            _cert_files = (cert_path, key_path)
+        return _cert_files
+
+
+def state_json(name, intf):
+    state = {"name": name, "admin-status": intf["admin"], "oper-status": intf["oper"]}
+    if intf.get("last_change"):
+        state["last-change"] = intf["last_change"]
+    return state
+
+
+def interface_json(name, intf):
+    interface = {
+        "name": name,
+        "type": intf["type"],
+        "enabled": intf["enabled"],
+    }
+    if intf["description"]:
+        interface["description"] = intf["description"]
+    if intf["ipv4"]:
+        interface["ietf-ip:ipv4"] = {
+            "address": [{"ip": ip, "netmask": mask} for ip, mask in intf["ipv4"]]
+        }
+    return interface
+
+
+def apply_interface(router, name, interface):
+    """Replace the config of one interface from its JSON body (router.lock held)."""
+    intf = router.interfaces.get(name)
+    created = intf is None
+    enabled = interface.get("enabled", True)
+    router.interfaces[name] = {
+        "enabled": enabled,
+        "admin": "up" if enabled else "down",
+        "oper": "up" if enabled else "down",
+        "type": interface.get("type", intf["type"] if intf else "iana-if-type:softwareLoopback"),
+        "description": interface.get("description"),
+        # PUT replaces the whole entry, like on the router
+        "ipv4": [(a["ip"], a["netmask"]) for a in interface.get("ietf-ip:ipv4", {}).get("address", [])],
+    }
+    return created
+
+
+def merge_interface(interfaces, interface):
+    """Merge one interface JSON object into interfaces; returns an error tag or None."""
+    name = interface.get("name")
+    if not name:
+        return "missing-element"
+    addresses = [(a.get("ip"), a.get("netmask")) for a in interface.get("ietf-ip:ipv4", {}).get("address", [])]
+    for ip, mask in addresses:
+        try:
+            ipaddress.IPv4Interface(f"{ip}/{mask}")
+        except ValueError:
+            return "invalid-value"
+    intf = interfaces.get(name)
+    if intf is None:
+        intf = interfaces[name] = {
+            "enabled": True, "admin": "up", "oper": "up",
+            "type": "iana-if-type:softwareLoopback", "description": None, "ipv4": [],
+        }
+    if "enabled" in interface:
+        intf["enabled"] = bool(interface["enabled"])
+        intf["admin"] = intf["oper"] = "up" if intf["enabled"] else "down"
+    if "description" in interface:
+        intf["description"] = interface["description"]
+    if "type" in interface:
+        intf["type"] = interface["type"]
+    for address in addresses:
+        if address not in intf["ipv4"]:
+            intf["ipv4"].append(address)
+    return None
+
+
+def apply_edit(interfaces, edit):
+    """Apply one YANG Patch edit; returns an error tag or None."""
+    target = edit.get("target", "")
+    name = unquote(target[len("/interface="):]) if target.startswith("/interface=") else None
+    if not name:
+        return "invalid-value"
+    operation = edit.get("operation")
+    if operation in ("delete", "remove"):
+        if name not in interfaces:
+            return "data-missing" if operation == "delete" else None
+        del interfaces[name]
+        return None
+    if operation not in ("merge", "create", "replace"):
+        return "operation-not-supported"
+    values = edit.get("value", {}).get("ietf-interfaces:interface", [])
+    if operation == "create" and name in interfaces:
+        return "data-exists"
+    if operation == "replace":
+        interfaces.pop(name, None)
+    for interface in values:
+        if interface.get("name") != name:
+            return "invalid-value"
+        error = merge_interface(interfaces, interface)
+        if error:
+            return error
+    return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, Nagle would hold the body back ~40 ms
+    disable_nagle_algorithm = True
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", YANG_JSON)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def error(self, status, tag, message=""):
+        self.reply(status, {"ietf-restconf:errors": {"error": [
+            {"error-type": "application", "error-tag": tag, "error-message": message or tag}]}})
+
+    def body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def begin(self):
+        self.fake.count_request()
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+    def interface_name(self, prefix):
+        # ".../interface=Loopback66070220" -> "Loopback66070220"
+        rest = unquote(self.path.split("?", 1)[0][len(prefix):])
+        if rest.startswith("/interface="):
+            return rest[len("/interface="):]
+        return None if not rest else ""
+
+    def fields(self, entries):
+        # ?fields=interface(name;last-change) keeps only those leaves of each entry
+        fields = parse_qs(urlparse(self.path).query).get("fields", [""])[0]
+        if not fields.startswith("interface("):
+            return entries
+        leaves = fields[len("interface("):-1].split(";")
+        return [{k: v for k, v in entry.items() if k in leaves} for entry in entries]
+
+    def do_GET(self):
+        self.begin()
+        router = self.fake.router
+        path = self.path.split("?", 1)[0]
+        if path.startswith(STATE_PATH):
+            name = self.interface_name(STATE_PATH)
+            with router.lock:
+                if name:
+                    intf = router.interfaces.get(name)
+                    if intf is None:
+                        return self.error(404, "invalid-value", "uri keypath not found")
+                    return self.reply(200, {"ietf-interfaces:interface": state_json(name, intf)})
+                states = [state_json(n, i) for n, i in router.interfaces.items()]
+                return self.reply(200, {"ietf-interfaces:interfaces-state": {"interface": self.fields(states)}})
+        if path.startswith(CONFIG_PATH):
+            name = self.interface_name(CONFIG_PATH)
+            with router.lock:
+                if name:
+                    intf = router.interfaces.get(name)
+                    if intf is None:
+                        return self.error(404, "invalid-value", "uri keypath not found")
+                    return self.reply(200, {"ietf-interfaces:interface": interface_json(name, intf)})
+                configs = [interface_json(n, i) for n, i in router.interfaces.items()]
+                return self.reply(200, {"ietf-interfaces:interfaces": {"interface": self.fields(configs)}})
+        self.error(404, "invalid-value", "uri keypath not found")
+
+    def do_PUT(self):
+        self.begin()
+        name = self.interface_name(CONFIG_PATH) if self.path.startswith(CONFIG_PATH) else None
+        try:
+            interface = self.body()["ietf-interfaces:interface"]
+        except (ValueError, KeyError):
+            return self.error(400, "malformed-message")
+        if not name or interface.get("name", name) != name:
+            return self.error(400, "invalid-value")
+        router = self.fake.router
+        with router.lock:
+            created = apply_interface(router, name, interface)
+        router.notify(name)
+        self.reply(201 if created else 204)
+
+    def do_PATCH(self):
+        self.begin()
+        content_type = self.headers.get("Content-Type", "")
+        # read the body first, the connection is kept alive for the next request
+        try:
+            body = self.body()
+        except ValueError:
+            return self.error(400, "malformed-message")
+        if content_type.startswith(YANG_PATCH) and not self.fake.yang_patch:
+            return self.error(415, "operation-not-supported", "yang-patch is not supported")
+        if self.path.split("?", 1)[0] != CONFIG_PATH:
+            return self.error(405, "operation-not-supported")
+        router = self.fake.router
+        with router.lock:
+            # edit a copy, the running config only changes when everything went in
+            interfaces = copy.deepcopy(router.interfaces)
+            if content_type.startswith(YANG_PATCH):
+                patch = body.get("ietf-yang-patch:yang-patch", {})
+                edit_status, error = [], None
+                for edit in patch.get("edit", []):
+                    error = apply_edit(interfaces, edit)
+                    if error:
+                        edit_status.append({"edit-id": edit.get("edit-id"), "errors": {"error": [
+                            {"error-type": "application", "error-tag": error}]}})
+                        break
+                    edit_status.append({"edit-id": edit.get("edit-id"), "ok": [None]})
+                if error:
+                    status = 409 if error in ("data-missing", "data-exists") else 400
+                    return self.reply(status, {"ietf-yang-patch:yang-patch-status": {
+                        "patch-id": patch.get("patch-id"), "edit-status": {"edit": edit_status}}})
+            else:
+                for interface in body.get("ietf-interfaces:interfaces", {}).get("interface", []):
+                    error = merge_interface(interfaces, interface)
+                    if error:
+                        return self.error(400, error)
+            router.replace_interfaces(interfaces)
+        if content_type.startswith(YANG_PATCH):
+            return self.reply(200, {"ietf-yang-patch:yang-patch-status": {
+                "patch-id": patch.get("patch-id"), "ok": [None]}})
+        self.reply(204)
+
+    def do_DELETE(self):
+        self.begin()
+        name = self.interface_name(CONFIG_PATH) if self.path.startswith(CONFIG_PATH) else None
+        router = self.fake.router
+        with router.lock:
+            if not name or name not in router.interfaces:
+                return self.error(404, "data-missing", "uri keypath not found")
+            del router.interfaces[name]
+        router.notify(name)
+        self.reply(204)
+
+
+class FakeRestconfServer:
+    """Serve RESTCONF for one FakeRouter on https://host:port; port 0 picks a free port.
+
+    yang_patch=False answers YANG Patch requests with 415, like a router without it.
+    """
+
+    def __init__(self, router=None, host="127.0.0.1", port=0, latency=0.0, yang_patch=True):
+        self.router = router or FakeRouter()
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.yang_patch = yang_patch
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def count_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*cert_files())
+        self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="fake-restconf", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8443
+    server = FakeRestconfServer(port=port).start()
+    print(f"Fake RESTCONF server on https://127.0.0.1:{server.port}")
+    while True:
+        time.sleep(3600)
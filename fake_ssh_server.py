@@ -0,0 +1,259 @@
+# --------------------------------------------------------------
+# Local stand-in for an IOS-XE SSH CLI (offline testing)
+# --------------------------------------------------------------
+#
+# An interactive shell with the IOS prompts netmiko looks for (R1#,
+# R1(config)#, R1(config-if)#) and the commands netmiko_final and
+# ansible_banner send: terminal setup, show ip interface brief,
+# show running-config, show banner motd, interface / no interface,
+# description, ip address, [no] shutdown and banner motd. Interfaces are
+# those of a fake_netconf_server.FakeRouter, so the SSH, NETCONF and
+# RESTCONF stand-ins of one router share their state.
+#
+#   python fake_ssh_server.py [port]
+
+import socket
+import sys
+import threading
+import time
+
+import paramiko
+from lxml import etree
+
+from fake_netconf_server import FakeRouter, host_key
+
+
+class _SSHServer(paramiko.ServerInterface):
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        return True
+
+
+class _Shell:
+    def __init__(self, server, channel):
+        self.server = server
+        self.router = server.router
+        self.channel = channel
+        self.mode = "exec"        # exec, config, config-if
+        self.interface = None     # interface being configured
+
+    def prompt(self):
+        suffix = {"exec": "#", "config": "(config)#", "config-if": "(config-if)#"}[self.mode]
+        return self.server.hostname + suffix
+
+    def send(self, text):
+        self.channel.sendall(text.replace("\n", "\r\n").encode())
+
+    def run(self):
+        self.send(self.prompt())
+        buffer = ""
+        last = ""
+        while True:
+            data = self.channel.recv(4096)
+            if not data:
+                return
+            for char in data.decode(errors="replace"):
+                # "\r\n" is one line end; NUL is netmiko's is_alive() probe
+                if char == "\n" and last == "\r" or char == "\x00":
+                    last = char
+                    continue
+                last = char
+                if char in "\r\n":
+                    line, buffer = buffer, ""
+                    if not self.handle_line(line):
+                        return
+                else:
+                    buffer += char
+
+    def handle_line(self, line):
+        command = line.strip()
+        if command:
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            self.server.count_command()
+        if command in ("exit", "logout") and self.mode == "exec":
+            self.send(line + "\n")
+            self.channel.close()
+            return False
+        output = self.execute(command)
+        self.send(line + "\n" + (output + "\n" if output else "") + self.prompt())
+        return True
+
+    def execute(self, command):
+        words = command.split()
+        if not words:
+            return ""
+        if self.mode == "exec":
+            return self.exec_command(command, words)
+        return self.config_command(command, words)
+
+    # ---------------- exec mode ----------------
+
+    def exec_command(self, command, words):
+        if words[0] == "terminal":
+            return ""
+        if words[:2] in (["configure", "terminal"], ["conf", "t"]):
+            self.mode = "config"
+            return "Enter configuration commands, one per line.  End with CNTL/Z."
+        if command.startswith("show ip interface brief"):
+            return self.ip_brief(words[4] if len(words) > 4 else None)
+        if command == "show running-config":
+            return self.running_config()
+        if command == "show banner motd":
+            return self.router_motd()
+        return "% Invalid input detected at '^' marker."
+
+    def ip_brief(self, name=None):
+        lines = ["Interface              IP-Address      OK? Method Status                Protocol"]
+        with self.router.lock:
+            for intf_name, intf in self.router.interfaces.items():
+                if name and intf_name != name:
+                    continue
+                ip = intf["ipv4"][0][0] if intf["ipv4"] else "unassigned"
+                status = "up" if intf["enabled"] else "administratively down"
+                method = "manual" if intf["ipv4"] else "unset"
+                lines.append(f"{intf_name:<23}{ip:<16}YES {method:<7}{status:<22}{intf['oper']}")
+        return "\n".join(lines)
+
+    def running_config(self):
+        lines = ["!", f"hostname {self.server.hostname}", "!"]
+        with self.router.lock:
+            for name, intf in self.router.interfaces.items():
+                lines.append(f"interface {name}")
+                if intf["description"]:
+                    lines.append(f" description {intf['description']}")
+                for ip, mask in intf["ipv4"]:
+                    lines.append(f" ip address {ip} {mask}")
+                if not intf["ipv4"]:
+                    lines.append(" no ip address")
+                if not intf["enabled"]:
+                    lines.append(" shutdown")
+                lines.append("!")
+        if self.router_motd():
+            lines.append(f"banner motd ^C{self.router_motd()}^C")
+        lines.append("end")
+        body = "\n".join(lines)
+        return f"Building configuration...\n\nCurrent configuration : {len(body)} bytes\n{body}"
+
+    def router_motd(self):
+        return getattr(self.router, "motd", "")
+
+    # ---------------- config mode ----------------
+
+    def config_command(self, command, words):
+        if words[0] == "end":
+            self.mode, self.interface = "exec", None
+            return ""
+        if words[0] == "exit":
+            self.mode, self.interface = ("config", None) if self.mode == "config-if" else ("exec", None)
+            return ""
+        if words[0] == "interface" and len(words) == 2:
+            with self.router.lock:
+                if words[1] not in self.router.interfaces:
+                    # a new interface with the defaults, nothing to merge into it yet
+                    self.router.merge_interface(words[1], etree.Element("interface"))
+            self.router.notify(words[1])
+            self.mode, self.interface = "config-if", words[1]
+            return ""
+        if words[:2] == ["no", "interface"] and len(words) == 3:
+            with self.router.lock:
+                if words[2] not in self.router.interfaces:
+                    return "% Invalid input detected at '^' marker."
+                del self.router.interfaces[words[2]]
+            self.router.notify(words[2])
+            return ""
+        if words[:2] == ["banner", "motd"] and len(command) > len("banner motd "):
+            text = command[len("banner motd "):]
+            delimiter = text[0]
+            self.router.motd = text[1:].split(delimiter, 1)[0]
+            return ""
+        if self.mode == "config-if":
+            return self.interface_command(words)
+        return "% Invalid input detected at '^' marker."
+
+    def interface_command(self, words):
+        with self.router.lock:
+            intf = self.router.interfaces[self.interface]
+            if words[0] == "description":
+                intf["description"] = " ".join(words[1:])
+            elif words[:2] == ["ip", "address"] and len(words) == 4:
+                intf["ipv4"] = [(words[2], words[3])]
+            elif words == ["shutdown"] or words == ["no", "shutdown"]:
+                intf["enabled"] = words[0] == "no"
+                intf["admin"] = intf["oper"] = "up" if intf["enabled"] else "down"
+            else:
+                return "% Invalid input detected at '^' marker."
+        self.router.notify(self.interface)
+        return ""
+
+
+class FakeSshServer:
+    """Serve the CLI of one FakeRouter on host:port; port 0 picks a free port."""
+
+    def __init__(self, router=None, host="127.0.0.1", port=0, latency=0.0, hostname="R1"):
+        self.router = router or FakeRouter()
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.hostname = hostname
+        self.command_count = 0
+        self._lock = threading.Lock()
+        self._socket = None
+
+    def count_command(self):
+        with self._lock:
+            self.command_count += 1
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(50)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept, name="fake-ssh", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._socket:
+            self._socket.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        transport = paramiko.Transport(client)
+        transport.add_server_key(host_key())
+        try:
+            transport.start_server(server=_SSHServer())
+            channel = transport.accept(20)
+            if channel is None:
+                return
+            _Shell(self, channel).run()
+        except (paramiko.SSHException, EOFError, OSError):
+            pass
+        finally:
+            transport.close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 2222
+    server = FakeSshServer(port=port).start()
+    print(f"Fake SSH CLI on 127.0.0.1:{server.port}")
+    while True:
+        time.sleep(3600)
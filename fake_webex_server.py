@@ -0,0 +1,207 @@
+# --------------------------------------------------------------
+# Local stand-in for the Webex messages API (offline testing)
+# --------------------------------------------------------------
+#
+# Enough of /v1/messages for ipa2025_final and webex_client:
+#   GET  /v1/messages?roomId=&max=[&beforeMessage=]  newest first, with a Link "next" header
+#   GET  /v1/messages/<id>
+#   POST /v1/messages  JSON or multipart (file uploads)
+# Messages typed by users are added with add_message(); what the bot posts
+# is kept in posts (and shows up in the room, like on Webex).
+#
+#   python fake_webex_server.py [port]
+#   WEBEX_API_URL=http://127.0.0.1:<port>/v1 python ipa2025_final.py
+
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, Nagle would hold the body back ~40 ms
+    disable_nagle_algorithm = True
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def begin(self):
+        """Count the call, wait the injected latency; False when the call is throttled."""
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        if self.fake.count_request():
+            self.reply(429, {"message": "Too Many Requests"}, {"Retry-After": str(self.fake.retry_after)})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.begin():
+            return
+        url = urlparse(self.path)
+        if url.path.startswith("/v1/messages/"):
+            message = self.fake.find(url.path.rsplit("/", 1)[-1])
+            if message is None:
+                return self.reply(404, {"message": "Message not found"})
+            return self.reply(200, message)
+        if url.path != "/v1/messages":
+            return self.reply(404, {"message": "Not found"})
+
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        page_size = int(query.get("max", 50))
+        items = self.fake.room_messages(query.get("roomId"), query.get("beforeMessage"))
+        page = items[:page_size]
+        headers = {}
+        if len(items) > page_size:
+            next_url = (f"http://{self.headers['Host']}/v1/messages?roomId={query.get('roomId')}"
+                        f"&max={page_size}&beforeMessage={page[-1]['id']}")
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        self.reply(200, {"items": page}, headers)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if not self.begin():
+            return
+        if urlparse(self.path).path != "/v1/messages":
+            return self.reply(404, {"message": "Not found"})
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            fields = dict(re.findall(rb'name="(\w+)"[^\r\n]*\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', body, re.S))
+            room_id = fields.get(b"roomId", b"").decode()
+            text = fields.get(b"text", b"").decode()
+            files = [len(fields.get(b"files", b""))]
+        else:
+            data = json.loads(body or b"{}")
+            room_id, text, files = data.get("roomId"), data.get("text", ""), []
+        self.reply(200, self.fake.post(room_id, text, files))
+
+
+class FakeWebex:
+    """Serve the messages API on http://host:port/v1; port 0 picks a free port.
+
+    throttle_every=N answers every Nth call with 429 and Retry-After.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, throttle_every=0, retry_after=1,
+                 bot_email="bot@webex.bot"):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.bot_email = bot_email
+        self.request_count = 0
+        self.throttled = 0
+        self.messages = []   # oldest first
+        self.posts = []      # (time.monotonic(), message) of what the bot posted
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def count_request(self):
+        """Count a call; True when it is to be throttled."""
+        with self._cond:
+            self.request_count += 1
+            if self.throttle_every and self.request_count % self.throttle_every == 0:
+                self.throttled += 1
+                return True
+            return False
+
+    def _new_message(self, room_id, text, email):
+        message = {
+            "id": f"msg-{next(self._ids)}",
+            "roomId": room_id,
+            "roomType": "group",
+            "text": text,
+            "personEmail": email,
+            "created": now_iso(),
+        }
+        self.messages.append(message)
+        return message
+
+    def add_message(self, room_id, text, email="student@example.com"):
+        """A user typing text in the room."""
+        with self._cond:
+            return dict(self._new_message(room_id, text, email))
+
+    def post(self, room_id, text, files=()):
+        with self._cond:
+            message = self._new_message(room_id, text, self.bot_email)
+            if files:
+                message["files"] = [f"file-{message['id']}-{i}" for i, _ in enumerate(files)]
+            self.posts.append((time.monotonic(), message))
+            self._cond.notify_all()
+            return dict(message)
+
+    def find(self, message_id):
+        with self._cond:
+            return next((dict(m) for m in self.messages if m["id"] == message_id), None)
+
+    def room_messages(self, room_id, before=None):
+        """Messages of a room, newest first, older than the before message ID."""
+        with self._cond:
+            items = [m for m in reversed(self.messages) if m["roomId"] == room_id]
+        if before:
+            ids = [m["id"] for m in items]
+            items = items[ids.index(before) + 1:] if before in ids else []
+        return [dict(m) for m in items]
+
+    def wait_posts(self, count, timeout=30):
+        """Wait until the bot posted count messages in total; returns the posts."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.posts) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return list(self.posts)
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="fake-webex", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server = FakeWebex(port=port).start()
+    print(f"Fake Webex API on {server.url}")
+    while True:
+        time.sleep(3600)
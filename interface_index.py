@@ -0,0 +1,207 @@
+# --------------------------------------------------------------
+# In-memory index of every interface of every router
+# --------------------------------------------------------------
+#
+# The collector reads the whole ietf-interfaces config and state tables of
+# the watched routers (over NETCONF or RESTCONF, INDEX_METHOD) every
+# INDEX_INTERVAL seconds, and on demand, into the index. "/66070220 down"
+# and "/66070220 find <ip>" answer from the index without touching a router.
+#
+# Refreshes are incremental: one small read of the interface names and the
+# interfaces-state last-change timestamps tells which interfaces appeared,
+# went away or changed state, and only those are read in full. last-change
+# only moves with the state of an interface, so every INDEX_FULL_EVERY
+# refreshes the whole table is read again for config-only changes (addresses).
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import netconf_final
+import restconf_final
+import tracing
+
+INDEX_METHOD = os.environ.get("INDEX_METHOD", "netconf")
+INDEX_INTERVAL = float(os.environ.get("INDEX_INTERVAL", "60"))  # 0: on demand only
+INDEX_FULL_EVERY = int(os.environ.get("INDEX_FULL_EVERY", "10"))
+INDEX_WORKERS = int(os.environ.get("INDEX_WORKERS", "8"))
+
+BACKENDS = {"netconf": netconf_final, "restconf": restconf_final}
+
+
+class RouterTable:
+    def __init__(self, records):
+        self.records = records      # name -> netconf_xml.InterfaceRecord
+        self.collected = time.time()
+        self.refreshes = 0          # incremental refreshes since the last full read
+
+
+class InterfaceIndex:
+    """Interface records by router, with the routers and interfaces of each IPv4 address."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routers = {}     # router -> RouterTable
+        self._addresses = {}   # address -> set of (router, interface name)
+
+    def _unindex(self, router, record):
+        for address in record.ipv4:
+            owners = self._addresses.get(address)
+            if owners is not None:
+                owners.discard((router, record.name))
+                if not owners:
+                    del self._addresses[address]
+
+    def _index(self, router, record):
+        for address in record.ipv4:
+            self._addresses.setdefault(address, set()).add((router, record.name))
+
+    def replace(self, router, records):
+        """Store the whole table of a router."""
+        with self._lock:
+            old = self._routers.get(router)
+            for record in old.records.values() if old else ():
+                self._unindex(router, record)
+            for record in records.values():
+                self._index(router, record)
+            self._routers[router] = RouterTable(records)
+
+    def update(self, router, records, removed=()):
+        """Store the records of some interfaces of a router and drop the removed ones."""
+        with self._lock:
+            table = self._routers[router]
+            for name in list(removed) + list(records):
+                old = table.records.pop(name, None)
+                if old is not None:
+                    self._unindex(router, old)
+            for name, record in records.items():
+                table.records[name] = record
+                self._index(router, record)
+            table.collected = time.time()
+            table.refreshes += 1
+
+    def table(self, router):
+        with self._lock:
+            return self._routers.get(router)
+
+    def collected(self, routers):
+        """{router: time of its last refresh} of the routers that are in the index."""
+        with self._lock:
+            return {r: self._routers[r].collected for r in routers if r in self._routers}
+
+    def down(self, routers):
+        """[(router, record)] of the interfaces whose oper-status is not up, in router order."""
+        result = []
+        with self._lock:
+            for router in routers:
+                table = self._routers.get(router)
+                if table is None:
+                    continue
+                for name in sorted(table.records):
+                    record = table.records[name]
+                    if record.oper is not None and record.oper != "up":
+                        result.append((router, record))
+        return result
+
+    def find(self, address, routers=None):
+        """[(router, record)] of the interfaces that have the address."""
+        with self._lock:
+            owners = sorted(self._addresses.get(address, ()))
+            return [(router, self._routers[router].records[name]) for router, name in owners
+                    if routers is None or router in routers]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "routers": len(self._routers),
+                "interfaces": sum(len(t.records) for t in self._routers.values()),
+                "addresses": len(self._addresses),
+            }
+
+
+class Collector:
+    """Refresh the index from the routers, each read in the context (room credentials) it was watched in."""
+
+    def __init__(self, index, method=INDEX_METHOD, full_every=INDEX_FULL_EVERY, workers=INDEX_WORKERS):
+        self.index = index
+        self.backend = BACKENDS[method]
+        self.full_every = full_every
+        self.errors = {}      # router -> last error, cleared by a good refresh
+        self._contexts = {}   # router -> contextvars.Context
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="index")
+        self._thread = None
+        self._stop = threading.Event()
+
+    def watch(self, routers):
+        """Collect these routers from now on, as the current room."""
+        context = contextvars.copy_context()
+        with self._lock:
+            for router in routers:
+                self._contexts.setdefault(router, context)
+
+    def refresh(self, routers=None, full=False):
+        """Refresh routers (default: every watched one) at once; returns {router: error or None}."""
+        if routers is None:
+            with self._lock:
+                routers = list(self._contexts)
+        else:
+            self.watch(routers)
+        with self._lock:
+            contexts = [(router, self._contexts[router]) for router in routers]
+        futures = [(router, self._pool.submit(context.copy().run, self.refresh_router, router, full))
+                   for router, context in contexts]
+        return {router: future.result() for router, future in futures}
+
+    def refresh_router(self, router, full=False):
+        try:
+            with tracing.span("index.refresh", router=router) as span:
+                table = self.index.table(router)
+                if full or table is None or table.refreshes + 1 >= self.full_every:
+                    span.set(full=True)
+                    self.index.replace(router, self.backend.fetch_interface_table(router))
+                else:
+                    changed, removed = self.changes(router, table)
+                    span.set(full=False, changed=len(changed), removed=len(removed))
+                    records = self.backend.fetch_interface_table(router, sorted(changed)) if changed else {}
+                    self.index.update(router, records, removed)
+            self.errors.pop(router, None)
+            return None
+        except Exception as e:
+            print(f"Index: cannot refresh {router}: {e}")
+            self.errors[router] = str(e)
+            return str(e)
+
+    def changes(self, router, table):
+        """(names to read again, names gone) since the router was last read."""
+        last_changes, configured = self.backend.fetch_last_changes(router)
+        current = set(last_changes) | configured
+        removed = set(table.records) - current
+        changed = set()
+        for name in current:
+            record = table.records.get(name)
+            if record is None or record.last_change != last_changes.get(name) or record.configured != (name in configured):
+                changed.add(name)
+        return changed, removed
+
+    def start(self, interval=INDEX_INTERVAL):
+        """Refresh every watched router every interval seconds, in the background."""
+        if self._thread is None and interval > 0:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="index-collector", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.refresh()
+            self._stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+index = InterfaceIndex()
+collector = Collector(index)
@@ -0,0 +1,147 @@
+# --------------------------------------------------------------
+# Interface specs for bulk provisioning, from YAML or CSV
+# --------------------------------------------------------------
+#
+# YAML, a list under "interfaces" (or the list itself):
+#   interfaces:
+#     - name: Loopback100
+#       ip: 10.100.0.1/24          # or ip + netmask
+#       description: lab loopback
+#     - name: GigabitEthernet2.10
+#       ip: 192.168.10.1
+#       netmask: 255.255.255.0
+#       enabled: false
+#     - name: Loopback101
+#       operation: delete
+#
+# CSV, one interface per row:
+#   name,ip,netmask,description,enabled,operation
+#   Loopback100,10.100.0.1,255.255.255.0,lab loopback,true,
+#
+# Missing fields are left as they are on the router; operation is "merge"
+# (default) or "delete".
+
+import csv
+import ipaddress
+import os
+
+import yaml
+
+# specs named in bot commands are looked up here
+SPEC_DIR = os.environ.get("PROVISION_SPEC_DIR", "provision")
+
+OPERATIONS = ("merge", "delete")
+
+
+class SpecError(ValueError):
+    pass
+
+
+class Interface:
+    def __init__(self, name, ip=None, netmask=None, description=None, enabled=None, operation="merge"):
+        self.name = name
+        self.ip = ip
+        self.netmask = netmask
+        self.description = description
+        self.enabled = enabled
+        self.operation = operation
+
+    @property
+    def type(self):
+        """ietf-interfaces type (iana-if-type identity) from the interface name."""
+        if self.name.startswith("Loopback"):
+            return "softwareLoopback"
+        if "." in self.name:
+            return "l2vlan"
+        return "ethernetCsmacd"
+
+    def __repr__(self):
+        return f"Interface({self.name!r}, {self.operation})"
+
+
+def parse_bool(value, field, name):
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text == "":
+        return None
+    if text in ("true", "yes", "1", "up", "enabled"):
+        return True
+    if text in ("false", "no", "0", "down", "disabled", "shutdown"):
+        return False
+    raise SpecError(f"{name}: {field} must be true or false, not {value!r}")
+
+
+def make_interface(entry, row):
+    """Validate one spec entry (dict) and return an Interface."""
+    entry = {key.strip().lower(): value for key, value in entry.items() if key}
+    entry = {key: value.strip() if isinstance(value, str) else value for key, value in entry.items()}
+    name = entry.get("name")
+    if not name:
+        raise SpecError(f"entry {row}: name is missing")
+    name = str(name)
+    operation = entry.get("operation") or "merge"
+    if operation not in OPERATIONS:
+        raise SpecError(f"{name}: operation must be one of {', '.join(OPERATIONS)}")
+
+    ip = entry.get("ip") or None
+    netmask = entry.get("netmask") or None
+    if ip is not None:
+        ip = str(ip)
+        # a bare address without mask is a /24, like the Loopback<student id> one
+        if netmask is None and "/" not in ip:
+            netmask = "255.255.255.0"
+        try:
+            address = ipaddress.IPv4Interface(ip if netmask is None else f"{ip}/{netmask}")
+        except ValueError as e:
+            raise SpecError(f"{name}: {e}")
+        ip, netmask = str(address.ip), str(address.netmask)
+    elif netmask is not None:
+        raise SpecError(f"{name}: netmask without ip")
+
+    description = entry.get("description")
+    return Interface(
+        name,
+        ip=ip,
+        netmask=netmask,
+        description=str(description) if description not in (None, "") else None,
+        enabled=parse_bool(entry.get("enabled"), "enabled", name),
+        operation=operation,
+    )
+
+
+def parse(text, fmt):
+    """Interfaces of a spec given as text; fmt is "yaml" or "csv"."""
+    if fmt == "csv":
+        entries = list(csv.DictReader(line for line in text.splitlines() if line.strip() and not line.startswith("#")))
+    else:
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise SpecError(f"invalid YAML: {e}")
+        entries = data.get("interfaces") if isinstance(data, dict) else data
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            raise SpecError("expected a list of interfaces")
+
+    interfaces = [make_interface(entry, row) for row, entry in enumerate(entries, 1)]
+    if not interfaces:
+        raise SpecError("no interfaces in spec")
+    names = [intf.name for intf in interfaces]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise SpecError(f"{', '.join(duplicates)} listed more than once")
+    return interfaces
+
+
+def load(path):
+    """Interfaces of a .yaml/.yml/.csv spec file."""
+    fmt = "csv" if path.lower().endswith(".csv") else "yaml"
+    with open(path) as f:
+        return parse(f.read(), fmt)
+
+
+def spec_path(name, spec_dir=SPEC_DIR):
+    """Path of a spec named in a bot command; only plain file names inside spec_dir are allowed."""
+    if os.path.basename(name) != name or name.startswith("."):
+        raise SpecError(f"invalid spec name {name!r}")
+    return os.path.join(spec_dir, name)
@@ -0,0 +1,86 @@
+# --------------------------------------------------------------
+# Router list from the Ansible "hosts" inventory
+# --------------------------------------------------------------
+
+import ipaddress
+import os
+
+INVENTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hosts")
+
+
+def load_routers(path=INVENTORY_PATH):
+    """Return the router IPs of the inventory, in file order."""
+    routers = []
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return routers
+
+    for line in lines:
+        line = line.strip()
+        # skip groups, [group:vars] sections, comments and key=value vars lines
+        if not line or line.startswith(("#", ";", "[")):
+            continue
+        fields = line.split()
+        if "=" in fields[0]:
+            continue
+        host = fields[0]
+        for field in fields[1:]:
+            if field.startswith("ansible_host="):
+                host = field.split("=", 1)[1]
+        if host not in routers:
+            routers.append(host)
+    return routers
+
+
+def router_address(router):
+    """IPv4Address of an inventory entry, None for a host name."""
+    try:
+        return ipaddress.IPv4Address(router)
+    except ValueError:
+        return None
+
+
+def is_fanout_target(target):
+    return target == "all" or "-" in target or "," in target
+
+
+def expand_targets(target, routers=None):
+    """Turn "all", "10.0.15.61-65" or "10.0.15.61,10.0.15.63" into inventory IPs.
+
+    Returns None if any address is malformed or not in the inventory.
+    """
+    if routers is None:
+        routers = load_routers()
+    if target == "all":
+        return list(routers)
+
+    ips = []
+    for part in target.split(","):
+        if "-" in part:
+            first, last = part.split("-", 1)
+            try:
+                start = ipaddress.IPv4Address(first)
+                # "10.0.15.61-65" or "10.0.15.61-10.0.15.65"
+                if "." in last:
+                    end = ipaddress.IPv4Address(last)
+                else:
+                    end = ipaddress.IPv4Address(first.rsplit(".", 1)[0] + "." + last)
+            except ValueError:
+                return None
+            if end < start:
+                return None
+            # every address of the range must be a router: pick them from the inventory
+            # instead of listing the range, which may be as large as 0.0.0.0-255.255.255.255
+            in_range = sorted(address for address in map(router_address, routers)
+                              if address is not None and start <= address <= end)
+            if len(in_range) != int(end) - int(start) + 1:
+                return None
+            ips.extend(str(address) for address in in_range)
+        else:
+            ips.append(part)
+
+    if not ips or any(ip not in routers for ip in ips):
+        return None
+    return ips
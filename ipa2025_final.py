@@ -8,17 +8,33 @@
 
 import os
 import time
-import json
-import requests
 from dotenv import load_dotenv
-from requests_toolbelt.multipart.encoder import MultipartEncoder
 from enum import Enum
+from functools import partial
 
 import restconf_final
 import netconf_final
-from netmiko_final import get_motd
-from ansible_banner import set_motd
+import netmiko_final
+import drivers
+import loopback
+import ansible_banner
+from ansible_banner import set_motd_batch
 import glob
+import webex_webhook
+from message_cursor import MessageCursor, SeenMessages
+from command_executor import CommandExecutor, QueueFull
+import inventory
+import state_cache
+import rooms
+import webex_client
+import config_backup
+import interface_spec
+import netconf_bulk
+import restconf_bulk
+import tracing
+from job_journal import journal
+import interface_index
+from interface_index import collector
 
 #######################################################################################
 # 2. Assign the Webex access token to the variable ACCESS_TOKEN using environment variables.
@@ -27,20 +43,53 @@ load_dotenv()
 
 ACCESS_TOKEN = os.environ["WEBX_ACCESS_TOKEN"]
 
+# "poll" (default) asks Webex for the latest message every second,
+# "webhook" waits for messages.created events on a local HTTP server,
+# "async" runs the polling loop and device I/O on asyncio (async_bot.py).
+BOT_MODE = os.environ.get("BOT_MODE", "poll")
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+# public URL Webex should call, the webhook is registered on start when set
+WEBHOOK_TARGET_URL = os.environ.get("WEBHOOK_TARGET_URL")
+
+MESSAGES_URL = webex_client.MESSAGES_URL
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGES = 10
+
+# polling many rooms: a room without new messages is polled less often (up to
+# POLL_MAX_INTERVAL seconds), and a room handles at most ROOM_MESSAGES_PER_TURN
+# messages before the next room gets its turn
+POLL_INTERVAL = 1
+POLL_MAX_INTERVAL = float(os.environ.get("POLL_MAX_INTERVAL", "4"))
+ROOM_MESSAGES_PER_TURN = int(os.environ.get("ROOM_MESSAGES_PER_TURN", "5"))
+
+# worker threads for device commands, and how many commands may wait per router
+EXECUTOR_WORKERS = int(os.environ.get("EXECUTOR_WORKERS", "5"))
+EXECUTOR_MAX_QUEUE = int(os.environ.get("EXECUTOR_MAX_QUEUE", "5"))
+executor = CommandExecutor(workers=EXECUTOR_WORKERS, max_queue=EXECUTOR_MAX_QUEUE)
+
 #######################################################################################
 # 3. Prepare parameters get the latest message for messages API.
 
 class Method(Enum):
     RESTCONF = "restconf"
     NETCONF = "netconf"
+    SSH = "ssh"
+    # fastest healthy backend per router, with failover
+    AUTO = "auto"
 
-current_method = None
+# routers in the Ansible inventory; each room may use all or part of them
+ROUTERS = inventory.load_routers()
 
+# rooms served by this process (rooms.yaml), or the single ROOM_ID room.
+# Each room keeps its own prefix, selected method, routers and credentials;
+# the last processed message of a room is kept in its state file, so a
+# restart neither replays nor skips commands.
+ROOMS = rooms.load() or [rooms.DEFAULT]
 
-# Defines a variable that will hold the roomId
-roomIdToGetMessages = (
-    os.environ["ROOM_ID"]
-)
+# Defines a variable that will hold the roomId (single room setup)
+roomIdToGetMessages = os.environ.get("ROOM_ID")
 
 def is_ip(s: str) -> bool:
     parts = s.split(".")
@@ -55,169 +104,679 @@ def is_ip(s: str) -> bool:
     return True
 
 def validate_ip(ip):
-    """Validate if IP is in range 10.0.15.61-65"""
+    """Validate if IP is one of the routers of the current room (10.0.15.61-65 by default)"""
+    return ip in rooms.current().routers
+
+
+# 4. Work out what a message asks for.
+# parse_message() answers local commands right away and turns device commands
+# into a job, so the job can run on the executor next to other routers.
+# Jobs are functools.partial objects, so a runtime can look at what they call.
+
+def reply(responseMessage):
+    return None, lambda: responseMessage
+
+def traced(backend, ip, command, job, *args):
+    """Run a router job as one "bot.command" span; a reply starting with "Error" marks it failed."""
+    with tracing.span(tracing.COMMAND_SPAN, router=ip, command=command, backend=backend) as root:
+        result = job(*args)
+        text = result[0] if isinstance(result, tuple) else result
+        if str(text).startswith("Error"):
+            root.set(ok=False)
+        return result
+
+def run_device_command(ip, command, method, fresh=False):
+    return traced(method.value, ip, command, drivers.get(method.value).execute, command, ip, fresh)
+
+def motd_driver():
+    """Name of the driver for a MOTD command: the room's method, SSH when none is selected."""
+    method = rooms.current().current_method
+    return method.value if method is not None else "ssh"
+
+def run_get_motd(ip, driver, fresh=False):
+    return traced(driver, ip, "motd", drivers.get(driver).get_motd, ip, fresh)
+
+def run_set_motd(ip, motd_message, driver):
+    responseMessage = traced(driver, ip, "motd", drivers.get(driver).set_motd, ip, motd_message)
+    print(f"Set motd response: {responseMessage}")
+    return responseMessage
+
+def run_set_motd_batch(ips, motd_message):
+    started = time.monotonic()
+    results = set_motd_batch({ip: motd_message for ip in ips})
+    lines = [f"motd on {len(ips)} routers ({time.monotonic() - started:.1f} s):"]
+    for ip in ips:
+        lines.append(f"{ip}: {results[ip]}")
+    return "\n".join(lines)
+
+# longest diff shown in a showrun reply, Webex messages are limited to ~7000 characters
+SHOWRUN_DIFF_LIMIT = 5000
+
+def run_showrun(ip):
+    """Back up the running-config; reply with it attached only when it changed since the last backup.
+
+    Returns the reply text, or (text, (path, filename)) when the config is attached.
+    """
+    return traced("ssh", ip, "showrun", backup_running_config, ip)
+
+def backup_running_config(ip):
     try:
-        parts = ip.split('.')
-        if len(parts) != 4:
-            return False
-        if parts[0] == '10' and parts[1] == '0' and parts[2] == '15':
-            last_octet = int(parts[3])
-            return 61 <= last_octet <= 65
-        return False
-    except:
-        return False
-
-while True:
-    # always add 1 second of delay to the loop to not go over a rate limit of API calls
-    time.sleep(1)
-
-    # the Webex Teams GET parameters
-    #  "roomId" is the ID of the selected room
-    #  "max": 1  limits to get only the very last message in the room
-    getParameters = {"roomId": roomIdToGetMessages, "max": 1}
-
-    # the Webex Teams HTTP header, including the Authoriztion
-    getHTTPHeader = {"Authorization": "Bearer " + ACCESS_TOKEN}
-
-# 4. Provide the URL to the Webex Teams messages API, and extract location from the received message.
-    
-    # Send a GET request to the Webex Teams messages API.
-    # - Use the GetParameters to get only the latest message.
-    # - Store the message in the "r" variable.
-    r = requests.get(
-        "https://webexapis.com/v1/messages",
-        params=getParameters,
-        headers=getHTTPHeader,
-    )
-    # verify if the retuned HTTP status code is 200/OK
-    if not r.status_code == 200:
-        raise Exception(
-            "Incorrect reply from Webex Teams API. Status code: {}".format(r.status_code)
-        )
-
-    # get the JSON formatted returned data
-    json_data = r.json()
-
-    # check if there are any messages in the "items" array
-    if len(json_data["items"]) == 0:
-        raise Exception("There are no messages in the room.")
-
-    # store the array of messages
-    messages = json_data["items"]
-    
-    # store the text of the first message in the array
-    message = messages[0]["text"]
-    print("Received message: " + message)
+        config = netmiko_final.get_running_config(ip)
+    except Exception as e:
+        print(f"Error: showrun on {ip}: {e}")
+        return f"Error: Cannot get running-config of {ip}"
+    backup = config_backup.save(ip, config)
+    if not backup.changed:
+        return f"Running-config of {ip} unchanged since last backup ({backup.hash[:12]})"
+
+    text = "show running config"
+    if backup.diff:
+        diff = backup.diff
+        if len(diff) > SHOWRUN_DIFF_LIMIT:
+            diff = diff[:SHOWRUN_DIFF_LIMIT] + "\n... (diff truncated)"
+        text += f" of {ip}, changed since {backup.previous[:12]}:\n{diff}"
+    filename = f"show_run_{rooms.student_id()}_{ip}.txt"
+    return text, (backup.path, filename)
+
+def parse_message(message):
+    """Return (router ip, job) for a bot command, or None if the message is not for us.
+
+    job() returns the reply text; ip is None when no router is involved.
+    ip is a list for a fan-out (job(router) then builds the job of each
+    router) and a tuple for one job that holds all of those routers at once.
+    The message is parsed for the current room (rooms.use()).
+    """
+    room = rooms.current()
 
     # check if the text of the message starts with the magic character "/" followed by your studentID and a space and followed by a command name
     #  e.g.  "/66070123 create"
-    if message.startswith("/66070220"):
-
-        parts = message.split()
-
-        if len(parts) == 1:
-            responseMessage = "Error: No method specified"
-        # Check if method selection (restconf/netconf)
-        elif len(parts) == 2:
-            method_str = parts[1].lower()
-            if method_str == "restconf":
-                current_method = Method.RESTCONF
-                responseMessage = "Ok: Restconf"
-            elif method_str == "netconf":
-                current_method = Method.NETCONF
-                responseMessage = "Ok: Netconf"
-            elif current_method is None:
-                responseMessage = "Error: No method specified"
-            elif is_ip(method_str):
-                responseMessage = "Error: No command found"
-            elif method_str in ["create", "delete", "enable", "disable", "status", "showrun", "gigabit_status"]:
-                responseMessage = "No IP specified"
-            else:
-                responseMessage = "Error: No command found"
-
-        elif len(parts) == 3:
-            ip = parts[1]
-            command = parts[2]
-
-            if command == "motd":
-                responseMessage = get_motd(ip)
-            elif not validate_ip(ip):
-                responseMessage = "Error: IP out of range"
-            elif current_method is None:
-                responseMessage = "Error: No method specified"
-            else:
-                if current_method == Method.RESTCONF:
-                    if command == "create":
-                        responseMessage = restconf_final.create(ip)
-                    elif command == "delete":
-                        responseMessage = restconf_final.delete(ip)
-                    elif command == "enable":
-                        responseMessage = restconf_final.enable(ip)
-                    elif command == "disable":
-                        responseMessage = restconf_final.disable(ip)
-                    elif command == "status":
-                        responseMessage = restconf_final.status(ip)
-                    else:
-                        responseMessage = "Error: Unknown command"
-                elif current_method == Method.NETCONF:
-                    if command == "create":
-                        responseMessage = netconf_final.create(ip)
-                    elif command == "delete":
-                        responseMessage = netconf_final.delete(ip)
-                    elif command == "enable":
-                        responseMessage = netconf_final.enable(ip)
-                    elif command == "disable":
-                        responseMessage = netconf_final.disable(ip)
-                    elif command == "status":
-                        responseMessage = netconf_final.status(ip)
-                    else:
-                        responseMessage = "Error: Unknown command"
-        elif len(parts) >= 4:
-            ip = parts[1]
-            command = parts[2]
-            motd_message = " ".join(parts[3:])
-
-            if not validate_ip(ip):
-                responseMessage = "Error: IP out of range"
-            else:
-                if command == "motd":
-                    responseMessage = set_motd(ip, motd_message)
-                    print(f"Set motd response: {responseMessage}")
-                else:
-                    responseMessage = "Error: Unknown command"
-
-        # other commands only send text, or no attached file.
-        postData =  {"roomId": roomIdToGetMessages, "text": responseMessage}
-        postData = json.dumps(postData)
-
-            # the Webex Teams HTTP headers, including the Authoriztion and Content-Type
-        HTTPHeaders = {
-            "Authorization": "Bearer " + ACCESS_TOKEN,
-            "Content-Type": "application/json"
-        }
-
-        
+    if not message.startswith(room.prefix):
+        return None
+
+    parts = message.split()
+
+    # a trailing "--fresh" skips the state cache and reads the router again
+    fresh = parts[-1] == "--fresh"
+    if fresh:
+        parts = parts[:-1]
+
+    if len(parts) == 1:
+        return reply("Error: No method specified")
+    # Check if method selection (restconf/netconf/ssh/auto)
+    elif len(parts) == 2:
+        method_str = parts[1].lower()
+        if method_str == "restconf":
+            room.current_method = Method.RESTCONF
+            return reply("Ok: Restconf")
+        elif method_str == "netconf":
+            room.current_method = Method.NETCONF
+            return reply("Ok: Netconf")
+        elif method_str == "ssh":
+            room.current_method = Method.SSH
+            return reply("Ok: SSH")
+        elif method_str == "auto":
+            room.current_method = Method.AUTO
+            return reply("Ok: Auto")
+        elif method_str == "cache":
+            return reply("State cache: {hit} hits, {miss} misses, hit rate {hit_rate}, {size} entries".format(**state_cache.cache.stats()))
+        elif method_str == "webex":
+            return reply("Webex API: {calls} calls, {throttled} throttled, {retries} retries ({retry_wait} s), "
+                         "{errors} errors, {posted} posted, {coalesced} replies coalesced".format(**webex().stats()))
+        elif method_str == "stats":
+            return reply(format_stats(tracing.stats(), drivers.auto.report()))
+        elif method_str == "down":
+            # answered from the interface index; --fresh reads the routers again first
+            if fresh:
+                return "index", partial(run_down, room.routers, True)
+            return reply(format_down(room.routers))
+        elif method_str == "gigabit_status":
+            # every router of the room at once, over SSH
+            return parse_fanout("all", "gigabit_status")
+        elif room.current_method is None:
+            return reply("Error: No method specified")
+        elif is_ip(method_str):
+            return reply("Error: No command found")
+        elif method_str in ["create", "delete", "enable", "disable", "status", "showrun"]:
+            return reply("No IP specified")
+        else:
+            return reply("Error: No command found")
+
+    elif len(parts) == 3:
+        ip = parts[1]
+        command = parts[2]
+
+        # "/66070220 find 172.2.20.1": which router and interface has the address
+        if ip == "find":
+            if not is_ip(command):
+                return reply("Error: Use find <ip address>")
+            if fresh:
+                return "index", partial(run_find, command, room.routers, True)
+            return reply(format_find(command, room.routers))
+        # "/66070220 all status" or "/66070220 10.0.15.61-65 create"
+        elif inventory.is_fanout_target(ip):
+            return parse_fanout(ip, command, fresh)
+        # every command below reaches the router, only the room's own routers
+        elif not validate_ip(ip):
+            return reply("Error: IP out of range")
+        elif command == "motd":
+            return ip, partial(run_get_motd, ip, motd_driver(), fresh)
+        elif command == "showrun":
+            # the running-config is always read over SSH
+            return ip, partial(run_showrun, ip)
+        elif command == "gigabit_status":
+            return ip, partial(run_gigabit_status, ip)
+        elif room.current_method is None:
+            return reply("Error: No method specified")
+        else:
+            # the method is fixed now, a later "/66070220 netconf" must not change a queued job
+            method = room.current_method
+            return ip, partial(run_device_command, ip, command, method, fresh)
+    else:
+        ip = parts[1]
+        command = parts[2]
+        motd_message = " ".join(parts[3:])
+
+        # "/66070220 10.0.15.61 provision loopbacks.yaml": every interface of the spec in one
+        # RESTCONF PATCH (method restconf) or one NETCONF transaction (any other method)
+        if command == "provision":
+            return parse_provision(ip, parts[3:])
+        # "/66070220 all motd <text>": one batched MOTD push to every router
+        if inventory.is_fanout_target(ip) and command == "motd":
+            ips = inventory.expand_targets(ip, room.routers)
+            if ips is None:
+                return reply("Error: IP out of range")
+            return tuple(ips), partial(run_set_motd_batch, ips, motd_message)
+        elif not validate_ip(ip):
+            return reply("Error: IP out of range")
+        elif command == "motd":
+            return ip, partial(run_set_motd, ip, motd_message, motd_driver())
+        else:
+            return reply("Error: Unknown command")
+
+def parse_provision(target, args):
+    """Return (ip or list of ips, job) applying an interface spec of interface_spec.SPEC_DIR."""
+    room = rooms.current()
+    if len(args) != 1:
+        return reply("Error: Use provision <spec file>")
+    try:
+        interfaces = interface_spec.load(interface_spec.spec_path(args[0]))
+    except (OSError, interface_spec.SpecError) as e:
+        return reply(f"Error: Cannot load {args[0]}: {e}")
+    bulk = restconf_bulk if room.current_method == Method.RESTCONF else netconf_bulk
+    if inventory.is_fanout_target(target):
+        ips = inventory.expand_targets(target, room.routers)
+        if ips is None:
+            return reply("Error: IP out of range")
+        return ips, lambda ip: partial(run_provision, ip, interfaces, bulk)
+    if not validate_ip(target):
+        return reply("Error: IP out of range")
+    return target, partial(run_provision, target, interfaces, bulk)
+
+def run_provision(ip, interfaces, bulk=netconf_bulk):
+    backend = "restconf" if bulk is restconf_bulk else "netconf"
+    return traced(backend, ip, "provision", provision_interfaces, ip, interfaces, bulk)
+
+def provision_interfaces(ip, interfaces, bulk):
+    try:
+        result = bulk.provision(ip, interfaces)
+    except Exception as e:
+        print(f"Error: provision on {ip}: {e}")
+        return f"Error: Cannot provision {len(interfaces)} interfaces on {ip}"
+    if not result.ok:
+        tracing.set_attribute(ok=False)
+    return result.message()
+
+def format_stats(stats, auto_report=None):
+    """Latency percentiles of the recent commands per router and backend, one line each.
+
+    auto_report (drivers.AutoDriver.report()) adds what the auto method measured per backend.
+    """
+    if not stats:
+        lines = ["No commands traced yet"]
+    else:
+        lines = [f"Last {tracing.TRACE_STATS_WINDOW} commands per router and backend:"]
+        for (router, backend), s in sorted(stats.items(), key=lambda entry: tuple(map(str, entry[0]))):
+            lines.append(f"{router} {backend}: {s['n']} commands, p50 {s['p50_ms']} ms, "
+                         f"p95 {s['p95_ms']} ms, p99 {s['p99_ms']} ms, {s['errors']} errors")
+    if auto_report:
+        lines.append("Auto method backends:")
+        for key, health in sorted(auto_report.items()):
+            latency = f"{health['latency_ms']} ms" if health["latency_ms"] is not None else "no latency yet"
+            lines.append(f"{key}: {latency}, success rate {health['success_rate']:.0%}")
+    return "\n".join(lines)
+
+def run_down(routers, fresh=False):
+    if fresh:
+        collector.refresh(routers)
+    return format_down(routers)
+
+def run_find(address, routers, fresh=False):
+    if fresh:
+        collector.refresh(routers)
+    return format_find(address, routers)
+
+def index_note(routers):
+    """How old the index of the routers is, and which ones it does not have (yet)."""
+    collected = interface_index.index.collected(routers)
+    note = ""
+    if collected:
+        note = f" (index {time.time() - min(collected.values()):.0f} s old)"
+    missing = [r for r in routers if r not in collected or r in collector.errors]
+    if missing:
+        note += f"\nNot indexed: {', '.join(missing)}"
+    return note
+
+def routers_label(routers):
+    return f"{len(routers)} router{'s' if len(routers) != 1 else ''}"
+
+def format_down(routers):
+    """Interfaces whose oper-status is not up, on the routers of the room."""
+    down = interface_index.index.down(routers)
+    if not down:
+        return f"No interface down on {routers_label(routers)}{index_note(routers)}"
+    lines = [f"{len(down)} interface{'s' if len(down) != 1 else ''} down{index_note(routers)}"]
+    for router, record in down:
+        lines.append(f"{router} {record.name} ({record.admin}/{record.oper})")
+    return "\n".join(lines)
+
+def format_find(address, routers):
+    found = interface_index.index.find(address, routers)
+    if not found:
+        return f"{address} not found on {routers_label(routers)}{index_note(routers)}"
+    return "\n".join(f"{address} is on {router} {record.name} ({record.admin}/{record.oper})"
+                     for router, record in found)
+
+FANOUT_COMMANDS = ["create", "delete", "enable", "disable", "status", "motd", "gigabit_status"]
+
+def run_gigabit_status(ip):
+    return traced("ssh", ip, "gigabit_status", read_gigabit_status, ip)
+
+def read_gigabit_status(ip):
+    try:
+        return netmiko_final.gigabit_status(ip)
+    except Exception as e:
+        print(f"Error: gigabit_status on {ip}: {e}")
+        return "Error: Cannot get interface status"
+
+def command_label(message):
+    # "/66070220 all status" -> "status"; "/66070220 gigabit_status" -> "gigabit_status"
+    words = message.split()
+    return " ".join(words[2:]) or words[-1]
+
+def parse_fanout(target, command, fresh=False):
+    """Return (list of ips, job_for) where job_for(ip) builds the job of one router."""
+    room = rooms.current()
+    ips = inventory.expand_targets(target, room.routers)
+    if ips is None:
+        return reply("Error: IP out of range")
+    if command not in FANOUT_COMMANDS:
+        return reply("Error: Unknown command")
+    if command == "motd":
+        driver = motd_driver()
+        return ips, lambda ip: partial(run_get_motd, ip, driver, fresh)
+    if command == "gigabit_status":
+        return ips, lambda ip: partial(run_gigabit_status, ip)
+    if room.current_method is None:
+        return reply("Error: No method specified")
+    method = room.current_method
+    return ips, lambda ip: partial(run_device_command, ip, command, method, fresh)
+
+def format_fanout(command, results, elapsed):
+    lines = [f"{command} on {len(results)} routers ({elapsed:.1f} s):"]
+    for ip, result, seconds in results:
+        lines.append(f"{ip}: {result} ({seconds:.1f} s)")
+    return "\n".join(lines)
+
+# 5. Webex Teams API calls.
+# One webex_client.WebexClient per access token: a pooled session with the
+# Authorization header set once, rate limited, 429 and 5xx retried.
+
+def webex(room=None):
+    # the Webex client of the room (its access token)
+    room = room or rooms.current()
+    return webex_client.client(room.access_token or ACCESS_TOKEN)
+
+def get_new_messages(cursor, room=None):
+    """Return the messages of the room newer than the cursor, oldest first."""
+    room = room or rooms.current()
+    with tracing.span("webex.poll", buffered=True, room=room.name) as poll:
+        new_messages = read_new_messages(cursor, room)
+        poll.set(messages=len(new_messages))
+        # an idle room polls all day, keep only the polls that found something
+        if not new_messages:
+            poll.drop()
+    return new_messages
+
+def read_new_messages(cursor, room):
+    client = webex(room)
+    next_url = None
+    new_messages = []
+    for _ in range(MESSAGES_MAX_PAGES):
+        # Send a GET request to the Webex Teams messages API.
+        #  "roomId" is the ID of the selected room
+        #  "max" is the page size, older pages are followed until the cursor is reached
+        #  the "next" link already carries roomId, max and beforeMessage
+        r = client.list_messages(room.room_id, MESSAGES_PAGE_SIZE, url=next_url)
+
+        # messages come newest first
+        messages = r.json()["items"]
+        for item in messages:
+            if not cursor.is_new(item):
+                return list(reversed(new_messages))
+            new_messages.append(item)
+
+        next_page = r.links.get("next")
+        if not messages or not next_page:
+            break
+        next_url = next_page["url"]
+
+    return list(reversed(new_messages))
+
+def start_cursor(cursor, room):
+    # one message is enough to know where the room stands
+    items = webex(room).list_messages(room.room_id, 1).json()["items"]
+    cursor.start(items[0] if items else None)
+
+def get_message(message_id, room=None):
+    # webhook events only carry the message ID, fetch just that message
+    return webex(room).get_message(message_id)
+
 # 6. Complete the code to post the message to the Webex Teams room.
 
-        # The Webex Teams POST JSON data for command showrun
-        # - "roomId" is is ID of the selected room
-        # - "text": is always "show running config"
-        # - "files": is a tuple of filename, fileobject, and filetype.
-
-        # the Webex Teams HTTP headers, including the Authoriztion and Content-Type
-        
-        # Prepare postData and HTTPHeaders for command showrun
-        # Need to attach file if responseMessage is 'ok'; 
-        # Read Send a Message with Attachments Local File Attachments
-        # https://developer.webex.com/docs/basics for more detail
-
-        # Post the call to the Webex Teams message API.
-        r = requests.post(
-            "https://webexapis.com/v1/messages",
-            data=postData,
-            headers=HTTPHeaders,
-        )
-        if not r.status_code == 200:
-            raise Exception(
-                "Incorrect reply from Webex Teams API. Status code: {}".format(r.status_code)
-            )
+def post_message(responseMessage, room=None, on_posted=None):
+    # replies go to the room being served, unless a room is given
+    # (executor callbacks run on worker threads and pass their room)
+    room = room or rooms.current()
+
+    # The Webex Teams POST JSON data for command showrun
+    # - "roomId" is is ID of the selected room
+    # - "text": is always "show running config"
+    # - "files": is a tuple of filename, fileobject, and filetype.
+
+    # Prepare postData and HTTPHeaders for command showrun
+    # Need to attach file if responseMessage is 'ok'; 
+    # Read Send a Message with Attachments Local File Attachments
+    # https://developer.webex.com/docs/basics for more detail
+
+    # showrun replies are (text, (path, filename)), the file is streamed with MultipartEncoder
+    attachment = None
+    if isinstance(responseMessage, tuple):
+        responseMessage, attachment = responseMessage
+
+    # other commands only send text, or no attached file. Replies are queued
+    # and sent by the client's outbox thread, replies that pile up for a room
+    # go out as one message; a failed post is logged, it never stops the bot.
+    # on_posted() runs once Webex took the reply (the job journal marks it replied).
+    webex(room).post_later(room.room_id, responseMessage, attachment, on_posted)
+
+def process(item, room=None):
+    room = room or rooms.current()
+    with rooms.use(room), tracing.span("bot.message", room=room.name, message_id=item.get("id")):
+        dispatch(item, room)
+
+def dispatch(item, room):
+    message = item["text"]
+    print(f"Received message in {room.name}: " + message)
+    if journal.replayed(item.get("id")):
+        # journaled before a crash, recover_jobs() took care of it
+        print(f"Skipping {item.get('id')}, already journaled")
+        return
+    parsed = parse_message(message)
+    if parsed is None:
+        return
+    ip, job = parsed
+    reply_to_room = partial(post_message, room=room)
+    if ip is None:
+        reply_to_room(job())
+        return
+
+    command = command_label(message)
+    if isinstance(ip, list):
+        # one job per router, all running at once; a single reply when the slowest is done
+        started = time.monotonic()
+        jobs = [journal_job(item, router, job(router)) for router in ip]
+
+        def replied_all():
+            for job_id, _ in jobs:
+                journal.replied(job_id)
+
+        def reply_all(results):
+            reply_to_room(format_fanout(command, results, time.monotonic() - started), on_posted=replied_all)
+
+        executor.submit_many([(router, job) for router, (_, job) in zip(ip, jobs)], reply_all, label=command)
+        return
+
+    # device commands run on the executor (in the room's context); replies are posted from the worker
+    if isinstance(ip, tuple):
+        # a batch holds the slot of each of its routers, so nothing else runs on them meanwhile
+        job_id, job = journal_job(item, list(ip), job)
+        submit = partial(executor.submit_batch, list(ip))
+    else:
+        job_id, job = journal_job(item, ip, job)
+        submit = partial(executor.submit, ip)
+    try:
+        ahead = submit(job, partial(reply_journaled, job_id, reply_to_room), label=command)
+    except QueueFull as busy:
+        reply_to_room(f"Error: {busy} is busy, too many queued commands")
+        journal.replied(job_id, "busy")
+        return
+    if ahead:
+        reply_to_room(f"Busy: {', '.join(ip) if isinstance(ip, tuple) else ip}, queued #{ahead}")
+
+# 6b. Job journal (job_journal.py): every device command is journaled when
+# received, started, done and replied, so a restart can tell what a crash
+# left unfinished. Jobs that never started run again; finished jobs whose
+# reply was lost get it posted; interrupted loopback writes are checked
+# against the router first and only run again when not applied; an
+# interrupted provision is reported, not repeated.
+
+# incomplete jobs older than this are reported instead of run again
+JOURNAL_RESUME_WITHIN = float(os.environ.get("JOURNAL_RESUME_WITHIN", "900"))
+
+# how each method reads the loopback state, to check an interrupted write
+READ_STATE = {
+    "restconf": restconf_final.read_state,
+    "netconf": netconf_final.read_state,
+    "ssh": netmiko_final.read_state,
+    "auto": netconf_final.read_state,
+}
+
+def journal_received(item, router):
+    """Journal a device command of the current room; returns its job id."""
+    room = rooms.current()
+    method = room.current_method.value if room.current_method else None
+    # by room ID: the name of a room may change between runs
+    return journal.received(room.room_id, item.get("id"), item["text"], router, method)
+
+def journal_job(item, router, job):
+    """Returns (job id, job that journals its run)."""
+    job_id = journal_received(item, router)
+    return job_id, partial(run_journaled, job_id, job)
+
+def run_journaled(job_id, job):
+    journal.started(job_id)
+    result = job()
+    journal.done(job_id, result[0] if isinstance(result, tuple) else result)
+    return result
+
+def reply_journaled(job_id, reply_to_room, result):
+    # "replied" once the reply is posted; if it never is, a restart posts the "done" result
+    reply_to_room(result, on_posted=partial(journal.replied, job_id))
+
+def rebuild_job(entry):
+    """The job of a journaled command, parsed again as its room and method stood then."""
+    room = rooms.current()
+    selected = room.current_method
+    room.current_method = Method(entry["method"]) if entry.get("method") else None
+    try:
+        parsed = parse_message(entry["text"])
+    finally:
+        room.current_method = selected
+    if parsed is None or parsed[0] is None:
+        return None
+    ip, job = parsed
+    return job(entry["router"]) if isinstance(ip, list) else job
+
+def applied_before_restart(job):
+    """The reply of an interrupted write that the router shows as done, else None."""
+    if getattr(job, "func", None) is run_device_command:
+        ip, command, method, _ = job.args
+        if command not in loopback.STATE_AFTER:
+            return None
+        # admin/oper status, every backend's state has them (only NETCONF's has "enabled")
+        state = READ_STATE[method.value](ip, fresh=True)
+        if command == "create":
+            applied = state is not None
+        elif command == "delete":
+            applied = state is None
+        elif command == "enable":
+            applied = loopback.is_up(state)
+        else:
+            applied = loopback.is_down(state)
+        if applied:
+            return loopback.result_message(command, True, drivers.get(method.value).method, rooms.student_id())
+    elif getattr(job, "func", None) is run_set_motd:
+        ip, motd_message, driver = job.args
+        if drivers.get(driver).get_motd(ip, True) == motd_message.strip():
+            return ansible_banner.OK
+    return None
+
+def journaled_command(entry):
+    # a batch is journaled with the list of its routers
+    router = entry["router"]
+    return f"{command_label(entry['text'])} on {', '.join(router) if isinstance(router, list) else router}"
+
+def reconcile(entry):
+    """Finish one journaled job after a restart; returns the reply for its room."""
+    command = journaled_command(entry)
+    if "done" in entry["events"]:
+        return f"{command} (before restart): {entry['result']}"
+    age = time.time() - entry["received"]
+    if age > JOURNAL_RESUME_WITHIN:
+        return f"Error: {command} was interrupted by a restart {age / 60:.0f} min ago, not run again"
+    job = rebuild_job(entry)
+    if job is None:
+        return f"Error: {command} was interrupted by a restart and cannot be run again"
+    if "started" in entry["events"]:
+        if getattr(job, "func", None) is run_provision:
+            return f"Error: {command} was interrupted by a restart, check the router and provision again"
+        applied = applied_before_restart(job)
+        if applied is not None:
+            journal.done(entry["job"], applied)
+            return f"{command} (before restart): {applied}"
+    result = run_journaled(entry["job"], job)
+    return f"{command} (resumed after restart): {result[0] if isinstance(result, tuple) else result}"
+
+def recover_jobs():
+    """Reconcile the jobs the last run left unfinished and post the outcome to their rooms."""
+    by_id = {room.room_id: room for room in ROOMS}
+    for entry in journal.recover():
+        room = by_id.get(entry["room"])
+        if room is None:
+            journal.replied(entry["job"], "room gone")
+            continue
+        with rooms.use(room), tracing.span("bot.recover", room=room.name, router=entry["router"]):
+            try:
+                text = reconcile(entry)
+            except Exception as e:
+                print(f"Error: recovering '{entry['text']}': {e}")
+                text = f"Error: {journaled_command(entry)} was interrupted by a restart"
+            print(f"Recovered job {entry['job']} in {room.name}: {text}")
+            post_message(text, room, on_posted=partial(journal.replied, entry["job"], "recovered"))
+
+# 7. Main loops: polling (default) or webhook receiver.
+
+def run_polling():
+    cursors = {}
+    next_poll = {}
+    interval = {}
+    for room in ROOMS:
+        cursor = cursors[room] = MessageCursor(room.state_file)
+        if not cursor.started:
+            # first run: start after the newest message instead of replaying the room
+            start_cursor(cursor, room)
+        next_poll[room] = time.monotonic()
+        interval[room] = POLL_INTERVAL
+
+    while True:
+        # always add 1 second of delay to the loop to not go over a rate limit of API calls
+        time.sleep(POLL_INTERVAL)
+        # round robin: each due room gets one turn of at most ROOM_MESSAGES_PER_TURN messages;
+        # messages left over stay behind the cursor and are read again on the next turn
+        for room in ROOMS:
+            if time.monotonic() < next_poll[room]:
+                continue
+            try:
+                items = get_new_messages(cursors[room], room)
+            except Exception as e:
+                print(f"Error polling {room.name}: {e}")
+                items = []
+            for item in items[:ROOM_MESSAGES_PER_TURN]:
+                process(item, room)
+                cursors[room].advance(item)
+            # busy rooms stay at 1 second, idle rooms back off
+            if items:
+                interval[room] = POLL_INTERVAL
+            else:
+                interval[room] = min(interval[room] * 2, POLL_MAX_INTERVAL)
+            next_poll[room] = time.monotonic() + interval[room]
+
+def webhook_state_file(room):
+    # bot_state_<hash>.json -> bot_state_<hash>_webhook.json
+    return room.state_file[:-len(".json")] + "_webhook.json"
+
+def run_webhook():
+    by_id = {room.room_id: room for room in ROOMS}
+    # events of concurrent requests can come in any order: remember message IDs, not a position
+    seen = {room.room_id: SeenMessages(webhook_state_file(room)) for room in ROOMS}
+    # the HTTP handler only queues message IDs; rooms take turns, so a burst in one
+    # room does not hold back the others
+    events = rooms.FairQueue()
+    server = webex_webhook.start_server(
+        WEBHOOK_HOST, WEBHOOK_PORT, lambda message_id, room_id: events.put(room_id, message_id),
+        room_id=set(by_id), secret=WEBHOOK_SECRET,
+    )
+    print(f"Webhook receiver listening on {WEBHOOK_HOST}:{server.server_port}")
+    if not WEBHOOK_SECRET and not webex_webhook.is_loopback(WEBHOOK_HOST):
+        print(f"Warning: WEBHOOK_SECRET is not set, anyone who can reach {WEBHOOK_HOST}:{server.server_port} "
+              "can send events; set it or listen on 127.0.0.1")
+    if WEBHOOK_TARGET_URL:
+        for room in ROOMS:
+            webex_webhook.register_webhook(room.access_token or ACCESS_TOKEN, WEBHOOK_TARGET_URL, room.room_id,
+                                           WEBHOOK_SECRET, name=f"ipa2025-bot {room.name}")
+    while True:
+        room_id, message_id = events.get()
+        room = by_id[room_id]
+        try:
+            item = get_message(message_id, room)
+        except Exception as e:
+            print(f"Error fetching message {message_id} of {room.name}: {e}")
+            continue
+        # the event only claims a room, the message itself must be in it
+        if item.get("roomId") != room.room_id:
+            print(f"Ignoring message {message_id}: not in {room.name}")
+            continue
+        # Webex may deliver the same event twice
+        if seen[room_id].is_new(item):
+            process(item, room)
+            seen[room_id].add(item)
+
+if __name__ == "__main__":
+    # the interface index and the subscribers read each router with the credentials of its room
+    for room in ROOMS:
+        with rooms.use(room):
+            collector.watch(room.routers)
+            if os.environ.get("NETCONF_SUBSCRIBE") == "1":
+                netconf_final.subscribe(room.routers)
+    collector.start()
+    # commands a crash left unfinished, before new ones come in
+    recover_jobs()
+    if BOT_MODE == "webhook":
+        run_webhook()
+    elif BOT_MODE == "async":
+        import asyncio
+        import sys
+        import async_bot
+        asyncio.run(async_bot.main(sys.modules[__name__]))
+    else:
+        run_polling()
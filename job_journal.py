@@ -0,0 +1,189 @@
+# --------------------------------------------------------------
+# Append-only journal of device commands, for recovery after a crash
+# --------------------------------------------------------------
+#
+# Every command that goes to a router is journaled as it moves along:
+#   received   the message, its room (Webex room ID), router and selected method
+#   started    a worker began running it against the router
+#   done       the reply text it produced
+#   replied    the reply was posted to the room (or the job was given up)
+# one JSON object per line in JOURNAL_FILE, e.g.
+#   {"job": "9f2c...", "event": "received", "time": 1760000000.0, "room": "Y2lzY29zcGFyazovL3VzL1JPT00v...",
+#    "message_id": "Y2lz...", "text": "/66070220 10.0.15.61 create", "router": "10.0.15.61",
+#    "method": "netconf"}
+# JOURNAL_FILE="" turns the journal off.
+#
+# Writes stay off the command path: append() only queues the record. A
+# writer thread takes everything queued, waits JOURNAL_COMMIT_MS for more
+# records to join the batch, then writes them and fsyncs once (group commit).
+# The queue is drained on a normal or crashing exit (atexit); a power loss
+# may lose the last batch.
+#
+# On start, recover() returns the jobs that have no "replied" record and
+# rewrites the file with only those, so it never grows past one run. The
+# cursor of a room may not have moved past a message that was journaled
+# before the crash; replayed() tells the bot to skip such a message.
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+JOURNAL_FILE = os.environ.get("JOURNAL_FILE", "jobs.jsonl")
+JOURNAL_COMMIT_MS = float(os.environ.get("JOURNAL_COMMIT_MS", "5"))
+
+EVENTS = ["received", "started", "done", "replied"]
+
+
+class Journal:
+    def __init__(self, path=JOURNAL_FILE, commit_ms=JOURNAL_COMMIT_MS):
+        self.path = path
+        self.commit_interval = commit_ms / 1000
+        self.commits = 0
+        self.records = 0
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._file = None
+        self._thread = None
+        self._recovered_messages = set()  # message IDs journaled by the last run
+
+    # ---------------- writing ----------------
+
+    def append(self, job, event, **fields):
+        """Queue one record of a job; returns at once."""
+        if not self.path:
+            return
+        self._start()
+        self._queue.put({"job": job, "event": event, "time": time.time(), **fields})
+
+    def received(self, room, message_id, text, router, method):
+        """Journal a new command; returns its job id."""
+        job = os.urandom(8).hex()
+        self.append(job, "received", room=room, message_id=message_id, text=text, router=router, method=method)
+        return job
+
+    def started(self, job):
+        self.append(job, "started")
+
+    def done(self, job, result):
+        self.append(job, "done", result=result)
+
+    def replied(self, job, note=None):
+        if note is None:
+            self.append(job, "replied")
+        else:
+            self.append(job, "replied", note=note)
+
+    def flush(self, timeout=None):
+        """Wait until everything appended so far is on disk."""
+        if not self.path or self._thread is None:
+            return True
+        synced = threading.Event()
+        self._queue.put(synced)
+        return synced.wait(timeout)
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+            self._file.close()
+            self._file = None
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._file = open(self.path, "a")
+                self._thread = threading.Thread(target=self._run, name="job-journal", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # records of the other workers running right now join this commit
+            if self.commit_interval:
+                time.sleep(self.commit_interval)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [item for item in batch if isinstance(item, dict)]
+            if records:
+                self._file.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self.commits += 1
+                self.records += len(records)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is None for item in batch):
+                return
+
+    # ---------------- recovery ----------------
+
+    def read(self):
+        """{job: merged fields, with "events"} of every job in the file, in the order received."""
+        jobs = {}
+        try:
+            f = open(self.path)
+        except OSError:
+            return jobs
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line of a crash may be cut short
+                    continue
+                entry = jobs.setdefault(record.pop("job"), {"events": []})
+                entry["events"].append(record.pop("event"))
+                if entry["events"][-1] == "received":
+                    entry["received"] = record["time"]
+                entry.update(record)
+        return jobs
+
+    def replayed(self, message_id):
+        """True for a message the last run had already journaled."""
+        return message_id in self._recovered_messages
+
+    def recover(self):
+        """Jobs left unfinished by the last run, oldest first; keeps only their records in the file.
+
+        Each is a dict of its journaled fields plus "job" and "events".
+        """
+        if not self.path or self._thread is not None:
+            return []
+        jobs = self.read()
+        self._recovered_messages = {entry.get("message_id") for entry in jobs.values()} - {None}
+        pending = [dict(entry, job=job) for job, entry in jobs.items()
+                   if "replied" not in entry["events"] and "received" in entry["events"]]
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except OSError:
+            return pending
+        keep = {entry["job"] for entry in pending}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for line in lines:
+                try:
+                    if json.loads(line)["job"] in keep:
+                        f.write(line)
+                except (ValueError, KeyError):
+                    continue
+            f.flush()
+            os.fsync(f.fileno())
+        # replace in one step so a crash never leaves a half written file
+        os.replace(tmp, self.path)
+        return pending
+
+
+journal = Journal()
+atexit.register(journal.close)
@@ -0,0 +1,91 @@
+# --------------------------------------------------------------
+# Shared decision logic for the Loopback<student id> commands
+# --------------------------------------------------------------
+#
+# restconf_final and netconf_final read the interface once and pass the
+# result here as a state dict:
+#   None                                   -> interface does not exist
+#   {"admin": "up", "oper": "up", ...}     -> interface exists
+# decide() tells the caller whether a write is needed or which reply to send.
+
+import netconf_subscriber
+
+CANNOT = {
+    "create": "Cannot create",
+    "delete": "Cannot delete",
+    "enable": "Cannot enable",
+    "disable": "Cannot shutdown",
+}
+
+DONE = {
+    "create": "created",
+    "delete": "deleted",
+    "enable": "enabled",
+    "disable": "shutdowned",
+}
+
+
+# state of the loopback after a successful write, used to refresh the state cache
+STATE_AFTER = {
+    "create": {"enabled": True, "admin": "up", "oper": "up"},
+    "delete": None,
+    "enable": {"enabled": True, "admin": "up", "oper": "up"},
+    "disable": {"enabled": False, "admin": "down", "oper": "down"},
+}
+
+
+def remember_write(cache, ip, interface, command, ok):
+    """Write-through: store the new state after our own write, forget it if the write failed."""
+    if ok:
+        cache.put((ip, interface), STATE_AFTER[command])
+        netconf_subscriber.remember(ip, interface, STATE_AFTER[command])
+    else:
+        forget(cache, ip, interface)
+
+
+def forget(cache, ip, interface):
+    """The interface may have changed in a way we do not know, read it from the router next time."""
+    cache.invalidate(ip, interface)
+    netconf_subscriber.remember(ip, interface, netconf_subscriber.MISS)
+
+
+def is_up(state):
+    return state is not None and state.get("admin") == "up" and state.get("oper") == "up"
+
+
+def is_down(state):
+    return state is not None and state.get("admin") == "down" and state.get("oper") == "down"
+
+
+def decide(command, state, method, student_id):
+    """Return (need_write, message); message is the reply when no write is needed."""
+    cannot = f"{CANNOT[command]}: Interface loopback {student_id}"
+    if command == "create":
+        return (state is None, None if state is None else cannot)
+    if state is None:
+        return (False, cannot)
+    if command == "enable" and is_up(state):
+        return (False, cannot)
+    if command == "disable" and is_down(state):
+        return (False, f"{cannot} (checked by {method})")
+    return (True, None)
+
+
+def result_message(command, ok, method, student_id):
+    if ok:
+        return f"Interface loopback {student_id} is {DONE[command]} successfully using {method}"
+    return f"{CANNOT[command]}: Interface loopback {student_id}"
+
+
+def error_message(command, method, student_id):
+    """Reply when the router could not be reached."""
+    if command == "status":
+        return status_message(None, method, student_id)
+    return result_message(command, False, method, student_id)
+
+
+def status_message(state, method, student_id):
+    if state is None:
+        return f"No Interface loopback {student_id} (checked by {method})"
+    status = "enabled" if state.get("admin") == "up" else "disabled"
+    return f"Interface loopback {student_id} is {status} (checked by {method})"
@@ -0,0 +1,119 @@
+# --------------------------------------------------------------
+# Cursor over Webex messages so every command runs exactly once
+# --------------------------------------------------------------
+#
+# The cursor is the "created" timestamp of the last processed message plus
+# the IDs seen at that timestamp (Webex timestamps are millisecond ISO
+# strings, several messages can share one). It is saved to a small JSON
+# file after each message so a restart resumes where the bot stopped. On
+# the first run the cursor starts after the newest message of the room, or
+# at ROOM_START when the room is empty, and is saved at once, so later
+# messages are never mistaken for the starting point.
+#
+# Webhook events can arrive in any order (concurrent HTTP requests), so the
+# webhook receiver keeps the IDs of the last SEEN_LIMIT processed messages
+# instead (SeenMessages): an older message arriving after a newer one is
+# still new.
+
+import json
+import os
+from collections import deque
+
+SEEN_LIMIT = int(os.environ.get("SEEN_LIMIT", "1000"))
+
+# before every message: the cursor of a room that had none yet
+ROOM_START = "1970-01-01T00:00:00.000Z"
+
+
+def save_json(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    # replace in one step so a crash never leaves a half written file
+    os.replace(tmp, path)
+
+
+class MessageCursor:
+    def __init__(self, path):
+        self.path = path
+        self.created = None
+        self.ids = []
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.created = state.get("created")
+        self.ids = state.get("ids", [])
+
+    def save(self):
+        save_json(self.path, {"created": self.created, "ids": self.ids})
+
+    @property
+    def started(self):
+        return self.created is not None
+
+    def start(self, newest=None):
+        """First run: begin after the newest message, at ROOM_START when there is none."""
+        if newest is not None:
+            self.advance(newest)
+        else:
+            self.created = ROOM_START
+            self.ids = []
+            self.save()
+
+    def is_new(self, item):
+        if self.created is None:
+            return True
+        if item["created"] != self.created:
+            return item["created"] > self.created
+        return item["id"] not in self.ids
+
+    def advance(self, item):
+        if item["created"] != self.created:
+            self.created = item["created"]
+            self.ids = []
+        self.ids.append(item["id"])
+        self.save()
+
+
+class SeenMessages:
+    """IDs of the last limit processed messages, whatever order they came in."""
+
+    def __init__(self, path, limit=SEEN_LIMIT):
+        self.path = path
+        self.ids = deque(maxlen=limit)
+        self._seen = set()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                ids = json.load(f)
+        except (OSError, ValueError):
+            return
+        for message_id in ids:
+            self._remember(message_id)
+
+    def save(self):
+        save_json(self.path, list(self.ids))
+
+    def is_new(self, item):
+        return item["id"] not in self._seen
+
+    def add(self, item):
+        self._remember(item["id"])
+        self.save()
+
+    def _remember(self, message_id):
+        if message_id in self._seen:
+            return
+        if len(self.ids) == self.ids.maxlen:
+            self._seen.discard(self.ids[0])
+        self.ids.append(message_id)
+        self._seen.add(message_id)
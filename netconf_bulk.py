@@ -0,0 +1,167 @@
+# --------------------------------------------------------------
+# Bulk interface provisioning over NETCONF, all or nothing
+# --------------------------------------------------------------
+#
+# Every interface of a spec (interface_spec.py) goes into one <config> and
+# one <edit-config>, whatever the number of interfaces.
+#
+# With the :candidate capability the edit goes to the candidate datastore
+# (locked, stale changes discarded first) and a failed edit is discarded.
+# With :confirmed-commit as well, the commit is a confirmed commit: the
+# interfaces are read back from running and only then is the commit
+# confirmed. If the check fails the commit is cancelled, and if the bot
+# dies in between the router rolls back by itself after CONFIRM_TIMEOUT.
+#
+# Routers without :candidate get the edit on running with
+# rollback-on-error, so one bad interface leaves none of them applied.
+#
+#   python netconf_bulk.py <spec.yaml|spec.csv> <router ip>...
+
+import os
+import sys
+from xml.sax.saxutils import escape
+
+from ncclient.operations import RPCError
+
+import interface_spec
+import loopback
+import netconf_final
+import netconf_xml
+import tracing
+from state_cache import cache
+
+CONFIRM_TIMEOUT = int(os.environ.get("NETCONF_CONFIRM_TIMEOUT", "120"))
+
+IF_NS = netconf_xml.IF_NS
+IP_NS = netconf_xml.IP_NS
+
+
+class Result:
+    def __init__(self, router, count, ok, datastore, error=None, atomic=True):
+        self.router = router
+        self.count = count
+        self.ok = ok
+        self.datastore = datastore  # "candidate, confirmed commit", "candidate" or "running"
+        self.error = error
+        self.atomic = atomic        # False: a failed edit may be partly applied
+
+    def message(self):
+        count = f"{self.count} interface{'s' if self.count != 1 else ''}"
+        if self.ok:
+            return f"{count} provisioned successfully using {netconf_final.METHOD} ({self.datastore})"
+        if not self.atomic:
+            return f"Cannot provision {count}: {self.error}, some may be applied"
+        return f"Cannot provision {count}: {self.error}, nothing applied"
+
+
+class VerifyError(Exception):
+    pass
+
+
+def interface_xml(intf):
+    if intf.operation == "delete":
+        return f'<interface operation="delete"><name>{escape(intf.name)}</name></interface>'
+    out = [f"<interface><name>{escape(intf.name)}</name>"]
+    if intf.description is not None:
+        out.append(f"<description>{escape(intf.description)}</description>")
+    out.append(f'<type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:{intf.type}</type>')
+    if intf.enabled is not None:
+        out.append(f"<enabled>{'true' if intf.enabled else 'false'}</enabled>")
+    if intf.ip is not None:
+        out.append(f'<ipv4 xmlns="{IP_NS}"><address><ip>{intf.ip}</ip><netmask>{intf.netmask}</netmask></address></ipv4>')
+    out.append("</interface>")
+    return "".join(out)
+
+
+def build_config(interfaces):
+    """One <config> holding every interface of the spec."""
+    body = "".join(interface_xml(intf) for intf in interfaces)
+    return f'<config><interfaces xmlns="{IF_NS}">{body}</interfaces></config>'
+
+
+def names_filter(interfaces):
+    names = "".join(f"<interface><name>{escape(intf.name)}</name></interface>" for intf in interfaces)
+    return f'<filter><interfaces xmlns="{IF_NS}">{names}</interfaces></filter>'
+
+
+def verify(m, interfaces):
+    """Read the interfaces back from running; raise VerifyError when the spec is not what is there."""
+    with tracing.span("netconf.get_config", source="running"):
+        present = netconf_xml.interface_names(m.get_config(source="running", filter=names_filter(interfaces)).data_ele)
+    missing = [intf.name for intf in interfaces if intf.operation == "merge" and intf.name not in present]
+    left = [intf.name for intf in interfaces if intf.operation == "delete" and intf.name in present]
+    if missing or left:
+        raise VerifyError(", ".join(
+            ([f"{', '.join(missing)} missing"] if missing else []) + ([f"{', '.join(left)} not deleted"] if left else [])))
+
+
+def commit_candidate(m, ip, interfaces, config):
+    confirmed = ":confirmed-commit" in m.server_capabilities
+    datastore = "candidate, confirmed commit" if confirmed else "candidate"
+    with m.locked("candidate"):
+        # edits another client left in the candidate must not go out with ours
+        m.discard_changes()
+        try:
+            with tracing.span("netconf.edit_config", router=ip, target="candidate"):
+                m.edit_config(target="candidate", config=config)
+        except RPCError as e:
+            m.discard_changes()
+            return Result(ip, len(interfaces), False, datastore, str(e))
+        if not confirmed:
+            with tracing.span("netconf.commit", router=ip):
+                m.commit()
+            return Result(ip, len(interfaces), True, datastore)
+
+        with tracing.span("netconf.commit", router=ip, confirmed=True, timeout=CONFIRM_TIMEOUT):
+            m.commit(confirmed=True, timeout=str(CONFIRM_TIMEOUT))
+        try:
+            verify(m, interfaces)
+            with tracing.span("netconf.commit", router=ip, confirming=True):
+                m.commit()
+        except (RPCError, VerifyError) as e:
+            with tracing.span("netconf.cancel_commit", router=ip):
+                m.cancel_commit()
+            m.discard_changes()
+            return Result(ip, len(interfaces), False, datastore, str(e))
+    return Result(ip, len(interfaces), True, datastore)
+
+
+def edit_running(m, ip, interfaces, config):
+    atomic = ":rollback-on-error" in m.server_capabilities
+    error_option = "rollback-on-error" if atomic else None
+    try:
+        with tracing.span("netconf.edit_config", router=ip, target="running", error_option=error_option):
+            m.edit_config(target="running", config=config, error_option=error_option)
+    except RPCError as e:
+        return Result(ip, len(interfaces), False, "running", str(e), atomic)
+    return Result(ip, len(interfaces), True, "running")
+
+
+def provision(ip, interfaces):
+    """Apply every interface of the spec on the router as one transaction; returns a Result.
+
+    Raises when the router cannot be reached. A Result that is not ok left
+    the router config as it was.
+    """
+    config = build_config(interfaces)
+    try:
+        with tracing.span("netconf.provision", router=ip, interfaces=len(interfaces)) as span, \
+                netconf_final.session(ip) as m:
+            if ":candidate" in m.server_capabilities:
+                result = commit_candidate(m, ip, interfaces, config)
+            else:
+                result = edit_running(m, ip, interfaces, config)
+            span.set(ok=result.ok, datastore=result.datastore)
+            return result
+    finally:
+        # the interfaces may have changed whatever the outcome, read them again next time
+        for intf in interfaces:
+            loopback.forget(cache, ip, intf.name)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("usage: python netconf_bulk.py <spec.yaml|spec.csv> <router ip>...")
+    spec = interface_spec.load(sys.argv[1])
+    for router in sys.argv[2:]:
+        print(f"{router}: {provision(router, spec).message()}")
@@ -3,217 +3,249 @@
 # --------------------------------------------------------------
 
 from ncclient import manager
+from ncclient.operations import RPCError
 from dotenv import load_dotenv
-import xmltodict
 import os
+from functools import partial
+from xml.sax.saxutils import escape
 
-load_dotenv()
-ROUTER_USER = os.environ.get("ROUTER_USER")
-ROUTER_PASS = os.environ.get("ROUTER_PASS")
-STUDENT_ID = "66070220"
-INTERFACE_NAME = f"Loopback{STUDENT_ID}"
+import loopback
+import rooms
+import netconf_subscriber
+import netconf_xml
+import tracing
+from state_cache import cache, MISS
+from session_pool import SessionPool
 
-def connect(ip):
-    return manager.connect(host=ip, port=830, username=ROUTER_USER, password=ROUTER_PASS, hostkey_verify=False, timeout=10)
+load_dotenv()
+# Router credentials, student ID and loopback name come from the room being served (rooms.py)
+
+NETCONF_IDLE_TIMEOUT = int(os.environ.get("NETCONF_IDLE_TIMEOUT", "300"))
+NETCONF_PORT = int(os.environ.get("NETCONF_PORT", "830"))
+
+def connect(ip, username=None, password=None):
+    if username is None:
+        username, password = rooms.credentials()
+    with tracing.span("netconf.connect", router=ip, port=NETCONF_PORT):
+        return manager.connect(host=ip, port=NETCONF_PORT, username=username, password=password, hostkey_verify=False, timeout=10)
+
+# One NETCONF session per router and credentials, shared by every call and every bot command
+pool = SessionPool(
+    connect=lambda key: connect(*key),
+    is_alive=lambda m: m.connected,
+    close=lambda m: m.close_session(),
+    idle_timeout=NETCONF_IDLE_TIMEOUT,
+    name="netconf",
+)
+
+def session(ip):
+    return pool.session((ip,) + rooms.credentials())
+
+def pool_stats():
+    return pool.stats()
+
+NETCONF_POLL_INTERVAL = int(os.environ.get("NETCONF_POLL_INTERVAL", "30"))
+
+# Optional: keep interfaces-state of these routers current in the background
+# (yang-push on-change, polling when the router has no yang-push).
+# The subscriber threads connect with the credentials of the current room.
+def subscribe(ips):
+    username, password = rooms.credentials()
+    for ip in ips:
+        netconf_subscriber.start(ip, partial(connect, username=username, password=password), NETCONF_POLL_INTERVAL)
 
 # --------------------------------------------------------------
 # Core functions
 # --------------------------------------------------------------
 
-# Create Loopback66070220 interface
-def create(ip):
-    # Define Netconf configuration for creating Loopback66070220 interface
-    netconf_config = f"""
-        <config>
-            <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-                <interface>
-                    <name>{INTERFACE_NAME}</name>
-                    <description>{STUDENT_ID} Loopback interface</description>
-                    <type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:softwareLoopback</type>
-                    <ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip">
-                        <address>
-                            <ip>172.2.20.1</ip>
-                            <netmask>255.255.255.0</netmask>
-                        </address>
-                    </ipv4>
-                </interface>
-            </interfaces>
-        </config>
-    """
+METHOD = "Netconf"
 
-    try:
-        checkExist = check_interface_exist(ip)
-        if (checkExist):
-            raise Exception(f"Cannot create: Interface loopback {STUDENT_ID}")
-        with connect(ip) as m:
-            netconf_reply = m.edit_config(target="running", config=netconf_config)
-            if "<ok/>" in str(netconf_reply): 
-                return f"Interface loopback {STUDENT_ID} is created successfully using Netconf"
-        return f"Cannot create: Interface loopback {STUDENT_ID}"
-    except: 
-        return f"Cannot create: Interface loopback {STUDENT_ID}"
+# Create Loopback66070220 interface
+def create(ip, fresh=False):
+    return run_or_report("create", ip, fresh)
 
 
 # Delete Loopback66070220 interface
-def delete(ip):
-    # Define Netconf configuration for deleting Loopback66070220 interface
-    netconf_config = f"""
-        <config>
-            <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-                <interface operation="delete">
-                    <name>{INTERFACE_NAME}</name>
-                </interface>
-            </interfaces>
-        </config>
-    """
-
-    try:
-        checkExist = check_interface_exist(ip)
-        if not (checkExist):
-            raise Exception(f"Cannot delete: Interface loopback {STUDENT_ID}")
-        with connect(ip) as m:
-            netconf_reply = m.edit_config(target="running", config=netconf_config)
-            if "<ok/>" in str(netconf_reply): 
-                return f"Interface loopback {STUDENT_ID} is deleted successfully using Netconf"
-        return f"Cannot delete: Interface loopback {STUDENT_ID}"
-    except: return f"Cannot delete: Interface loopback {STUDENT_ID}"
+def delete(ip, fresh=False):
+    return run_or_report("delete", ip, fresh)
 
 
 # Enable Loopback66070220 interface
-def enable(ip):
-    # Define Netconf configuration for enabling Loopback66070220 interface
-    netconf_config = f"""
-        <config>
-            <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-                <interface>
-                    <name>{INTERFACE_NAME}</name>
-                    <type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:softwareLoopback</type>
-                    <enabled>true</enabled>
-                </interface>
-            </interfaces>
-        </config>
-    """
+def enable(ip, fresh=False):
+    return run_or_report("enable", ip, fresh)
 
-    try:
-        checkExist = check_interface_exist(ip)
-        if not (checkExist):
-            raise Exception(f"Cannot enable: Interface loopback {STUDENT_ID}")
-
-        current_status = get_interface_status(ip)
-        if current_status and current_status['admin'] == 'up' and current_status['oper'] == 'up':
-            return f"Cannot enable: Interface loopback {STUDENT_ID}"
-
-        with connect(ip) as m:
-            netconf_reply = m.edit_config(target="running", config=netconf_config)
-            if "<ok/>" in str(netconf_reply): 
-                return f"Interface loopback {STUDENT_ID} is enabled successfully using Netconf"
-        return f"Cannot enable: Interface loopback {STUDENT_ID}"
-    except: 
-        return f"Cannot enable: Interface loopback {STUDENT_ID}"
+# Disable Loopback66070220 interface
+def disable(ip, fresh=False):
+    return run_or_report("disable", ip, fresh)
 
-# Enable Loopback66070220 interface
-def disable(ip):
-    # Define Netconf configuration for disabling Loopback66070220 interface
-    netconf_config = f"""
+
+
+# Get status of Loopback66070220 interface
+def status(ip, fresh=False):
+    return run_or_report("status", ip, fresh)
+
+# --------------------------------------------------------------
+# Helper functions
+# --------------------------------------------------------------
+
+# Netconf configuration sent by each command
+def netconf_config(command):
+    if command == "create":
+        # Define Netconf configuration for creating Loopback66070220 interface
+        return f"""
+            <config>
+                <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                    <interface>
+                        <name>{rooms.interface_name()}</name>
+                        <description>{rooms.student_id()} Loopback interface</description>
+                        <type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:softwareLoopback</type>
+                        <ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip">
+                            <address>
+                                <ip>{rooms.loopback_ip()}</ip>
+                                <netmask>255.255.255.0</netmask>
+                            </address>
+                        </ipv4>
+                    </interface>
+                </interfaces>
+            </config>
+        """
+    if command == "delete":
+        # Define Netconf configuration for deleting Loopback66070220 interface
+        return f"""
+            <config>
+                <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                    <interface operation="delete">
+                        <name>{rooms.interface_name()}</name>
+                    </interface>
+                </interfaces>
+            </config>
+        """
+    # Define Netconf configuration for enabling/disabling Loopback66070220 interface
+    enabled = "true" if command == "enable" else "false"
+    return f"""
         <config>
             <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
                 <interface>
-                    <name>{INTERFACE_NAME}</name>
+                    <name>{rooms.interface_name()}</name>
                     <type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:softwareLoopback</type>
-                    <enabled>false</enabled>
+                    <enabled>{enabled}</enabled>
                 </interface>
             </interfaces>
         </config>
     """
 
+# Read the interface once, decide with loopback.decide() and only then
+# send the edit-config, so a command costs at most two round trips.
+# Raises when the router cannot be reached (SSH/transport errors); an
+# <rpc-error> from a reachable router is reported as a failed command.
+def run(command, ip, fresh=False):
+    state = read_state(ip, fresh)
+    if command == "status":
+        return loopback.status_message(state, METHOD, rooms.student_id())
+
+    need_write, message = loopback.decide(command, state, METHOD, rooms.student_id())
+    if not need_write:
+        return message
     try:
-        checkExist = check_interface_exist(ip)
-        if not (checkExist):
-            raise Exception(f"Cannot shutdown: Interface loopback {STUDENT_ID}")
-
-        current_status = get_interface_status(ip)
-        if current_status and current_status['admin'] == 'down' and current_status['oper'] == 'down':
-            return f"Cannot enable: Interface loopback {STUDENT_ID} (checked by Netconf)"
-
-        with connect(ip) as m:
-            netconf_reply = m.edit_config(target="running", config=netconf_config)
-            if "<ok/>" in str(netconf_reply): 
-                return f"Interface loopback {STUDENT_ID} is shutdowned successfully using Netconf"
-        return f"Cannot shutdown: Interface loopback {STUDENT_ID}"
-    except: 
-        return f"Cannot shutdown: Interface loopback {STUDENT_ID}"
-
-
-
-# Get status of Loopback66070220 interface
-def status(ip):
-    # Define Netconf filter to get interfaces-state information for Loopback66070220
+        with session(ip) as m, tracing.span("netconf.edit_config", router=ip, target="running") as rpc:
+            netconf_reply = m.edit_config(target="running", config=netconf_config(command))
+            ok = "<ok/>" in str(netconf_reply)
+            rpc.set(ok=ok)
+    except RPCError as e:
+        tracing.set_attribute(rpc_error=str(e))
+        ok = False
+    loopback.remember_write(cache, ip, rooms.interface_name(), command, ok)
+    return loopback.result_message(command, ok, METHOD, rooms.student_id())
+
+def run_or_report(command, ip, fresh=False):
+    try:
+        return run(command, ip, fresh)
+    except:
+        loopback.forget(cache, ip, rooms.interface_name())
+        return loopback.error_message(command, METHOD, rooms.student_id())
+
+# One <get> that returns both the configured interface and its
+# interfaces-state entry.
+# Returns None when the interface is not configured,
+# otherwise {'enabled': ..., 'admin': ..., 'oper': ...}
+# Answers from the state cache or the subscriber table unless fresh is set.
+def read_state(ip, fresh=False):
+    with tracing.span("read_state", router=ip, fresh=fresh) as read:
+        state = cache.get((ip, rooms.interface_name()), fresh)
+        if state is not MISS:
+            read.set(source="cache")
+            return state
+        if not fresh:
+            state = netconf_subscriber.lookup(ip, rooms.interface_name())
+            if state is not netconf_subscriber.MISS:
+                read.set(source="subscriber")
+                return state
+        read.set(source="router")
+        return fetch_state(ip)
+
+def fetch_state(ip):
     netconf_filter = f"""
         <filter>
+            <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                <interface><name>{rooms.interface_name()}</name></interface>
+            </interfaces>
             <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-                <interface><name>{INTERFACE_NAME}</name></interface>
+                <interface><name>{rooms.interface_name()}</name></interface>
             </interfaces-state>
         </filter>
     """
+    with session(ip) as m, tracing.span("netconf.get", router=ip):
+        netconf_reply = m.get(filter=netconf_filter)
+    state = parse_state(netconf_reply.data_ele)
+    cache.put((ip, rooms.interface_name()), state)
+    return state
 
-    try:
-        checkExist = check_interface_exist(ip)
-        if not (checkExist):
-            raise Exception(f"No Interface loopback {STUDENT_ID} (checked by Netconf)")
-        with connect(ip) as m:
-            netconf_reply = m.get(filter=netconf_filter)
-            netconf_reply_dict = xmltodict.parse(netconf_reply.xml)
-            if not (netconf_reply_dict["rpc-reply"]["data"] == None):
-                admin_status = netconf_reply_dict["rpc-reply"]["data"]["interfaces-state"]["interface"]["admin-status"]
-                oper_status = netconf_reply_dict["rpc-reply"]["data"]["interfaces-state"]["interface"]["oper-status"]
-                if admin_status == 'up' and oper_status == 'up':
-                    status = "enabled"
-                elif admin_status == 'down' and oper_status == 'down':
-                    status = "disabled"
-                return f"Interface loopback {STUDENT_ID} is {status} (checked by Netconf)"
-            else:
-                return f"No Interface loopback {STUDENT_ID} (checked by Netconf)"
-    except: 
-        return f"No Interface loopback {STUDENT_ID} (checked by Netconf)"
+# Read from the lxml tree ncclient already parsed the reply into (netconf_xml)
+def parse_state(data_ele, name=None):
+    record = netconf_xml.interface_table(data_ele).get(name or rooms.interface_name())
+    return record.state() if record else None
 
 # --------------------------------------------------------------
-# Helper functions
+# Whole interface tables, for the interface index (interface_index.py)
 # --------------------------------------------------------------
 
+IF_NS = netconf_xml.IF_NS
+
+# selection nodes only: the names, and last-change of interfaces-state
+LAST_CHANGE_FILTER = f"""
+    <filter>
+        <interfaces xmlns="{IF_NS}"><interface><name/></interface></interfaces>
+        <interfaces-state xmlns="{IF_NS}"><interface><name/><last-change/></interface></interfaces-state>
+    </filter>
+"""
+
+def table_filter(names=None):
+    entries = "".join(f"<interface><name>{escape(name)}</name></interface>" for name in names or ())
+    return (f'<filter><interfaces xmlns="{IF_NS}">{entries}</interfaces>'
+            f'<interfaces-state xmlns="{IF_NS}">{entries}</interfaces-state></filter>')
+
+def fetch_interface_table(ip, names=None):
+    """{name: netconf_xml.InterfaceRecord} of every interface (or of names), config and state in one <get>."""
+    with session(ip) as m, tracing.span("netconf.get", router=ip, table=True, names=len(names or ())):
+        netconf_reply = m.get(filter=table_filter(names))
+    return netconf_xml.interface_table(netconf_reply.data_ele, details=True)
+
+def fetch_last_changes(ip):
+    """({name: last-change} of interfaces-state, set of configured names) in one small <get>."""
+    with session(ip) as m, tracing.span("netconf.get", router=ip, last_change=True):
+        netconf_reply = m.get(filter=LAST_CHANGE_FILTER)
+    return netconf_xml.last_changes(netconf_reply.data_ele), netconf_xml.interface_names(netconf_reply.data_ele)
+
 # Check if interface Loopback66070220 exists
 # Returns: True if exists, False otherwise
 def check_interface_exist(ip):
-    findInterface = f"""
-        <filter>
-            <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-                <interface><name>{INTERFACE_NAME}</name></interface>
-            </interfaces>
-        </filter>
-    """
     try:
-        with connect(ip) as m:
-            interfaceResult = m.get_config(source="running", filter=findInterface).xml
-            return (INTERFACE_NAME in interfaceResult)
+        return read_state(ip) is not None
     except: 
         return False
 
 def get_interface_status(ip):
-    netconf_filter = f"""
-        <filter>
-            <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-                <interface><name>{INTERFACE_NAME}</name></interface>
-            </interfaces-state>
-        </filter>
-    """
-
     try:
-        with connect(ip) as m:
-            netconf_reply = m.get(filter=netconf_filter)
-            netconf_reply_dict = xmltodict.parse(netconf_reply.xml)
-            if not (netconf_reply_dict["rpc-reply"]["data"] == None):
-                admin_status = netconf_reply_dict["rpc-reply"]["data"]["interfaces-state"]["interface"]["admin-status"]
-                oper_status = netconf_reply_dict["rpc-reply"]["data"]["interfaces-state"]["interface"]["oper-status"]
-                return {'admin': admin_status, 'oper': oper_status}
-        return None
+        return read_state(ip)
     except:
-        return None
\ No newline at end of file
+        return None
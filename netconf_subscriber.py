@@ -0,0 +1,240 @@
+# --------------------------------------------------------------
+# Background NETCONF subscriber keeping interface state hot per router
+# --------------------------------------------------------------
+#
+# Each subscriber holds its own NETCONF session (not the shared pool),
+# reads the whole interfaces-state table once, then asks the router for
+# yang-push on-change updates of ietf-interfaces. Routers without yang-push
+# (or that reject the subscription) are polled every poll_interval seconds.
+# lookup() answers from the table without touching the router.
+#
+# The bot's own writes go into the table at once (remember()), so a polled
+# table does not answer with the state from before the write until the
+# next sync; a write of unknown outcome makes lookup() miss for that
+# interface until the router tells again.
+
+import re
+import threading
+import time
+
+from ncclient.xml_ import to_ele
+
+import netconf_xml
+from netconf_xml import child_text, local
+
+IF_NS = netconf_xml.IF_NS
+YANG_PUSH_CAPABILITY = "urn:ietf:params:xml:ns:yang:ietf-yang-push"
+
+ESTABLISH_SUBSCRIPTION = f"""
+    <establish-subscription xmlns="urn:ietf:params:xml:ns:yang:ietf-event-notifications"
+                            xmlns:yp="urn:ietf:params:xml:ns:yang:ietf-yang-push"
+                            xmlns:if="{IF_NS}">
+        <stream>yp:yang-push</stream>
+        <yp:xpath-filter>/if:interfaces-state/interface</yp:xpath-filter>
+        <yp:dampening-period>0</yp:dampening-period>
+    </establish-subscription>
+"""
+
+STATE_FILTER = f"""
+    <filter>
+        <interfaces-state xmlns="{IF_NS}"/>
+    </filter>
+"""
+
+# "/ietf-interfaces:interfaces-state/interface[name='Loopback1']"
+TARGET_NAME = re.compile(r"""interface\[name=['"]([^'"]+)['"]\]""")
+
+# returned by lookup() when the table cannot answer (not synced / no subscriber)
+MISS = object()
+
+
+def state_of(admin, oper):
+    # interfaces-state has no enabled leaf, admin-status follows it
+    return {'enabled': admin == "up" if admin else None, 'admin': admin, 'oper': oper}
+
+
+def interface_states(element):
+    """Yield (name, {'enabled', 'admin', 'oper'}) for every interfaces-state entry under element."""
+    for intf in element.iter(f"{{{IF_NS}}}interface"):
+        name = child_text(intf, "name")
+        admin = child_text(intf, "admin-status")
+        oper = child_text(intf, "oper-status")
+        if name and (admin or oper):
+            yield name, state_of(admin, oper)
+
+
+class InterfaceSubscriber:
+    def __init__(self, ip, connect, poll_interval=30, retry_interval=10):
+        self.ip = ip
+        self._connect = connect
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.mode = None  # "yang-push" or "poll" once running
+        self.updates = 0
+        self._lock = threading.Lock()
+        self._table = {}
+        self._unknown = set()   # names lookup() does not answer until the router tells
+        self._written = {}      # our writes since the current sync started
+        self._synced = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"subscriber-{self.ip}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def synced(self):
+        return self._synced
+
+    def lookup(self, name):
+        with self._lock:
+            if not self._synced or name in self._unknown:
+                return MISS
+            return self._table.get(name)
+
+    def remember(self, name, state):
+        """Our own write: state after it (None: deleted), or MISS when its outcome is unknown."""
+        with self._lock:
+            self._written[name] = state
+            self._set(name, state)
+
+    def _set(self, name, state):
+        if state is MISS:
+            self._unknown.add(name)
+            return
+        self._unknown.discard(name)
+        if state is None:
+            self._table.pop(name, None)
+        else:
+            self._table[name] = dict(state)
+
+    def table(self):
+        with self._lock:
+            return dict(self._table)
+
+    def _run(self):
+        while not self._stop.is_set():
+            m = None
+            try:
+                m = self._connect(self.ip)
+                self._full_sync(m)
+                if self._subscribe(m):
+                    self.mode = "yang-push"
+                    self._listen(m)
+                else:
+                    self.mode = "poll"
+                    self._poll(m)
+            except Exception as e:
+                print(f"Subscriber {self.ip}: {e}")
+            finally:
+                # without a live session the table may go stale, stop answering from it
+                self._synced = False
+                if m is not None:
+                    try:
+                        m.close_session()
+                    except Exception:
+                        pass
+            self._stop.wait(self.retry_interval)
+
+    def _full_sync(self, m):
+        with self._lock:
+            self._written = {}
+        reply = m.get(filter=STATE_FILTER)
+        table = {
+            name: state_of(record.admin, record.oper)
+            for name, record in netconf_xml.interface_table(reply.data_ele).items()
+            if record.admin or record.oper
+        }
+        with self._lock:
+            self._table = table
+            self._unknown = set()
+            # writes made while the table was read may be missing from the reply
+            for name, state in self._written.items():
+                self._set(name, state)
+            self._synced = True
+
+    def _subscribe(self, m):
+        if not any(YANG_PUSH_CAPABILITY in c for c in m.server_capabilities):
+            return False
+        try:
+            reply = m.dispatch(to_ele(ESTABLISH_SUBSCRIPTION))
+        except Exception:
+            return False
+        return reply.ok
+
+    def _listen(self, m):
+        while not self._stop.is_set() and m.connected:
+            notification = m.take_notification(block=True, timeout=1)
+            if notification is not None:
+                self.apply(notification.notification_ele)
+
+    def _poll(self, m):
+        while not self._stop.wait(self.poll_interval) and m.connected:
+            self._full_sync(m)
+
+    def apply(self, notification):
+        """Apply a yang-push push-change-update or push-update notification."""
+        edits = [e for e in notification.iter() if local(e.tag) == "edit"]
+        with self._lock:
+            if edits:
+                for edit in edits:
+                    operation = child_text(edit, "operation")
+                    if operation in ("delete", "remove"):
+                        match = TARGET_NAME.search(child_text(edit, "target") or "")
+                        if match:
+                            self._set(match.group(1), None)
+                        continue
+                    for name, state in interface_states(edit):
+                        self._set(name, state)
+            else:
+                for name, state in interface_states(notification):
+                    self._set(name, state)
+            self.updates += 1
+
+
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+
+def start(ip, connect, poll_interval=30):
+    with _subscribers_lock:
+        subscriber = _subscribers.get(ip)
+        if subscriber is None:
+            subscriber = _subscribers[ip] = InterfaceSubscriber(ip, connect, poll_interval).start()
+        return subscriber
+
+
+def lookup(ip, name):
+    subscriber = _subscribers.get(ip)
+    if subscriber is None:
+        return MISS
+    return subscriber.lookup(name)
+
+
+def remember(ip, name, state):
+    """Put our own write into the router's table, if it has a subscriber."""
+    subscriber = _subscribers.get(ip)
+    if subscriber is not None:
+        subscriber.remember(name, state)
+
+
+def wait_synced(ip, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        subscriber = _subscribers.get(ip)
+        if subscriber is not None and subscriber.synced:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def stop_all():
+    with _subscribers_lock:
+        for subscriber in _subscribers.values():
+            subscriber.stop()
+        _subscribers.clear()
@@ -0,0 +1,175 @@
+# --------------------------------------------------------------
+# Interface records out of NETCONF replies, with lxml
+# --------------------------------------------------------------
+#
+# ncclient has already parsed every reply with lxml (reply.data_ele), so the
+# interfaces are read straight from that tree with compiled XPath instead of
+# parsing reply.xml a second time with xmltodict into nested dicts. Only
+# name / enabled / admin-status / oper-status are kept, in __slots__ records.
+#
+# Each XPath returns one plain string per interface (no element proxies,
+# which cost more than the XPath itself). The admin/oper lists line up with
+# the names when every entry has them, as on IOS-XE; otherwise the entries
+# are walked one by one.
+#
+# iter_interfaces() does the same on raw reply bytes with iterparse, clearing
+# each entry once read, for replies too large to hold as a tree.
+#
+# local() and child_text() read elements whatever their namespace, for the
+# subscriber's notifications and the fake NETCONF server.
+
+from io import BytesIO
+
+from lxml import etree
+
+IF_NS = "urn:ietf:params:xml:ns:yang:ietf-interfaces"
+IP_NS = "urn:ietf:params:xml:ns:yang:ietf-ip"
+NS = {"if": IF_NS, "ip": IP_NS}
+
+
+def _xpath(path):
+    return etree.XPath(path, namespaces=NS, smart_strings=False)
+
+
+# relative to the <data> element of a reply
+CONFIG_NAMES = _xpath("if:interfaces/if:interface/if:name/text()")
+DISABLED_NAMES = _xpath("if:interfaces/if:interface[normalize-space(if:enabled)='false']/if:name/text()")
+STATE_NAMES = _xpath("if:interfaces-state/if:interface/if:name/text()")
+STATE_ADMIN = _xpath("if:interfaces-state/if:interface/if:admin-status/text()")
+STATE_OPER = _xpath("if:interfaces-state/if:interface/if:oper-status/text()")
+STATE_INTERFACES = _xpath("if:interfaces-state/if:interface")
+STATE_COUNT = _xpath("count(if:interfaces-state/if:interface)")
+# both in document order, one entry per interface that has a last-change
+LAST_CHANGE_NAMES = _xpath("if:interfaces-state/if:interface[normalize-space(if:last-change)]/if:name/text()")
+LAST_CHANGES = _xpath("if:interfaces-state/if:interface/if:last-change[normalize-space()]/text()")
+ADDRESSED_INTERFACES = _xpath("if:interfaces/if:interface[ip:ipv4/ip:address]")
+ADDRESSES = _xpath("ip:ipv4/ip:address/ip:ip/text()")
+
+INTERFACE = f"{{{IF_NS}}}interface"
+INTERFACES = f"{{{IF_NS}}}interfaces"
+NAME = f"{{{IF_NS}}}name"
+ENABLED = f"{{{IF_NS}}}enabled"
+ADMIN = f"{{{IF_NS}}}admin-status"
+OPER = f"{{{IF_NS}}}oper-status"
+
+
+def local(tag):
+    """Tag without its namespace: "{urn:...}interface" -> "interface"."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def child_text(element, name):
+    """Text of the first child called name in any namespace, None if there is none."""
+    for child in element:
+        if local(child.tag) == name:
+            return child.text
+    return None
+
+
+class InterfaceRecord:
+    """One interface: configured (enabled is not None) and/or in interfaces-state (admin/oper).
+
+    ipv4 (configured addresses) and last_change (interfaces-state last-change)
+    are only read for the interface index, with details=True.
+    """
+
+    __slots__ = ("name", "enabled", "admin", "oper", "ipv4", "last_change")
+
+    def __init__(self, name, enabled=None, admin=None, oper=None, ipv4=(), last_change=None):
+        self.name = name
+        self.enabled = enabled
+        self.admin = admin
+        self.oper = oper
+        self.ipv4 = ipv4
+        self.last_change = last_change
+
+    @property
+    def configured(self):
+        return self.enabled is not None
+
+    def state(self):
+        """The state dict of netconf_final / loopback, None when the interface is not configured."""
+        if not self.configured:
+            return None
+        return {'enabled': self.enabled, 'admin': self.admin, 'oper': self.oper}
+
+    def __repr__(self):
+        return f"InterfaceRecord({self.name!r}, enabled={self.enabled}, admin={self.admin}, oper={self.oper})"
+
+
+def _state_rows(data_ele):
+    """(name, admin, oper) of every interfaces-state entry."""
+    names = STATE_NAMES(data_ele)
+    admin = STATE_ADMIN(data_ele)
+    oper = STATE_OPER(data_ele)
+    if len(names) == len(admin) == len(oper) == STATE_COUNT(data_ele):
+        return zip(names, admin, oper)
+    # some entry lacks a leaf, the lists do not line up
+    return [(e.findtext(NAME), e.findtext(ADMIN), e.findtext(OPER)) for e in STATE_INTERFACES(data_ele)]
+
+
+def interface_table(data_ele, details=False):
+    """{name: InterfaceRecord} of the interfaces and interfaces-state of a reply's <data> (reply.data_ele).
+
+    details=True also reads the IPv4 addresses and last-change of each interface.
+    """
+    table = {}
+    if data_ele is None:
+        return table
+    # a configured interface without <enabled> is enabled (the YANG default)
+    disabled = set(DISABLED_NAMES(data_ele))
+    for name in CONFIG_NAMES(data_ele):
+        table[name] = InterfaceRecord(name, enabled=name not in disabled)
+    for name, admin, oper in _state_rows(data_ele):
+        if not name:
+            continue
+        record = table.get(name)
+        if record is None:
+            record = table[name] = InterfaceRecord(name)
+        record.admin = admin
+        record.oper = oper
+    if details:
+        for element in ADDRESSED_INTERFACES(data_ele):
+            record = table.get(element.findtext(NAME))
+            if record is not None:
+                record.ipv4 = tuple(ADDRESSES(element))
+        for name, last_change in last_changes(data_ele).items():
+            record = table.get(name)
+            if record is not None:
+                record.last_change = last_change
+    return table
+
+
+def last_changes(data_ele):
+    """{name: last-change} of the interfaces-state entries that have one."""
+    if data_ele is None:
+        return {}
+    return dict(zip(LAST_CHANGE_NAMES(data_ele), LAST_CHANGES(data_ele)))
+
+
+def interface_names(data_ele):
+    """Names of the configured interfaces of a reply's <data>."""
+    if data_ele is None:
+        return set()
+    return set(CONFIG_NAMES(data_ele))
+
+
+def iter_interfaces(xml):
+    """Yield an InterfaceRecord per <interface> entry of raw reply XML (bytes or str), streaming.
+
+    Config entries have admin/oper None, interfaces-state entries have enabled None.
+    """
+    if isinstance(xml, str):
+        xml = xml.encode()
+    for _, element in etree.iterparse(BytesIO(xml), events=("end",), tag=INTERFACE):
+        fields = {child.tag: child.text for child in element}
+        name = fields.get(NAME)
+        if name:
+            if element.getparent().tag == INTERFACES:
+                yield InterfaceRecord(name, enabled=(fields.get(ENABLED) or "true").strip() == "true")
+            else:
+                yield InterfaceRecord(name, admin=fields.get(ADMIN), oper=fields.get(OPER))
+        # drop what was read, and the entries before it
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
@@ -1,29 +1,183 @@
 import os
+import threading
 from netmiko import ConnectHandler
 from dotenv import load_dotenv
 import re
+import ntc_templates
+import textfsm
 
-load_dotenv()
+from session_pool import SessionPool
+from state_cache import cache, MISS
+import loopback
+import rooms
+import tracing
 
-ROUTER_USER = os.environ.get("ROUTER_USER")
-ROUTER_PASS = os.environ.get("ROUTER_PASS")
+load_dotenv()
 
-def get_motd(ip):
+SSH_IDLE_TIMEOUT = int(os.environ.get("SSH_IDLE_TIMEOUT", "300"))
+SSH_KEEPALIVE = int(os.environ.get("SSH_KEEPALIVE", "30"))
+SSH_PORT = int(os.environ.get("SSH_PORT", "22"))
+METHOD = "SSH"
 
+# Router credentials, student ID and loopback name come from the room being served (rooms.py)
+def connect(ip, username=None, password=None):
+    if username is None:
+        username, password = rooms.credentials()
     device_params = {
         "device_type": "cisco_ios",
         "host": ip,
-        "username": ROUTER_USER,
-        "password": ROUTER_PASS,
+        "port": SSH_PORT,
+        "username": username,
+        "password": password,
+        # send SSH keepalives so an idle cached session is not dropped by the router
+        "keepalive": SSH_KEEPALIVE,
     }
+    with tracing.span("ssh.connect", router=ip, port=SSH_PORT):
+        return ConnectHandler(**device_params)
+
+# SSH sessions kept open per router; one command at a time per session
+pool = SessionPool(
+    connect=lambda key: connect(*key),
+    is_alive=lambda connection: connection.is_alive(),
+    close=lambda connection: connection.disconnect(),
+    idle_timeout=SSH_IDLE_TIMEOUT,
+    name="ssh",
+)
+
+def session(ip):
+    return pool.session((ip,) + rooms.credentials())
+
+def send_command(connection, command, **kwargs):
+    with tracing.span("ssh.send_command", router=connection.host, command=command):
+        return connection.send_command(command, use_textfsm=False, **kwargs)
+
+def send_config_set(connection, commands):
+    with tracing.span("ssh.send_config_set", router=connection.host, lines=len(commands)):
+        return connection.send_config_set(commands)
+
+def pool_stats():
+    stats = pool.stats()
+    stats["connect"] = stats["miss"] + stats["reconnect"]
+    stats["reuse"] = stats["hit"]
+    return stats
+
+def get_motd(ip, fresh=False):
+    banner_output = cache.get((ip, "motd"), fresh)
+    if banner_output is not MISS:
+        return banner_output.strip() or "Error: No MOTD Configured"
 
     try:
-        with ConnectHandler(**device_params) as connection:
-            banner_output = connection.send_command("show banner motd", use_textfsm=False)
+        with session(ip) as connection:
+            banner_output = send_command(connection, "show banner motd")
+            cache.put((ip, "motd"), banner_output)
             
             if banner_output and banner_output.strip():
                 return banner_output.strip()
             else:
                 return "Error: No MOTD Configured"
     except Exception as e:
-        return "Error: No MOTD Configured"
\ No newline at end of file
+        return "Error: No MOTD Configured"
+
+def get_running_config(ip):
+    """show running-config over the pooled session; raises when the router cannot be reached."""
+    with session(ip) as connection:
+        return send_command(connection, "show running-config", read_timeout=60)
+
+
+# --------------------------------------------------------------
+# gigabit_status: GigabitEthernet counts from "show ip interface brief"
+# --------------------------------------------------------------
+
+# the ntc_templates template is found and compiled once; a TextFSM object
+# keeps its parse state, so it is reset before each parse and used by one
+# thread at a time
+IP_BRIEF_TEMPLATE_PATH = os.path.join(
+    os.path.dirname(ntc_templates.__file__), "templates", "cisco_ios_show_ip_interface_brief.textfsm")
+with open(IP_BRIEF_TEMPLATE_PATH) as f:
+    ip_brief_template = textfsm.TextFSM(f)
+ip_brief_fields = [name.lower() for name in ip_brief_template.header]
+ip_brief_lock = threading.Lock()
+
+def parse_ip_brief(output):
+    with ip_brief_lock:
+        ip_brief_template.Reset()
+        rows = ip_brief_template.ParseText(output)
+    return [dict(zip(ip_brief_fields, row)) for row in rows]
+
+def gigabit_status(ip):
+    """One router's GigabitEthernet states and counts; raises when the router cannot be reached."""
+    with session(ip) as connection:
+        output = send_command(connection, "show ip interface brief")
+    up = 0
+    down = 0
+    admin_down = 0
+    interface_list = []
+    for status in parse_ip_brief(output):
+        if not status["interface"].startswith("GigabitEthernet"):
+            continue
+        interface_list.append(f"{status['interface']} {status['status']}")
+        if status["status"] == "up":
+            up += 1
+        elif status["status"] == "down":
+            down += 1
+        elif status["status"] == "administratively down":
+            admin_down += 1
+    return f"{', '.join(interface_list)} -> {up} up, {down} down, {admin_down} administratively down"
+
+
+# --------------------------------------------------------------
+# Loopback commands over the CLI, same replies as restconf_final/netconf_final
+# --------------------------------------------------------------
+
+CLI_ERRORS = ("% Invalid", "% Incomplete", "% Ambiguous")
+
+def cli_config(command):
+    if command == "create":
+        return [
+            f"interface {rooms.interface_name()}",
+            f"description {rooms.student_id()} Loopback interface",
+            f"ip address {rooms.loopback_ip()} 255.255.255.0",
+            "no shutdown",
+        ]
+    if command == "delete":
+        return [f"no interface {rooms.interface_name()}"]
+    if command == "enable":
+        return [f"interface {rooms.interface_name()}", "no shutdown"]
+    return [f"interface {rooms.interface_name()}", "shutdown"]
+
+# "Loopback66070220  172.2.20.1  YES manual administratively down down"
+# Returns None when the interface does not exist, raises on SSH errors.
+def read_state(ip, fresh=False):
+    with tracing.span("read_state", router=ip, fresh=fresh) as read:
+        state = cache.get((ip, rooms.interface_name()), fresh)
+        read.set(source="router" if state is MISS else "cache")
+        if state is not MISS:
+            return state
+        return fetch_state(ip)
+
+def fetch_state(ip):
+    with session(ip) as connection:
+        output = send_command(connection, f"show ip interface brief {rooms.interface_name()}")
+    state = None
+    for line in output.splitlines():
+        fields = line.split()
+        if fields and fields[0] == rooms.interface_name():
+            admin_down = "administratively" in fields
+            state = {'admin': "down" if admin_down else "up", 'oper': fields[-1]}
+    cache.put((ip, rooms.interface_name()), state)
+    return state
+
+def run(command, ip, fresh=False):
+    """Run a loopback command over SSH and return the reply; raises when the router cannot be reached."""
+    state = read_state(ip, fresh)
+    if command == "status":
+        return loopback.status_message(state, METHOD, rooms.student_id())
+
+    need_write, message = loopback.decide(command, state, METHOD, rooms.student_id())
+    if not need_write:
+        return message
+    with session(ip) as connection:
+        output = send_config_set(connection, cli_config(command))
+    ok = not any(error in output for error in CLI_ERRORS)
+    loopback.remember_write(cache, ip, rooms.interface_name(), command, ok)
+    return loopback.result_message(command, ok, METHOD, rooms.student_id())
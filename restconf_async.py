@@ -0,0 +1,93 @@
+# --------------------------------------------------------------
+# asyncio version of restconf_final.run() on top of httpx
+# --------------------------------------------------------------
+#
+# Same URLs, payloads, state cache and replies as restconf_final; only the
+# HTTP client differs. One httpx.AsyncClient per router keeps the TLS
+# connection alive between the read and the write of a command.
+
+import httpx
+
+import drivers
+import loopback
+import restconf_final
+import rooms
+from restconf_final import METHOD
+from state_cache import cache, MISS
+
+TIMEOUT = httpx.Timeout(restconf_final.RESTCONF_TIMEOUT[1], connect=restconf_final.RESTCONF_TIMEOUT[0])
+
+_clients = {}  # (ip, credentials) -> httpx.AsyncClient
+
+
+def get_client(ip):
+    basicauth = rooms.credentials()
+    client = _clients.get((ip, basicauth))
+    if client is None:
+        limits = httpx.Limits(max_connections=restconf_final.RESTCONF_POOL_SIZE,
+                              max_keepalive_connections=restconf_final.RESTCONF_POOL_SIZE)
+        client = _clients[(ip, basicauth)] = httpx.AsyncClient(
+            auth=basicauth,
+            headers=restconf_final.headers,
+            timeout=TIMEOUT,
+            # retry failed connects, like the urllib3 Retry of restconf_final
+            transport=httpx.AsyncHTTPTransport(verify=False, limits=limits, retries=3),
+        )
+    return client
+
+
+async def close_clients():
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+
+async def read_state(ip, fresh=False):
+    state = cache.get((ip, rooms.interface_name()), fresh)
+    if state is not MISS:
+        return state
+
+    resp = await get_client(ip).get(restconf_final.get_url_status(ip))
+    if resp.status_code == 404:
+        state = None
+    else:
+        resp.raise_for_status()
+        interface = resp.json()["ietf-interfaces:interface"]
+        state = {'admin': interface.get("admin-status"), 'oper': interface.get("oper-status")}
+    cache.put((ip, rooms.interface_name()), state)
+    return state
+
+
+async def run(command, ip, fresh=False):
+    """Async restconf_final.run(); raises httpx.HTTPError when the router cannot be reached."""
+    state = await read_state(ip, fresh)
+    if command == "status":
+        return loopback.status_message(state, METHOD, rooms.student_id())
+
+    need_write, message = loopback.decide(command, state, METHOD, rooms.student_id())
+    if not need_write:
+        return message
+
+    client = get_client(ip)
+    call_url = restconf_final.get_call_url(ip)
+    if command == "create":
+        resp = await client.put(call_url, content=restconf_final.create_body())
+        # 204 means the PUT replaced an interface that already existed
+        if resp.status_code == 204:
+            loopback.forget(cache, ip, rooms.interface_name())
+            return loopback.result_message("create", False, METHOD, rooms.student_id())
+    elif command == "delete":
+        resp = await client.delete(call_url)
+    else:
+        resp = await client.put(call_url, content=restconf_final.enabled_body(command == "enable"))
+    return restconf_final.write_result(command, ip, resp)
+
+
+async def execute(command, ip, fresh=False):
+    if command not in drivers.COMMANDS:
+        return "Error: Unknown command"
+    try:
+        return await run(command, ip, fresh)
+    except httpx.HTTPError as e:
+        print('Error. {}'.format(e))
+        return loopback.error_message(command, METHOD, rooms.student_id())
@@ -0,0 +1,189 @@
+# --------------------------------------------------------------
+# Bulk interface changes over RESTCONF in one HTTP request
+# --------------------------------------------------------------
+#
+# Every interface of a spec (interface_spec.py) becomes one edit of a
+# YANG Patch (RFC 8072) sent as a single PATCH on ietf-interfaces:interfaces.
+# A YANG Patch is applied all or nothing; the yang-patch-status of the reply
+# tells which edit failed and why.
+#
+# Routers that do not take application/yang-patch+json (415/405/501) get a
+# plain merge PATCH of all the merged interfaces, then one DELETE per
+# deleted interface, stopping at the first failure. That is not atomic, a
+# failure may leave some applied.
+#
+# The JSON documents are filled from the templates below with json.dumps()
+# of the single values; no dict of the whole document is built and
+# serialized per call.
+#
+#   python restconf_bulk.py <spec.yaml|spec.csv> <router ip>...
+
+import itertools
+import json
+import sys
+from urllib.parse import quote
+
+import interface_spec
+import loopback
+import restconf_final
+import tracing
+from state_cache import cache
+
+YANG_PATCH = "application/yang-patch+json"
+
+# ---------------- payload templates ----------------
+
+INTERFACE = '{{"name":{name},"type":"iana-if-type:{type}"{fields}}}'
+DESCRIPTION = ',"description":{}'
+ENABLED = ',"enabled":{}'
+IPV4 = ',"ietf-ip:ipv4":{{"address":[{{"ip":"{}","netmask":"{}"}}]}}'
+
+EDIT_MERGE = '{{"edit-id":{id},"operation":"merge","target":{target},"value":{{"ietf-interfaces:interface":[{value}]}}}}'
+EDIT_DELETE = '{{"edit-id":{id},"operation":"delete","target":{target}}}'
+PATCH = '{{"ietf-yang-patch:yang-patch":{{"patch-id":{id},"edit":[{edits}]}}}}'
+MERGE = '{{"ietf-interfaces:interfaces":{{"interface":[{interfaces}]}}}}'
+
+_patch_ids = itertools.count(1)
+
+
+def interface_json(intf):
+    fields = []
+    if intf.description is not None:
+        fields.append(DESCRIPTION.format(json.dumps(intf.description)))
+    if intf.enabled is not None:
+        fields.append(ENABLED.format("true" if intf.enabled else "false"))
+    if intf.ip is not None:
+        # both come out of ipaddress, nothing to escape
+        fields.append(IPV4.format(intf.ip, intf.netmask))
+    return INTERFACE.format(name=json.dumps(intf.name), type=intf.type, fields="".join(fields))
+
+
+def target(intf):
+    # "GigabitEthernet0/0/1" -> "/interface=GigabitEthernet0%2F0%2F1"
+    return json.dumps("/interface=" + quote(intf.name, safe=""))
+
+
+def yang_patch(interfaces):
+    edits = []
+    for intf in interfaces:
+        if intf.operation == "delete":
+            edits.append(EDIT_DELETE.format(id=json.dumps(intf.name), target=target(intf)))
+        else:
+            edits.append(EDIT_MERGE.format(id=json.dumps(intf.name), target=target(intf), value=interface_json(intf)))
+    return PATCH.format(id=json.dumps(f"bulk-{next(_patch_ids)}"), edits=",".join(edits))
+
+
+def merge_patch(interfaces):
+    return MERGE.format(interfaces=",".join(interface_json(intf) for intf in interfaces))
+
+
+# ---------------- results ----------------
+
+class Result:
+    def __init__(self, router, edits, ok, mode, atomic=True):
+        self.router = router
+        self.edits = edits    # [(interface name, "ok" or error tag)], in spec order
+        self.ok = ok
+        self.mode = mode      # "yang-patch" or "merge"
+        self.atomic = atomic  # False: a failed change may be partly applied
+
+    def message(self):
+        count = f"{len(self.edits)} interface{'s' if len(self.edits) != 1 else ''}"
+        if self.ok:
+            return f"{count} provisioned successfully using {restconf_final.METHOD} ({self.mode})"
+        # edits after the failing one are "not applied", only name the failures themselves
+        failed = [(name, status) for name, status in self.edits if status not in ("ok", "not applied")]
+        failed = ", ".join(f"{name} {status}" for name, status in failed or self.edits if status != "ok")
+        applied = "some may be applied" if not self.atomic else "nothing applied"
+        return f"Cannot provision {count} using {restconf_final.METHOD}: {failed}, {applied}"
+
+
+def error_tag(errors):
+    # {"error": [{"error-tag": "invalid-value", ...}]}
+    error = ((errors or {}).get("error") or [{}])[0]
+    return error.get("error-tag") or "error"
+
+
+def response_error(resp):
+    try:
+        errors = resp.json().get("ietf-restconf:errors")
+    except ValueError:
+        errors = None
+    return error_tag(errors) if errors else f"HTTP {resp.status_code}"
+
+
+def parse_patch_status(resp, interfaces):
+    """[(name, status)] from the yang-patch-status of a reply; edits without a status were not applied."""
+    try:
+        status = resp.json().get("ietf-yang-patch:yang-patch-status", {})
+    except ValueError:
+        status = {}
+    if resp.ok:
+        return [(intf.name, "ok") for intf in interfaces]
+    per_edit = {}
+    for edit in (status.get("edit-status") or {}).get("edit", []):
+        per_edit[edit.get("edit-id")] = "ok" if "ok" in edit else error_tag(edit.get("errors"))
+    if not any(s != "ok" for s in per_edit.values()):
+        # the whole patch was refused, not one of its edits
+        tag = error_tag(status.get("errors")) if status.get("errors") else response_error(resp)
+        return [(intf.name, tag) for intf in interfaces]
+    return [(intf.name, per_edit.get(intf.name, "not applied")) for intf in interfaces]
+
+
+# ---------------- requests ----------------
+
+def interfaces_url(ip):
+    return f"{restconf_final.base_url(ip)}/restconf/data/ietf-interfaces:interfaces"
+
+
+def patch(ip, interfaces):
+    resp = restconf_final.request(
+        "PATCH", ip, interfaces_url(ip), data=yang_patch(interfaces),
+        headers={"Content-type": YANG_PATCH, "Accept": "application/yang-data+json"})
+    if resp.status_code in (405, 415, 501):
+        return None
+    edits = parse_patch_status(resp, interfaces)
+    return Result(ip, edits, resp.ok, "yang-patch")
+
+
+def merge_then_delete(ip, interfaces):
+    merged = [intf for intf in interfaces if intf.operation == "merge"]
+    status = {}
+    if merged:
+        resp = restconf_final.request("PATCH", ip, interfaces_url(ip), data=merge_patch(merged))
+        for intf in merged:
+            status[intf.name] = "ok" if resp.ok else response_error(resp)
+    for intf in interfaces:
+        if intf.operation == "delete":
+            if any(s != "ok" for s in status.values()):
+                status[intf.name] = "not applied"
+                continue
+            resp = restconf_final.request(
+                "DELETE", ip, f"{interfaces_url(ip)}/interface={quote(intf.name, safe='')}",
+                headers={"Content-type": None})
+            status[intf.name] = "ok" if resp.ok else response_error(resp)
+    edits = [(intf.name, status[intf.name]) for intf in interfaces]
+    return Result(ip, edits, all(s == "ok" for _, s in edits), "merge", atomic=False)
+
+
+def provision(ip, interfaces):
+    """Apply every interface of the spec on the router in one PATCH; returns a Result.
+
+    Raises requests.RequestException when the router cannot be reached.
+    """
+    try:
+        with tracing.span("restconf.provision", router=ip, interfaces=len(interfaces)) as span:
+            result = patch(ip, interfaces) or merge_then_delete(ip, interfaces)
+            span.set(ok=result.ok, mode=result.mode)
+            return result
+    finally:
+        for intf in interfaces:
+            loopback.forget(cache, ip, intf.name)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("usage: python restconf_bulk.py <spec.yaml|spec.csv> <router ip>...")
+    spec = interface_spec.load(sys.argv[1])
+    for router in sys.argv[2:]:
+        print(f"{router}: {provision(router, spec).message()}")
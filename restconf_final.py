@@ -1,7 +1,17 @@
 import os
 import json
+import threading
+from functools import lru_cache
+from urllib.parse import quote
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+import loopback
+import netconf_xml
+import rooms
+import tracing
+from state_cache import cache, MISS
 requests.packages.urllib3.disable_warnings()
 
 load_dotenv()
@@ -13,207 +23,255 @@ HOST = os.environ.get("ROUTER_HOST")
 headers = { "Accept": "application/yang-data+json", 
             "Content-type":"application/yang-data+json"
            }
-ROUTER_USER = os.environ.get("ROUTER_USER", "admin")
-ROUTER_PASS = os.environ.get("ROUTER_PASS", "cisco")
-basicauth = (ROUTER_USER, ROUTER_PASS)
-
-STUDENT_ID = "66070220"
-INTERFACE_NAME = f"Loopback{STUDENT_ID}"
+# Router credentials, student ID and loopback name come from the room being
+# served (rooms.py); a single-room bot uses ROUTER_USER/ROUTER_PASS and 66070220.
+
+# (connect, read) timeout used for every RESTCONF call
+RESTCONF_TIMEOUT = (5, 10)
+RESTCONF_POOL_SIZE = int(os.environ.get("RESTCONF_POOL_SIZE", "2"))
+RESTCONF_PORT = int(os.environ.get("RESTCONF_PORT", "443"))
+
+# One keep-alive requests.Session per router (and credentials) so a command reuses the same TLS connection
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(ip):
+    basicauth = rooms.credentials()
+    with _sessions_lock:
+        session = _sessions.get((ip, basicauth))
+        if session is None:
+            # retry connection resets with backoff; GET/PUT/DELETE are idempotent
+            retry = Retry(total=3, connect=3, read=2, status=0, backoff_factor=0.3)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RESTCONF_POOL_SIZE, pool_block=True, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.auth = basicauth
+            session.headers.update(headers)
+            session.verify = False
+            _sessions[(ip, basicauth)] = session
+        return session
+
+def request(method, ip, url, **kwargs):
+    kwargs.setdefault("timeout", RESTCONF_TIMEOUT)
+    # per request, REQUESTS_CA_BUNDLE in the environment would override session.verify
+    kwargs.setdefault("verify", False)
+    with tracing.span(f"restconf.{method}", router=ip, path=url.split("/restconf", 1)[-1]) as call:
+        resp = get_session(ip).request(method, url, **kwargs)
+        # retries done by the urllib3 Retry of the session
+        retries = resp.raw.retries.history if resp.raw is not None and resp.raw.retries else ()
+        call.set(status_code=resp.status_code, retries=len(retries))
+        return resp
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+def base_url(ip):
+    return f"https://{ip}" if RESTCONF_PORT == 443 else f"https://{ip}:{RESTCONF_PORT}"
 
 def get_call_url(ip):
-    api_url = f"https://{ip}/restconf/data/ietf-interfaces:interfaces"
-    call_url = f"{api_url}/interface={INTERFACE_NAME}"
+    api_url = f"{base_url(ip)}/restconf/data/ietf-interfaces:interfaces"
+    call_url = f"{api_url}/interface={rooms.interface_name()}"
     return call_url
 
 def get_url_status(ip):
-    api_url_check_status = f"https://{ip}/restconf/data/ietf-interfaces:interfaces-state/interface={INTERFACE_NAME}"
+    api_url_check_status = f"{base_url(ip)}/restconf/data/ietf-interfaces:interfaces-state/interface={rooms.interface_name()}"
     return api_url_check_status
 
-def create(ip):
-    call_url = get_call_url(ip)
+METHOD = "Restconf"
 
-    isExist = check_interface_is_exist(ip)
-    if isExist:
-        return "Cannot create: Interface loopback {}".format(STUDENT_ID)
+def create(ip, fresh=False):
+    return run_or_report("create", ip, fresh)
 
-    yangConfig = {
-            "ietf-interfaces:interface": {
-            "name": INTERFACE_NAME,
-            "type": "iana-if-type:softwareLoopback",
-            "enabled": True,
-            "ietf-ip:ipv4": {
-                "address": [
-                    {
-                        "ip": "172.2.20.1",
-                        "netmask": "255.255.255.0"
-                    }
-                ]
-            }
-        }
-    }
 
-    resp = requests.put(
-        call_url, 
-        data=json.dumps(yangConfig), 
-        auth=basicauth,
-        headers=headers, 
-        verify=False,
-        timeout=10
-    )
-    
-    if (resp.status_code == 204):
-        return "Cannot create: Interface loopback {}".format(STUDENT_ID)
-    elif (resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
-        return "Interface loopback {} is created successfully using Restconf".format(STUDENT_ID)
-    else:
-        print('Error. Status Code: {}'.format(resp.status_code))
-        return "Cannot create: Interface loopback {}".format(STUDENT_ID)
+def delete(ip, fresh=False):
+    return run_or_report("delete", ip, fresh)
 
 
-def delete(ip):
-    call_url = get_call_url(ip)
+def enable(ip, fresh=False):
+    return run_or_report("enable", ip, fresh)
 
-    isExist = check_interface_is_exist(ip)
-    if not isExist:
-        return "Cannot delete: Interface loopback {}".format(STUDENT_ID)
 
-    resp = requests.delete(
-        call_url, 
-        auth=basicauth, 
-        headers={ "Accept": "application/yang-data+json" }, 
-        verify=False
-    )
-
-    if(resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
-        return "Interface loopback {} is deleted successfully using Restconf".format(STUDENT_ID)
-    else:
-        print('Error. Status Code: {}'.format(resp.status_code))
-        return "Cannot delete: Interface loopback {}".format(STUDENT_ID)
+def disable(ip, fresh=False):
+    return run_or_report("disable", ip, fresh)
 
 
-def enable(ip):
-    call_url = get_call_url(ip)
+def status(ip, fresh=False):
+    return run_or_report("status", ip, fresh)
 
-    isExist = check_interface_is_exist(ip)
-    if not (isExist):
-        return "Cannot enable: Interface loopback {}".format(STUDENT_ID)
+# --------------------------------------------------------------
+# Helper functions
+# --------------------------------------------------------------
 
-    current_status = get_interface_status(ip)
-    if current_status and current_status['admin'] == 'up' and current_status['oper'] == 'up':
-        return "Cannot enable: Interface loopback {}".format(STUDENT_ID)
+def run(command, ip, fresh=False):
+    """Run a loopback command and return the reply.
 
-    yangConfig = {
-        "ietf-interfaces:interface": {
-            "name": INTERFACE_NAME,
-            "type": "iana-if-type:softwareLoopback",
-            "enabled": True,
-        }
-    }
+    Raises requests.RequestException when the router cannot be reached.
+    """
+    state = read_state(ip, fresh)
+    if command == "status":
+        return loopback.status_message(state, METHOD, rooms.student_id())
 
-    resp = requests.put(
-            call_url, 
-            data=json.dumps(yangConfig), 
-            auth=basicauth,
-            headers=headers,
-            verify=False
-        )
+    need_write, message = loopback.decide(command, state, METHOD, rooms.student_id())
+    if not need_write:
+        return message
 
-    if(resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
-        return "Interface loopback {} is enabled successfully using Restconf".format(STUDENT_ID)
+    if command == "create":
+        resp = put_interface(ip, create_body())
+        # 204 means the PUT replaced an interface that already existed
+        if (resp.status_code == 204):
+            loopback.forget(cache, ip, rooms.interface_name())
+            return loopback.result_message("create", False, METHOD, rooms.student_id())
+    elif command == "delete":
+        resp = request("DELETE", ip, get_call_url(ip), headers={"Content-type": None})
     else:
-        print('Error. Status Code: {}'.format(resp.status_code))
-        return "Cannot enable: Interface loopback {}".format(STUDENT_ID)
-
+        resp = put_interface(ip, enabled_body(command == "enable"))
+    return write_result(command, ip, resp)
 
-def disable(ip):
-    call_url = get_call_url(ip)
-
-    isExist = check_interface_is_exist(ip)
-    if not (isExist):
-        return "Cannot enable: Interface loopback {}".format(STUDENT_ID)
+def run_or_report(command, ip, fresh=False):
+    try:
+        return run(command, ip, fresh)
+    except requests.RequestException as e:
+        print('Error. {}'.format(e))
+        return loopback.error_message(command, METHOD, rooms.student_id())
 
-    current_status = get_interface_status(ip)
-    if current_status and current_status['admin'] == 'down' and current_status['oper'] == 'down':
-        return "Cannot shutdown: Interface loopback {} (checked by Restconf)".format(STUDENT_ID)
+def create_config(name=None, address=None):
+    return {
+            "ietf-interfaces:interface": {
+            "name": name or rooms.interface_name(),
+            "type": "iana-if-type:softwareLoopback",
+            "enabled": True,
+            "ietf-ip:ipv4": {
+                "address": [
+                    {
+                        "ip": address or rooms.loopback_ip(),
+                        "netmask": "255.255.255.0"
+                    }
+                ]
+            }
+        }
+    }
 
-    yangConfig = {
+def enabled_config(enabled, name=None):
+    return {
         "ietf-interfaces:interface": {
-            "name": INTERFACE_NAME,
+            "name": name or rooms.interface_name(),
             "type": "iana-if-type:softwareLoopback",
-            "enabled": False,
+            "enabled": enabled,
         }
     }
 
-    resp = requests.put(
-        call_url,
-        data=json.dumps(yangConfig), 
-        auth=basicauth, 
-        headers=headers, 
-        verify=False
-    )
+# The payloads only depend on the room (loopback name and address), each is
+# serialized once instead of on every command.
+def create_body():
+    return _create_body(rooms.interface_name(), rooms.loopback_ip())
 
-    if(resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
-        return "Interface loopback {} is shutdowned successfully using Restconf".format(STUDENT_ID)
-    else:
-        print('Error. Status Code: {}'.format(resp.status_code))
-        return "Cannot shutdown: Interface loopback {}".format(STUDENT_ID)
+def enabled_body(enabled):
+    return _enabled_body(enabled, rooms.interface_name())
 
+@lru_cache(maxsize=256)
+def _create_body(name, address):
+    return json.dumps(create_config(name, address))
 
-def status(ip):
-    api_url_check_status = get_url_status(ip)
+@lru_cache(maxsize=256)
+def _enabled_body(enabled, name):
+    return json.dumps(enabled_config(enabled, name))
 
-    resp = requests.get(
-        api_url_check_status, 
-        auth=basicauth, 
-        headers=headers, 
-        verify=False
-    )
+def put_interface(ip, body):
+    return request("PUT", ip, get_call_url(ip), data=body)
 
-    if(resp.status_code >= 200 and resp.status_code <= 299):
+def write_result(command, ip, resp):
+    ok = resp.status_code >= 200 and resp.status_code <= 299
+    loopback.remember_write(cache, ip, rooms.interface_name(), command, ok)
+    if ok:
         print("STATUS OK: {}".format(resp.status_code))
-        response_json = resp.json()
-        admin_status = response_json["ietf-interfaces:interface"]["admin-status"]
-        oper_status = response_json["ietf-interfaces:interface"]["oper-status"]
-        if admin_status == 'up' and oper_status == 'up':
-            return "Interface loopback {} is enabled (checked by Restconf)".format(STUDENT_ID)
-        elif admin_status == 'down' and oper_status == 'down':
-            return "Interface loopback {} is disabled (checked by Restconf)".format(STUDENT_ID)
-    elif(resp.status_code == 404):
-        print("STATUS NOT FOUND: {}".format(resp.status_code))
-        return "No Interface loopback {} (checked by Restconf)".format(STUDENT_ID)
     else:
         print('Error. Status Code: {}'.format(resp.status_code))
+    return loopback.result_message(command, ok, METHOD, rooms.student_id())
+
+# One GET that answers both "does it exist" and "is it up": the
+# interfaces-state entry exists exactly when the interface is configured,
+# and its admin-status mirrors the configured "enabled" leaf.
+# Returns None when the interface does not exist, raises on transport errors.
+# Answers from the state cache unless fresh is set.
+def read_state(ip, fresh=False):
+    with tracing.span("read_state", router=ip, fresh=fresh) as read:
+        state = cache.get((ip, rooms.interface_name()), fresh)
+        read.set(source="router" if state is MISS else "cache")
+        if state is not MISS:
+            return state
+        return fetch_state(ip)
+
+def fetch_state(ip):
+    resp = request("GET", ip, get_url_status(ip))
+    if resp.status_code == 404:
+        state = None
+    else:
+        resp.raise_for_status()
+        interface = resp.json()["ietf-interfaces:interface"]
+        state = {'admin': interface.get("admin-status"), 'oper': interface.get("oper-status")}
+    cache.put((ip, rooms.interface_name()), state)
+    return state
+
+# --------------------------------------------------------------
+# Whole interface tables, for the interface index (interface_index.py)
+# --------------------------------------------------------------
+
+def interfaces_url(ip, state=False):
+    return f"{base_url(ip)}/restconf/data/ietf-interfaces:interfaces" + ("-state" if state else "")
+
+def get_entries(ip, url, key):
+    # 404 is an empty table / an interface that does not exist
+    resp = request("GET", ip, url)
+    if resp.status_code == 404:
+        return []
+    resp.raise_for_status()
+    body = resp.json()[key]
+    return body["interface"] if "interface" in body else [body]
+
+def fetch_interface_table(ip, names=None):
+    """{name: netconf_xml.InterfaceRecord} of every interface (or of names), from config and state.
+
+    Two GETs for the whole table, two per interface for names.
+    """
+    if names is None:
+        config = get_entries(ip, interfaces_url(ip), "ietf-interfaces:interfaces")
+        state = get_entries(ip, interfaces_url(ip, state=True), "ietf-interfaces:interfaces-state")
+    else:
+        config, state = [], []
+        for name in names:
+            entry = f"/interface={quote(name, safe='')}"
+            config += get_entries(ip, interfaces_url(ip) + entry, "ietf-interfaces:interface")
+            state += get_entries(ip, interfaces_url(ip, state=True) + entry, "ietf-interfaces:interface")
+    table = {}
+    for interface in config:
+        addresses = interface.get("ietf-ip:ipv4", {}).get("address", [])
+        table[interface["name"]] = netconf_xml.InterfaceRecord(
+            interface["name"], enabled=interface.get("enabled", True), ipv4=tuple(a["ip"] for a in addresses))
+    for interface in state:
+        record = table.get(interface["name"])
+        if record is None:
+            record = table[interface["name"]] = netconf_xml.InterfaceRecord(interface["name"])
+        record.admin = interface.get("admin-status")
+        record.oper = interface.get("oper-status")
+        record.last_change = interface.get("last-change")
+    return table
+
+def fetch_last_changes(ip):
+    """({name: last-change} of interfaces-state, set of configured names); only those leaves are sent back."""
+    state = get_entries(ip, interfaces_url(ip, state=True) + "?fields=interface(name;last-change)",
+                        "ietf-interfaces:interfaces-state")
+    config = get_entries(ip, interfaces_url(ip) + "?fields=interface(name)", "ietf-interfaces:interfaces")
+    changes = {entry["name"]: entry["last-change"] for entry in state if entry.get("last-change")}
+    return changes, {entry["name"] for entry in config}
 
 def check_interface_is_exist(ip):
-    call_url = get_call_url(ip)
-    check_interface = requests.get(
-        call_url,
-        auth=basicauth,
-        headers=headers,
-        verify=False
-    )
-    
-    return not (check_interface.status_code == 404)
+    return read_state(ip) is not None
 
 def get_interface_status(ip):
-    api_url_check_status = get_url_status(ip)
     try:
-        resp = requests.get(
-            api_url_check_status, 
-            auth=basicauth, 
-            headers=headers, 
-            verify=False
-        )
-        
-        if resp.status_code >= 200 and resp.status_code <= 299:
-            response_json = resp.json()
-            admin_status = response_json["ietf-interfaces:interface"]["admin-status"]
-            oper_status = response_json["ietf-interfaces:interface"]["oper-status"]
-            return {'admin': admin_status, 'oper': oper_status}
-        return None
+        return read_state(ip)
     except:
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,149 @@
+# --------------------------------------------------------------
+# Rooms (tenants) served by one bot process
+# --------------------------------------------------------------
+#
+# Each room has its own command prefix, loopback (Loopback<student_id>),
+# allowed routers and router credentials. They are read from ROOMS_FILE:
+#
+#   rooms:
+#     - room_id: Y2lzY29zcGFyazovL...
+#       prefix: /66070220
+#       student_id: "66070220"
+#       loopback_ip: 172.2.20.1         # optional, 172.<x>.<yz>.1 from the last 3 digits
+#       routers: 10.0.15.61-65          # or "all", or a list of IPs
+#       router_user: admin
+#       router_pass: cisco
+#       access_token: ...               # optional, defaults to WEBX_ACCESS_TOKEN
+#
+# Without a rooms file the bot serves the single ROOM_ID room as before.
+# Device modules read the student ID, loopback name and credentials of the
+# room being served from a context variable, set with rooms.use(room).
+
+import contextvars
+import hashlib
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import yaml
+
+import inventory
+
+ROOMS_FILE = os.environ.get("ROOMS_FILE", "rooms.yaml")
+
+
+class Room:
+    def __init__(self, room_id=None, prefix=None, student_id="66070220", routers=None,
+                 router_user=None, router_pass=None, access_token=None, name=None,
+                 loopback_ip=None):
+        self.room_id = room_id
+        self.student_id = str(student_id)
+        # 66070220 -> 172.2.20.1
+        self.loopback_ip = loopback_ip or "172.{}.{}.1".format(int(self.student_id[-3]), int(self.student_id[-2:]))
+        self.prefix = prefix or f"/{self.student_id}"
+        self.router_user = router_user or os.environ.get("ROUTER_USER", "admin")
+        self.router_pass = router_pass or os.environ.get("ROUTER_PASS", "cisco")
+        self.access_token = access_token or os.environ.get("WEBX_ACCESS_TOKEN")
+        self.name = name or self.prefix
+        all_routers = inventory.load_routers()
+        if routers is None or routers == "all":
+            self.routers = all_routers
+        elif isinstance(routers, str):
+            self.routers = inventory.expand_targets(routers, all_routers) or []
+        else:
+            self.routers = [ip for ip in routers if ip in all_routers]
+        # per-room bot state
+        self.current_method = None
+        self.state_file = None
+        if room_id:
+            self.state_file = "bot_state_{}.json".format(hashlib.sha1(room_id.encode()).hexdigest()[:10])
+
+    @property
+    def interface_name(self):
+        return f"Loopback{self.student_id}"
+
+    @property
+    def credentials(self):
+        return (self.router_user, self.router_pass)
+
+    def __repr__(self):
+        return f"Room({self.name})"
+
+
+def load(path=ROOMS_FILE):
+    """Return the rooms of the rooms file, or None when there is no file."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    return [Room(**entry) for entry in config.get("rooms", [])]
+
+
+# room used when nothing else is set (single room bot, scripts, tests)
+DEFAULT = Room(room_id=os.environ.get("ROOM_ID"))
+DEFAULT.state_file = os.environ.get("BOT_STATE_FILE", "bot_state.json")
+
+_current = contextvars.ContextVar("room", default=DEFAULT)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def use(room):
+    token = _current.set(room)
+    try:
+        yield room
+    finally:
+        _current.reset(token)
+
+
+def student_id():
+    return current().student_id
+
+
+def interface_name():
+    return current().interface_name
+
+
+def credentials():
+    return current().credentials
+
+
+def loopback_ip():
+    return current().loopback_ip
+
+
+class FairQueue:
+    """Blocking queue with one FIFO per room, served round robin.
+
+    A room that sends a burst of messages only gets one turn per round,
+    so the other rooms keep being answered.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queues = {}     # room key -> deque
+        self._order = deque()  # room keys with pending items, in turn order
+
+    def put(self, key, item):
+        with self._cond:
+            pending = self._queues.setdefault(key, deque())
+            if not pending:
+                self._order.append(key)
+            pending.append(item)
+            self._cond.notify()
+
+    def get(self):
+        """Return (key, item) of the next room in turn, waiting for one if empty."""
+        with self._cond:
+            while not self._order:
+                self._cond.wait()
+            key = self._order.popleft()
+            pending = self._queues[key]
+            item = pending.popleft()
+            if pending:
+                self._order.append(key)
+            return key, item
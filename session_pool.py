@@ -0,0 +1,137 @@
+# --------------------------------------------------------------
+# Reusable pool of long-lived device sessions keyed by router IP
+# --------------------------------------------------------------
+
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SessionPool:
+    """Keep one live session per router and hand it out again on the next call.
+
+    connect(key) opens a new session, is_alive(session) tells if it can still
+    be used and close(session) tears it down. Sessions that were not used for
+    idle_timeout seconds are closed by a background reaper.
+    """
+
+    def __init__(self, connect, is_alive, close, idle_timeout=300, name="pool"):
+        self._connect = connect
+        self._is_alive = is_alive
+        self._close = close
+        self.idle_timeout = idle_timeout
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._sessions = {}   # key -> session
+        self._last_used = {}  # key -> time.monotonic() of last checkin
+        self._key_locks = {}  # key -> RLock, one user of a session at a time
+        self._reaper = None
+        self._counters = {"hit": 0, "miss": 0, "reconnect": 0, "evicted": 0, "error": 0}
+        atexit.register(self.close_all)
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.RLock()
+            return lock
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _safe_close(self, sess):
+        try:
+            self._close(sess)
+        except Exception:
+            pass
+
+    def _checkout(self, key):
+        sess = self._sessions.get(key)
+        if sess is not None:
+            try:
+                alive = self._is_alive(sess)
+            except Exception:
+                alive = False
+            if alive:
+                self._count("hit")
+                return sess
+            # session went stale (router reload, idle kill, ...)
+            self._safe_close(sess)
+            self._count("reconnect")
+        else:
+            self._count("miss")
+        sess = self._connect(key)
+        with self._lock:
+            self._sessions[key] = sess
+        return sess
+
+    @contextmanager
+    def session(self, key):
+        """Borrow the session for key, opening or reopening it when needed."""
+        self._start_reaper()
+        with self._key_lock(key):
+            sess = self._checkout(key)
+            try:
+                yield sess
+            except Exception:
+                # do not trust a session that failed mid-call
+                self._count("error")
+                self.discard(key)
+                raise
+            finally:
+                with self._lock:
+                    self._last_used[key] = time.monotonic()
+
+    def discard(self, key):
+        with self._lock:
+            sess = self._sessions.pop(key, None)
+            self._last_used.pop(key, None)
+        if sess is not None:
+            self._safe_close(sess)
+
+    def close_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [k for k, t in self._last_used.items()
+                    if k in self._sessions and now - t > self.idle_timeout]
+        for key in idle:
+            lock = self._key_lock(key)
+            # skip sessions that are busy right now, next sweep gets them
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if now - self._last_used.get(key, now) > self.idle_timeout:
+                    self.discard(key)
+                    self._count("evicted")
+            finally:
+                lock.release()
+
+    def close_all(self):
+        with self._lock:
+            keys = list(self._sessions)
+        for key in keys:
+            self.discard(key)
+
+    def _start_reaper(self):
+        if self._reaper is not None or not self.idle_timeout:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, name=f"{self.name}-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        interval = max(1, self.idle_timeout / 4)
+        while True:
+            time.sleep(interval)
+            self.close_idle()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters["open"] = len(self._sessions)
+        return counters
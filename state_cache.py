@@ -0,0 +1,75 @@
+# --------------------------------------------------------------
+# Short-lived cache of device state shared by the device modules
+# --------------------------------------------------------------
+#
+# Keys are (router ip, item), e.g. ("10.0.15.61", "Loopback66070220") or
+# ("10.0.15.61", "motd"). Entries expire after STATE_CACHE_TTL seconds and
+# the least recently used entry is dropped when the cache is full.
+# Our own successful writes store the new state (write-through), failed
+# writes invalidate it, so "enable" followed by "status" needs no device call.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+STATE_CACHE_TTL = float(os.environ.get("STATE_CACHE_TTL", "10"))
+STATE_CACHE_SIZE = int(os.environ.get("STATE_CACHE_SIZE", "1024"))
+
+# returned by get() when there is no usable entry (None is a valid state)
+MISS = object()
+
+
+class StateCache:
+    def __init__(self, ttl=STATE_CACHE_TTL, max_entries=STATE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._counters = {"hit": 0, "miss": 0, "evicted": 0, "invalidated": 0}
+
+    def get(self, key, fresh=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if fresh or entry is None or entry[0] < time.monotonic():
+                self._counters["miss"] += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self._counters["hit"] += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evicted"] += 1
+
+    def invalidate(self, router, item=None):
+        with self._lock:
+            if item is not None:
+                keys = [(router, item)]
+            else:
+                keys = [k for k in self._entries if k[0] == router]
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._counters["invalidated"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters["size"] = len(self._entries)
+        lookups = counters["hit"] + counters["miss"]
+        counters["hit_rate"] = round(counters["hit"] / lookups, 3) if lookups else 0.0
+        return counters
+
+
+# one cache for restconf_final, netconf_final and netmiko_final
+cache = StateCache()
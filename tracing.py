@@ -0,0 +1,166 @@
+# --------------------------------------------------------------
+# Per-command tracing: spans exported as JSON lines
+# --------------------------------------------------------------
+#
+# A span times one piece of work (a bot command, a RESTCONF request, a
+# NETCONF RPC, an SSH command, a Webex call) and nests under the span that
+# was running when it started, so one command becomes one trace. With
+# TRACE_FILE set (e.g. TRACE_FILE=traces.jsonl) spans are appended to it as
+# they finish, one JSON object per line, with the field names of
+# OpenTelemetry spans (traceId, spanId, parentSpanId, name,
+# startTimeUnixNano, endTimeUnixNano, attributes, status); attributes are a
+# flat object. Past TRACE_FILE_MAX_MB the file is moved to TRACE_FILE.1 and
+# started again. Export is off by default.
+#
+# The spans under a buffered span (span(..., buffered=True)) are held until
+# it finishes, so a dropped one (drop(), e.g. a poll that found nothing)
+# leaves nothing in the file.
+#
+# The durations of the last TRACE_STATS_WINDOW "bot.command" spans per
+# router and backend are kept in memory for "/66070220 stats".
+
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+TRACE_FILE_MAX_MB = float(os.environ.get("TRACE_FILE_MAX_MB", "50"))
+TRACE_STATS_WINDOW = int(os.environ.get("TRACE_STATS_WINDOW", "200"))
+
+COMMAND_SPAN = "bot.command"
+
+_current = contextvars.ContextVar("span", default=None)
+_file = None
+_file_lock = threading.Lock()
+_recent = {}  # (router, backend) -> deque of (seconds, ok)
+_recent_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, name, parent, attributes, buffered=False):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._started = time.perf_counter()
+        self.duration = None
+        # records of finished spans waiting for the nearest buffered span around them
+        self.outer = parent.held if parent else None
+        self.held = [] if buffered else self.outer
+        self.buffered = buffered
+        self.dropped = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def drop(self):
+        """Export neither this buffered span nor the spans under it."""
+        self.dropped = True
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+@contextmanager
+def span(name, buffered=False, **attributes):
+    """Time the block as a child of the current span; exceptions mark it failed and propagate."""
+    current = Span(name, _current.get(), attributes, buffered)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current.finish()
+        export(current)
+
+
+def set_attribute(**attributes):
+    """Add attributes to the current span (nothing happens outside a span)."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def current_span():
+    return _current.get()
+
+
+def export(finished):
+    if finished.name == COMMAND_SPAN:
+        key = (finished.attributes.get("router"), finished.attributes.get("backend"))
+        ok = finished.error is None and finished.attributes.get("ok", True)
+        with _recent_lock:
+            _recent.setdefault(key, deque(maxlen=TRACE_STATS_WINDOW)).append((finished.duration, ok))
+    if not TRACE_FILE or finished.dropped:
+        return
+    if finished.buffered:
+        records, waiting = finished.held + [finished.to_dict()], finished.outer
+    else:
+        records, waiting = [finished.to_dict()], finished.held
+    if waiting is not None:
+        waiting.extend(records)
+    else:
+        write(records)
+
+
+def write(records):
+    global _file
+    lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+    with _file_lock:
+        if _file is None:
+            _file = open(TRACE_FILE, "a", buffering=1)
+        _file.write(lines)
+        if TRACE_FILE_MAX_MB and _file.tell() >= TRACE_FILE_MAX_MB * 1e6:
+            # keep one older file next to it
+            _file.close()
+            _file = None
+            os.replace(TRACE_FILE, TRACE_FILE + ".1")
+
+
+def percentile(samples, q):
+    # nearest rank
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def stats():
+    """(router, backend) -> {"n", "p50_ms", "p95_ms", "p99_ms", "errors"} of recent commands."""
+    with _recent_lock:
+        recent = {key: list(values) for key, values in _recent.items()}
+    result = {}
+    for key, values in recent.items():
+        durations = [seconds for seconds, _ in values]
+        result[key] = {
+            "n": len(values),
+            "p50_ms": round(percentile(durations, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(durations, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(durations, 0.99) * 1000, 1),
+            "errors": sum(1 for _, ok in values if not ok),
+        }
+    return result
@@ -0,0 +1,291 @@
+# --------------------------------------------------------------
+# Webex API client: pooled session, rate limit, retries, coalesced replies
+# --------------------------------------------------------------
+#
+# One WebexClient per access token. Every call waits for a token of the
+# bucket (WEBEX_RATE calls per second, bursts of WEBEX_BURST), a 429 is
+# retried after its Retry-After, 5xx and connection errors are retried with
+# jittered exponential backoff. Replies posted with post_later() go through a
+# per-room outbox: when several replies for a room are waiting they are sent
+# as one message. Files are streamed from disk with MultipartEncoder.
+
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+
+import tracing
+
+# WEBEX_API_URL points the bot at another API (e.g. fake_webex_server.py)
+WEBEX_API_URL = os.environ.get("WEBEX_API_URL", "https://webexapis.com/v1")
+MESSAGES_URL = WEBEX_API_URL + "/messages"
+
+# Webex allows a few hundred calls per minute per token, stay well below it
+WEBEX_RATE = float(os.environ.get("WEBEX_RATE", "4"))
+WEBEX_BURST = int(os.environ.get("WEBEX_BURST", "8"))
+WEBEX_MAX_RETRIES = int(os.environ.get("WEBEX_MAX_RETRIES", "5"))
+WEBEX_TIMEOUT = (5, 15)
+
+# Webex rejects messages longer than 7439 bytes
+MAX_MESSAGE_LENGTH = 7000
+
+RETRY_STATUS = [500, 502, 503, 504]
+
+
+class WebexError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """Hold every caller back for seconds (after a 429)."""
+        with self._lock:
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+def retry_delay(status_code, headers, attempt):
+    """Seconds to wait before retrying a 429/5xx reply or connection error (status_code None)."""
+    if status_code == 429:
+        try:
+            return max(float(headers.get("Retry-After", 1)), 0.0)
+        except ValueError:
+            return 1.0
+    # full jitter: 0..0.5, 0..1, 0..2, ... seconds, capped at 30
+    return random.uniform(0, min(30, 0.5 * 2 ** attempt))
+
+
+class WebexClient:
+    def __init__(self, access_token, messages_url=MESSAGES_URL, rate=WEBEX_RATE,
+                 burst=WEBEX_BURST, max_retries=WEBEX_MAX_RETRIES):
+        self.messages_url = messages_url
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": "Bearer " + access_token})
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "throttled": 0, "retries": 0, "errors": 0,
+                          "retry_wait": 0.0, "rate_wait": 0.0, "posted": 0, "coalesced": 0}
+        self._outbox = {}   # room id -> deque of texts
+        self._outbox_cond = threading.Condition()
+        self._sender = None
+        self._sending = False
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def request(self, method, url, make_body=None, **kwargs):
+        """Send one API call; returns the 2xx response or raises WebexError.
+
+        make_body() returns (data, content type) of a streamed body; it is called
+        again for each retry, a stream can only be sent once.
+        """
+        kwargs.setdefault("timeout", WEBEX_TIMEOUT)
+        with tracing.span(f"webex.{method}", path=url.split("/v1", 1)[-1].split("?", 1)[0]) as call:
+            try:
+                r = self._request(method, url, make_body, call, **kwargs)
+            except WebexError as e:
+                call.set(status_code=e.status_code)
+                raise
+            call.set(status_code=r.status_code)
+            return r
+
+    def _request(self, method, url, make_body, call, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            call.set(retries=attempt)
+            self.count("rate_wait", self.bucket.acquire())
+            self.count("calls")
+            if make_body:
+                kwargs["data"], content_type = make_body()
+                kwargs["headers"] = {"Content-Type": content_type}
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                status, headers, error = None, {}, e
+            else:
+                if r.status_code < 400:
+                    return r
+                status, headers, error = r.status_code, r.headers, None
+            if status == 429:
+                call.set(throttled=True)
+            delay = self.retry_wait(method, status, headers, error, attempt)
+            if delay is None:
+                break
+            time.sleep(delay)
+        raise self.give_up(status, error)
+
+    def retry_wait(self, method, status, headers, error, attempt):
+        """After a failed call: seconds to sleep before the next attempt, or None to give up.
+
+        Shared with async_bot.AsyncWebex. A 429 pauses the rate limit of the
+        token instead, so every caller of this client waits (the delay is 0).
+        """
+        if status is not None and status != 429 and status not in RETRY_STATUS:
+            return None
+        if attempt == self.max_retries:
+            return None
+        delay = retry_delay(status, headers, attempt)
+        self.count("retries")
+        self.count("retry_wait", delay)
+        print(f"Webex {method} {status or error}: retry {attempt + 1} in {delay:.1f} s")
+        if status == 429:
+            self.count("throttled")
+            self.bucket.pause(delay)
+            return 0.0
+        return delay
+
+    def give_up(self, status, error):
+        """The WebexError to raise once a call will not be retried."""
+        self.count("errors")
+        if status is None:
+            return WebexError(f"Webex API unreachable: {error}")
+        return WebexError(
+            "Incorrect reply from Webex Teams API. Status code: {}".format(status), status)
+
+    # messages API
+
+    def list_messages(self, room_id=None, max=50, url=None):
+        """One page of messages, newest first; url is the "next" link of the previous page."""
+        if url:
+            return self.request("GET", url)
+        return self.request("GET", self.messages_url, params={"roomId": room_id, "max": max})
+
+    def get_message(self, message_id):
+        return self.request("GET", f"{self.messages_url}/{message_id}").json()
+
+    def post_message(self, room_id, text):
+        r = self.request("POST", self.messages_url, json={"roomId": room_id, "text": text})
+        self.count("posted")
+        return r
+
+    def post_file(self, room_id, text, path, filename=None, content_type="text/plain"):
+        """Post text with a local file attached, streamed from disk."""
+        filename = filename or os.path.basename(path)
+        with open(path, "rb") as f:
+            def make_body():
+                f.seek(0)
+                encoder = MultipartEncoder(fields={
+                    "roomId": room_id,
+                    "text": text,
+                    "files": (filename, f, content_type),
+                })
+                return encoder, encoder.content_type
+            r = self.request("POST", self.messages_url, make_body=make_body)
+        self.count("posted")
+        return r
+
+    # replies
+
+    def post_later(self, room_id, text, file=None, on_posted=None):
+        """Queue a reply; text replies waiting for the same room are sent together.
+
+        file is (path, filename) of an attachment; such a reply is sent on its own.
+        on_posted() is called from the outbox thread once Webex took the reply.
+        """
+        with self._outbox_cond:
+            self._outbox.setdefault(room_id, deque()).append((text, file, on_posted))
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._send_loop, name="webex-outbox", daemon=True)
+                self._sender.start()
+            self._outbox_cond.notify()
+
+    def _next_batch(self):
+        with self._outbox_cond:
+            while not any(self._outbox.values()):
+                self._outbox_cond.wait()
+            # rooms take turns, the oldest non-empty room first
+            room_id = next(room for room, texts in self._outbox.items() if texts)
+            texts = self._outbox.pop(room_id)
+            batch = [texts.popleft()]
+            while (texts and batch[0][1] is None and texts[0][1] is None
+                   and len("\n\n".join(text for text, _, _ in batch + [texts[0]])) <= MAX_MESSAGE_LENGTH):
+                batch.append(texts.popleft())
+            if texts:
+                self._outbox[room_id] = texts
+            self._sending = True
+            return room_id, batch
+
+    def _send_loop(self):
+        while True:
+            room_id, batch = self._next_batch()
+            if len(batch) > 1:
+                self.count("coalesced", len(batch) - 1)
+            text, file, _ = batch[0]
+            try:
+                if file:
+                    self.post_file(room_id, text, *file)
+                else:
+                    self.post_message(room_id, "\n\n".join(text for text, _, _ in batch))
+            except (WebexError, OSError) as e:
+                print(f"Error posting reply: {e}")
+            else:
+                for _, _, on_posted in batch:
+                    if on_posted is not None:
+                        try:
+                            on_posted()
+                        except Exception as e:
+                            print(f"Error after posting reply: {e}")
+            with self._outbox_cond:
+                self._sending = False
+
+    def flush(self, timeout=10):
+        """Wait until the outbox is empty (or timeout)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._outbox_cond:
+                if not self._sending and not any(self._outbox.values()):
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["retry_wait"] = round(stats["retry_wait"], 2)
+        stats["rate_wait"] = round(stats["rate_wait"], 2)
+        return stats
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(access_token):
+    """The shared client of an access token (one session and rate limit per token)."""
+    with _clients_lock:
+        if access_token not in _clients:
+            _clients[access_token] = WebexClient(access_token)
+        return _clients[access_token]
@@ -0,0 +1,136 @@
+# --------------------------------------------------------------
+# Webex webhook receiver (messages.created) and a local stand-in sender
+# --------------------------------------------------------------
+#
+# Run as a script to fire a fake messages.created event at a running bot:
+#   python webex_webhook.py http://127.0.0.1:8080/ <message id> [room id]
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+WEBHOOKS_URL = "https://webexapis.com/v1/webhooks"
+
+
+def sign(body, secret):
+    # Webex signs the raw body with HMAC-SHA1 in the X-Spark-Signature header
+    return hmac.new(secret.encode(), body, hashlib.sha1).hexdigest()
+
+
+def parse_event(body, room_id=None):
+    """Return (message ID, room ID) of a messages.created event, or None to ignore it.
+
+    room_id is one room ID or a collection of them; events of other rooms are ignored.
+    """
+    try:
+        event = json.loads(body)
+    except ValueError:
+        return None
+    if event.get("resource") != "messages" or event.get("event") != "created":
+        return None
+    data = event.get("data") or {}
+    if isinstance(room_id, str):
+        room_id = {room_id}
+    if room_id and data.get("roomId") not in room_id:
+        return None
+    if not data.get("id"):
+        return None
+    return data["id"], data.get("roomId")
+
+
+def make_handler(on_message, room_id=None, secret=None):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if secret:
+                signature = self.headers.get("X-Spark-Signature", "")
+                if not hmac.compare_digest(signature, sign(body, secret)):
+                    self.send_response(403)
+                    self.end_headers()
+                    return
+            event = parse_event(body, room_id)
+            # answer right away, Webex retries webhooks that are slow to respond
+            self.send_response(200)
+            self.end_headers()
+            if event:
+                on_message(*event)
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+
+def is_loopback(host):
+    """True when only this machine can reach a server listening on host."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def start_server(host, port, on_message, room_id=None, secret=None):
+    """Serve webhooks in a background thread; on_message(message_id, room_id) is called per event."""
+    server = ThreadingHTTPServer((host, port), make_handler(on_message, room_id, secret))
+    threading.Thread(target=server.serve_forever, name="webex-webhook", daemon=True).start()
+    return server
+
+
+def register_webhook(access_token, target_url, room_id, secret=None, name="ipa2025-bot"):
+    headers = {"Authorization": "Bearer " + access_token}
+    r = requests.get(WEBHOOKS_URL, headers=headers, timeout=10)
+    r.raise_for_status()
+    for hook in r.json().get("items", []):
+        if hook.get("name") == name:
+            requests.delete(f"{WEBHOOKS_URL}/{hook['id']}", headers=headers, timeout=10)
+
+    webhook = {
+        "name": name,
+        "targetUrl": target_url,
+        "resource": "messages",
+        "event": "created",
+        "filter": f"roomId={room_id}",
+    }
+    if secret:
+        webhook["secret"] = secret
+    r = requests.post(WEBHOOKS_URL, json=webhook, headers=headers, timeout=10)
+    r.raise_for_status()
+    return r.json()
+
+
+# --------------------------------------------------------------
+# Local stand-in for the Webex webhook sender
+# --------------------------------------------------------------
+
+def send_fake_event(url, message_id, room_id=None, secret=None):
+    event = {
+        "id": "fake-webhook",
+        "name": "ipa2025-bot",
+        "resource": "messages",
+        "event": "created",
+        "data": {"id": message_id, "roomId": room_id},
+    }
+    body = json.dumps(event).encode()
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Spark-Signature"] = sign(body, secret)
+    return requests.post(url, data=body, headers=headers, timeout=10)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python webex_webhook.py <receiver url> <message id> [room id]")
+        sys.exit(1)
+    room = sys.argv[3] if len(sys.argv) > 3 else None
+    resp = send_fake_event(sys.argv[1], sys.argv[2], room, os.environ.get("WEBHOOK_SECRET"))
+    print(resp.status_code)